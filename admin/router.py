@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+import executors
+from auth.router import get_admin_user
+from profiling import request_profiler
+from . import schemas
+
+# every route requires an admin (ADMIN_USERS)
+router = APIRouter(dependencies=[Depends(get_admin_user)])
+
+@router.get("/profiling", tags=["admin"])
+async def get_profiling() -> dict:
+  # this worker's sampling settings and profiled/saved/refused counts
+  return request_profiler.stats()
+
+@router.put("/profiling", tags=["admin"])
+async def update_profiling(update: schemas.ProfilingSettings) -> dict:
+  # change this worker's sampling (the X-Profile header works regardless); the environment settings apply again on restart
+  request_profiler.configure(update.sample_rate, update.sample_paths)
+  return request_profiler.stats()
+
+@router.get("/profiles", response_model=list[schemas.ProfileSummary], tags=["admin"])
+async def list_profiles(limit: int = Query(50, ge=1, le=500)) -> list[schemas.ProfileSummary]:
+  # latest request profiles of every worker, newest first
+  return await executors.run_io(request_profiler.reports, limit)
+
+@router.get("/profiles/{profile_id}", tags=["admin"])
+async def get_profile(profile_id: str) -> dict:
+  # wall/CPU time per thread pool and the functions taking most of the samples
+  report = await executors.run_io(request_profiler.report, profile_id)
+  if report is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+  return report
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse, tags=["admin"])
+async def get_profile_stacks(profile_id: str) -> PlainTextResponse:
+  # collapsed stacks ("frame;frame;frame samples" per line): flamegraph.pl, speedscope, ...
+  stacks = await executors.run_io(request_profiler.folded, profile_id)
+  if stacks is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+  return PlainTextResponse(stacks)
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+
+class ProfilingSettings(BaseModel):
+  sample_rate: float | None = Field(None, ge=0, le=1) # fraction of the requests under sample_paths profiled unasked
+  sample_paths: list[str] | None = None # path prefixes the sampling applies to
+
+class ProfileSummary(BaseModel):
+  id: str
+  method: str
+  path: str
+  query: str
+  status: int | None
+  trigger: str # "header" (X-Profile from an admin) or "sample"
+  started_at: str
+  wall_seconds: float
+  cpu_seconds: float
+  samples: int
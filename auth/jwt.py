@@ -1,35 +1,49 @@
 from datetime import datetime, timedelta, timezone 
 from jose import JWTError, jwt
 from . import schema
+from .revocation import revocations
+import executors
 import settings
 import secrets
-
-BLACKLIST = set()
+import hashlib
 
 # jwt is based64 encoded. anyone can decode the token and use its data. But only the server can verify it's authenticity using the JWT_SECRET
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
-  to_encode = data.copy() # data={"sub": user.email}
+  to_encode = data.copy() # data={"sub": user.email, "uid": user.id, "act": user.is_active}
   if expires_delta:
     expire = datetime.now(timezone.utc) + expires_delta
   else:
     expire = datetime.now(timezone.utc) + timedelta(minutes=float(settings.ACCESS_TOKEN_EXPIRE_MINUTES))
-  to_encode.update({"exp":expire}) # to_encode={"sub": user.email, "exp": expire}
+  to_encode.update({"exp":expire, "jti": secrets.token_urlsafe(12)}) # jti: the id a revocation is stored under
   encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
   return encoded_jwt
 
-def revoke_token(token: str):
-  BLACKLIST.add(token)
+def token_id(token: str, payload: dict) -> str:
+  # tokens issued before the jti claim are revoked under a digest of the token itself
+  return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()[:32]
+
+async def revoke_token(token: str):
+  ''' Revoke an access token until it expires, in every worker (see revocation.RevocationStore) '''
+  try:
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+  except JWTError: # invalid or already expired: nothing to revoke
+    return
+  await executors.run_io(revocations.revoke, token_id(token, payload), payload["exp"]) # Redis SET + PUBLISH
 
-def decode_access_token(token: str) -> schema.TokenData | None:
-  if (token not in BLACKLIST):
-    try:
-      payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-      username = payload.get("sub")
-      token_data = schema.TokenData(username=username)
-    except JWTError: # when will this be triggered??
-      return None
-    return token_data
-  return None
+async def decode_access_token(token: str) -> schema.TokenData | None:
+  try:
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]) # verifies the signature and exp
+  except JWTError: # bad signature, malformed or expired token
+    return None
+  jti = token_id(token, payload)
+  revoked = revocations.check(jti, payload["exp"]) # local filters: answers almost every check without I/O
+  if revoked is None: # a filter hit, settled in Redis off the event loop
+    revoked = await executors.run_io(revocations.confirm, jti)
+  if revoked:
+    return None
+  username = payload.get("sub")
+  # uid/act are signed with the rest of the token: get_current_user resolves the user without a lookup by email
+  return schema.TokenData(username=username, user_id=payload.get("uid"), is_active=payload.get("act"))
 
 def create_token():
   ''' Return a random URL-safe text string, in Base64 encoding'''
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey
 from sqlalchemy.orm import relationship 
 
 from database import Base 
@@ -11,4 +11,11 @@ class User(Base):
   hashed_password = Column(String)
   is_active = Column(Boolean, default=True)
 
-  positions = relationship("Position", back_populates="owner")
\ No newline at end of file
+  positions = relationship("Position", back_populates="owner")
+
+class RefreshToken(Base):
+  __tablename__ = "refresh_tokens" # fallback store of refresh tokens issued while Redis is unavailable
+
+  token_hash = Column(String, primary_key=True) # sha256 of the token: a database leak gives no usable tokens
+  user_id = Column(Integer, ForeignKey("users.id"))
+  expires_at = Column(DateTime(timezone=True), index=True) # the sweeper deletes expired rows by range
@@ -0,0 +1,27 @@
+from passlib.context import CryptContext
+import settings
+
+# Password hashing, run on the hash process pool (executors.run_hash) so bcrypt never blocks the event loop.
+# Module-level functions only: they are pickled by reference and this module is imported again in each worker.
+# Hashes made at any other cost than BCRYPT_ROUNDS are reported for an update (rehash-on-login), up or down.
+pwd_context = CryptContext(
+  schemes=["bcrypt"],
+  deprecated="auto",
+  bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+  bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+  bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+def hash_password(password: str) -> str:
+  return pwd_context.hash(password)
+
+def verify_password(password: str, hashed_password: str | None) -> tuple[bool, str | None]:
+  """
+  Check `password` against a stored hash. Returns (verified, new hash): the new hash is set when the password
+  matched a hash of another cost and should replace it. Without a stored hash (unknown user) a dummy hash is
+  checked instead, so the response takes as long as for a wrong password.
+  """
+  if not hashed_password:
+    pwd_context.dummy_verify()
+    return False, None
+  return pwd_context.verify_and_update(password, hashed_password)
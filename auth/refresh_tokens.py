@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import re
+import secrets
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import redis
+from . import repository
+from database import SessionLocal
+from redis_client import health as redis_health
+import settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_PREFIX = "refresh:"
+# the shape of issued tokens (secrets.token_urlsafe(32)); anything else is refused before either store is read
+TOKEN_FORMAT = re.compile(r"[A-Za-z0-9_-]{43}")
+
+# Consume the presented token and store its successor in one round trip, so a token is used at most once even when
+# two workers receive it at the same time.
+# KEYS: presented token's key, the new token's key; ARGV: seconds the new token lives.
+ROTATE_SCRIPT = """
+local user_id = redis.call('GETDEL', KEYS[1])
+if not user_id then return false end
+redis.call('SET', KEYS[2], user_id, 'EX', ARGV[1])
+return user_id
+"""
+
+def token_hash(token: str) -> str:
+  # tokens are stored (Redis and database) under their digest only
+  return hashlib.sha256(token.encode()).hexdigest()
+
+class RefreshTokenStore:
+  """
+  Single-use refresh tokens, in Redis while it is available and in the refresh_tokens table otherwise.
+  - issue: `refresh:<sha256>` -> user id with the cookie's max age, or a row with the same expiry when Redis is down.
+  - rotate: a Lua script consumes the token and stores its successor in one round trip; a token Redis does not
+    know may have been issued during an outage, so it is then looked up (and consumed) in the table.
+  Only `refresh:<sha256>` keys are ever read or deleted: the client's cookie never names a Redis key itself.
+  Redis bounds itself with key expiry; a background sweeper deletes expired rows, in batches, through the index on
+  expires_at every REFRESH_TOKEN_SWEEP_INTERVAL seconds.
+  """
+  def __init__(self, sweep_interval: float = 300):
+    self.sweep_interval = sweep_interval
+    self._rotate_script = None
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self._stats = {"issued": 0, "fallback_issued": 0, "rotated": 0, "fallback_rotated": 0, "rejected": 0, "revoked": 0, "swept": 0, "redis_errors": 0}
+
+  def _count(self, counter: str, amount: int = 1):
+    with self._lock:
+      self._stats[counter] += amount
+
+  def stats(self) -> dict[str, int]:
+    with self._lock:
+      return dict(self._stats)
+
+  def _redis_failed(self, error: Exception, action: str):
+    self._count("redis_errors")
+    redis_health.record_failure(error)
+    logger.warning("refresh tokens: could not %s in redis, using the database: %s", action, error)
+
+  def _store(self, token: str, user_id: int, max_age: int, redis_client: redis.Redis | None):
+    if redis_client is not None:
+      try:
+        redis_client.set(f"{REFRESH_PREFIX}{token_hash(token)}", user_id, ex=max_age)
+        self._count("issued")
+        return
+      except redis.exceptions.RedisError as e:
+        self._redis_failed(e, "store a token")
+    with SessionLocal() as db:
+      repository.create_refresh_token(db, token_hash(token), user_id, datetime.now(ZoneInfo("UTC")) + timedelta(seconds=max_age))
+    self._count("fallback_issued")
+
+  def issue(self, user_id: int, max_age: int, redis_client: redis.Redis | None = None) -> str:
+    """ A new refresh token for `user_id`, valid for `max_age` seconds. """
+    token = secrets.token_urlsafe(32)
+    self._store(token, user_id, max_age, redis_client)
+    return token
+
+  def rotate(self, token: str, max_age: int, redis_client: redis.Redis | None = None) -> tuple[int, str] | None:
+    """
+    Consume `token` and issue its successor. Returns (user id, new token), or None when the token is unknown,
+    expired or was already used.
+    Args:
+      token: refresh token presented by the client.
+      max_age: seconds the new token is valid.
+      redis_client: optional Redis client; without it only the database store is used.
+    """
+    if not token or not TOKEN_FORMAT.fullmatch(token):
+      self._count("rejected")
+      return None
+    new_token = secrets.token_urlsafe(32)
+    if redis_client is not None:
+      try:
+        if self._rotate_script is None:
+          self._rotate_script = redis_client.register_script(ROTATE_SCRIPT)
+        keys = [f"{REFRESH_PREFIX}{token_hash(token)}", f"{REFRESH_PREFIX}{token_hash(new_token)}"]
+        user_id = self._rotate_script(keys=keys, args=[max_age], client=redis_client)
+        if user_id is not None:
+          try:
+            user_id = int(user_id)
+          except ValueError: # not a value this store wrote: treat the token as invalid
+            redis_client.delete(keys[1])
+            self._count("rejected")
+            return None
+          self._count("rotated")
+          return user_id, new_token
+      except redis.exceptions.RedisError as e:
+        self._redis_failed(e, "rotate a token")
+        redis_client = None
+    with SessionLocal() as db:
+      user_id = repository.pop_refresh_token(db, token_hash(token), datetime.now(ZoneInfo("UTC")))
+    if user_id is None:
+      self._count("rejected")
+      return None
+    self._count("fallback_rotated")
+    self._store(new_token, user_id, max_age, redis_client)
+    return user_id, new_token
+
+  def revoke(self, token: str, redis_client: redis.Redis | None = None):
+    """ Invalidate `token` in both stores (logout). """
+    if not token or not TOKEN_FORMAT.fullmatch(token):
+      return
+    if redis_client is not None:
+      try:
+        redis_client.delete(f"{REFRESH_PREFIX}{token_hash(token)}")
+      except redis.exceptions.RedisError as e:
+        self._redis_failed(e, "revoke a token")
+    with SessionLocal() as db:
+      repository.delete_refresh_token(db, token_hash(token))
+    self._count("revoked")
+
+  def sweep(self, now: datetime | None = None, batch_size: int = 1000) -> int:
+    """ Delete the expired rows of the database store, `batch_size` per transaction; returns how many. """
+    now = now or datetime.now(ZoneInfo("UTC"))
+    swept = 0
+    with SessionLocal() as db:
+      while True:
+        deleted = repository.delete_expired_refresh_tokens(db, now, batch_size)
+        swept += deleted
+        if deleted < batch_size:
+          break
+    self._count("swept", swept)
+    return swept
+
+  def start(self):
+    """ Start the background sweeper (once). """
+    if self._thread is not None and self._thread.is_alive():
+      return
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run, name="refresh-token-sweeper", daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+
+  def _run(self):
+    while not self._stop.wait(self.sweep_interval):
+      try:
+        self.sweep()
+      except Exception as e:
+        logger.warning("refresh tokens: sweep failed: %s", e)
+
+refresh_tokens = RefreshTokenStore(sweep_interval=settings.REFRESH_TOKEN_SWEEP_INTERVAL)
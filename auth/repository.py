@@ -1,3 +1,5 @@
+from datetime import datetime
+from sqlalchemy import delete
 from sqlalchemy.orm import Session 
 from . import models # database models
 
@@ -32,3 +34,32 @@ def delete_user(db: Session, user: models.User) -> None:
   db.delete(user)
   db.commit()
 
+
+# update
+def update_password_hash(db: Session, user_id: int, hashed_password: str) -> None:
+  db.query(models.User).filter(models.User.id == user_id).update({models.User.hashed_password: hashed_password})
+  db.commit()
+
+# create
+def create_refresh_token(db: Session, token_hash: str, user_id: int, expires_at: datetime) -> None:
+  db.add(models.RefreshToken(token_hash=token_hash, user_id=user_id, expires_at=expires_at))
+  db.commit()
+
+# delete: consume an unexpired refresh token and return its user id, in one statement (single use even across workers)
+def pop_refresh_token(db: Session, token_hash: str, now: datetime) -> int | None:
+  statement = delete(models.RefreshToken).where(models.RefreshToken.token_hash == token_hash, models.RefreshToken.expires_at > now)
+  user_id = db.execute(statement.returning(models.RefreshToken.user_id)).scalar()
+  db.commit()
+  return user_id
+
+# delete
+def delete_refresh_token(db: Session, token_hash: str) -> None:
+  db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == token_hash).delete()
+  db.commit()
+
+# delete: expired refresh tokens, at most `limit` per call (range scan of ix_refresh_tokens_expires_at)
+def delete_expired_refresh_tokens(db: Session, now: datetime, limit: int = 1000) -> int:
+  expired = db.query(models.RefreshToken.token_hash).filter(models.RefreshToken.expires_at <= now).limit(limit)
+  deleted = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash.in_(expired.scalar_subquery())).delete(synchronize_session=False)
+  db.commit()
+  return deleted
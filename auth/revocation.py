@@ -0,0 +1,224 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+import redis
+from redis_client import get_client, health as redis_health, subscriber_client
+import settings
+
+logger = logging.getLogger(__name__)
+
+REVOKED_PREFIX = "revoked:"
+REVOCATION_CHANNEL = "auth:revoked"
+
+class BloomFilter:
+  """ Fixed-size Bloom filter over strings: no false negatives, false positives at about `error_rate` up to `capacity` entries. """
+  def __init__(self, capacity: int, error_rate: float):
+    self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2)) # bits
+    self.hashes = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+    self.count = 0
+
+  def _positions(self, item: str):
+    digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+    return ((first + i * second) % self.size for i in range(self.hashes)) # double hashing
+
+  def add(self, item: str):
+    for position in self._positions(item):
+      self.bits[position >> 3] |= 1 << (position & 7)
+    self.count += 1
+
+  def __contains__(self, item: str) -> bool:
+    return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationStore:
+  """
+  Revoked access tokens, shared by every worker through Redis and fronted by local Bloom filters.
+  - revoke: `revoked:<jti>` is set in Redis until the token's own expiry, and announced on a pub/sub channel so
+    every worker adds it to its filters.
+  - is_revoked: a filter miss (almost every check) is answered locally; a hit is confirmed with one Redis EXISTS,
+    which also weeds out the filter's false positives.
+  The filters are bucketed by token expiry (REVOCATION_BUCKET_SECONDS): once every token a bucket can hold has
+  expired the whole bucket is dropped, so memory follows the number of live revoked tokens, not the logout history.
+  Without Redis, revocations are kept in a local dict pruned the same way; a filter hit that neither the dict nor
+  Redis can settle refuses the token (fail closed).
+  """
+  def __init__(self, bucket_seconds: int = 300, capacity: int = 20000, error_rate: float = 0.001):
+    self.bucket_seconds = bucket_seconds
+    self.capacity = capacity
+    self.error_rate = error_rate
+    self.origin = uuid.uuid4().hex # lets a worker ignore its own announcements
+    self._buckets: dict[int, BloomFilter] = {} # expiry bucket -> filter
+    self._local: dict[str, float] = {} # jti -> exp, revocations Redis could not take
+    self._lock = threading.Lock()
+    self._pruned_at = 0.0
+    self._listener = None
+    self._stats = {"revoked": 0, "checks": 0, "filter_misses": 0, "filter_hits": 0, "confirmed": 0, "false_positives": 0, "redis_errors": 0}
+
+  def _count(self, counter: str):
+    with self._lock:
+      self._stats[counter] += 1
+
+  def stats(self) -> dict:
+    with self._lock:
+      stats = dict(self._stats)
+      stats["buckets"] = len(self._buckets)
+      stats["filter_entries"] = sum(bloom.count for bloom in self._buckets.values())
+      stats["filter_bytes"] = sum(len(bloom.bits) for bloom in self._buckets.values())
+      stats["local_entries"] = len(self._local)
+    return stats
+
+  def prune(self, now: float | None = None):
+    """ Drop the buckets (and local entries) whose tokens have all expired. """
+    now = now if now is not None else time.time()
+    with self._lock:
+      self._pruned_at = now
+      for bucket in [bucket for bucket in self._buckets if (bucket + 1) * self.bucket_seconds <= now]:
+        del self._buckets[bucket]
+      for jti in [jti for jti, exp in self._local.items() if exp <= now]:
+        del self._local[jti]
+
+  def _remember(self, jti: str, exp: float, now: float):
+    if exp <= now:
+      return
+    if now - self._pruned_at >= self.bucket_seconds:
+      self.prune(now)
+    with self._lock:
+      bucket = int(exp // self.bucket_seconds)
+      bloom = self._buckets.get(bucket)
+      if bloom is None:
+        bloom = self._buckets[bucket] = BloomFilter(self.capacity, self.error_rate)
+      bloom.add(jti)
+
+  def revoke(self, jti: str, exp: float, redis_client: redis.Redis | None = None, now: float | None = None):
+    """
+    Revoke the token `jti` until its expiry `exp` (epoch seconds).
+    Args:
+      jti: token id (jti claim).
+      exp: the token's exp claim; the revocation is forgotten after it, when the token is refused anyway.
+      redis_client: Redis client of the shared store (the app's shared client by default).
+      now: current epoch seconds (tests and benchmarks).
+    """
+    now = now if now is not None else time.time()
+    if exp <= now:
+      return
+    self._remember(jti, exp, now)
+    self._count("revoked")
+    redis_client = redis_client if redis_client is not None else get_client()
+    if redis_client is not None:
+      try:
+        self.listen(redis_client)
+        with redis_client.pipeline(transaction=False) as pipe:
+          pipe.set(f"{REVOKED_PREFIX}{jti}", int(exp), exat=math.ceil(exp))
+          pipe.publish(REVOCATION_CHANNEL, f"{self.origin}|{jti}|{exp}")
+          pipe.execute()
+        return
+      except redis.exceptions.RedisError as e:
+        self._count("redis_errors")
+        redis_health.record_failure(e)
+        logger.warning("revocation: could not store %s in redis: %s", jti, e)
+    with self._lock:
+      self._local[jti] = exp
+
+  def is_revoked(self, jti: str, exp: float, redis_client: redis.Redis | None = None) -> bool:
+    """ Whether the (otherwise valid) token `jti` expiring at `exp` was revoked; no network unless the filter matches. """
+    revoked = self.check(jti, exp)
+    return revoked if revoked is not None else self.confirm(jti, redis_client)
+
+  def check(self, jti: str, exp: float) -> bool | None:
+    """
+    The local part of is_revoked, safe on the event loop: False on a filter miss, True for a revocation this
+    worker holds, None when a filter hit has to be settled in Redis (confirm).
+    """
+    self._count("checks")
+    with self._lock:
+      bloom = self._buckets.get(int(exp // self.bucket_seconds))
+      matched = bloom is not None and jti in bloom
+      local = jti in self._local
+    if not matched:
+      self._count("filter_misses")
+      return False
+    self._count("filter_hits")
+    if local:
+      self._count("confirmed")
+      return True
+    return None
+
+  def confirm(self, jti: str, redis_client: redis.Redis | None = None) -> bool:
+    """ Settle a filter hit with one Redis EXISTS (blocking: run it on the io pool from async code). """
+    redis_client = redis_client if redis_client is not None else get_client()
+    if redis_client is None:
+      # Redis never seen: every revocation went through this worker's local dict, so this is a false positive.
+      # Otherwise another worker may have announced it: refuse the token rather than guess
+      revoked = self._listener is not None
+    else:
+      try:
+        revoked = bool(redis_client.exists(f"{REVOKED_PREFIX}{jti}"))
+      except redis.exceptions.RedisError as e:
+        self._count("redis_errors")
+        redis_health.record_failure(e)
+        logger.warning("revocation: could not check %s in redis: %s", jti, e)
+        revoked = True
+    self._count("confirmed" if revoked else "false_positives")
+    return revoked
+
+  def listen(self, redis_client: redis.Redis):
+    """ Start (once) the background subscriber adding other workers' revocations to the local filters. """
+    if self._listener is not None:
+      return
+    with self._lock:
+      if self._listener is not None:
+        return
+      self._listener = threading.Thread(target=self._listen, args=(redis_client,), name="token-revocations", daemon=True)
+    self._listener.start()
+
+  def _load(self, redis_client: redis.Redis):
+    # (re)subscribed: announcements may have been missed, so fill the filters from the live revocations in Redis
+    now = time.time()
+    keys = []
+    for key in redis_client.scan_iter(match=f"{REVOKED_PREFIX}*", count=1000):
+      keys.append(key)
+      if len(keys) == 1000:
+        self._load_keys(redis_client, keys, now)
+        keys = []
+    if keys:
+      self._load_keys(redis_client, keys, now)
+
+  def _load_keys(self, redis_client: redis.Redis, keys: list, now: float):
+    for key, exp in zip(keys, redis_client.mget(keys)):
+      if exp is not None:
+        key = key.decode() if isinstance(key, bytes) else key
+        self._remember(key[len(REVOKED_PREFIX):], float(exp), now)
+
+  def _listen(self, redis_client: redis.Redis):
+    subscriber = subscriber_client(redis_client) # no read timeout: an idle channel is not a disconnect
+    subscribed = False
+    while True:
+      pubsub = subscriber.pubsub(ignore_subscribe_messages=True)
+      try:
+        pubsub.subscribe(REVOCATION_CHANNEL)
+        self._load(redis_client) # at start and after a reconnect only
+        subscribed = True
+        while True:
+          message = pubsub.get_message(timeout=settings.REDIS_HEALTH_INTERVAL) # None while idle, polling sends the health-check PING
+          if message is None:
+            continue
+          data = message["data"].decode() if isinstance(message["data"], bytes) else str(message["data"])
+          origin, _, announced = data.partition("|")
+          jti, _, exp = announced.rpartition("|")
+          if origin != self.origin and jti:
+            self._remember(jti, float(exp), time.time())
+      except redis.exceptions.RedisError as e:
+        if subscribed: # quiet while Redis stays unreachable, like the cache's subscriber
+          logger.warning("revocation: subscriber disconnected: %s", e)
+        pubsub.close()
+        time.sleep(5)
+
+revocations = RevocationStore(
+  bucket_seconds=settings.REVOCATION_BUCKET_SECONDS,
+  capacity=settings.REVOCATION_BLOOM_CAPACITY,
+  error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+)
@@ -3,14 +3,24 @@ from fastapi import APIRouter, Response, Depends, HTTPException, status, Cookie,
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Annotated
 import settings
-from database import get_db 
+from database import get_db
 from sqlalchemy.orm import Session 
-from . import jwt, service, schema
+from . import jwt, service, schema, passwords
+from .refresh_tokens import refresh_tokens
+import executors
+from cache import cache
 import redis
 from redis_client import get_redis_client 
 
 router = APIRouter() # need to import this to main.py
-refresh_tokens_store = {}  # {refresh_token: user_id} -- in-memory store for refresh tokens when Redis is not available
+
+def password_hashing_busy() -> HTTPException:
+  # every hash worker is booked: reject now rather than let the login wait out its client's timeout
+  return HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many sign-ins in progress, please retry shortly.",
+    headers={"Retry-After": "1"},
+  )
 
 def set_csrf_token_cookie(response: Response, csrf_token: str, max_age: int=7 * 24 * 60 * 60):
   if not csrf_token:
@@ -26,21 +36,12 @@ def set_csrf_token_cookie(response: Response, csrf_token: str, max_age: int=7 *
     samesite="none"
   )
 
-def set_refresh_token_cookie(user, response: Response, refresh_token: str, redis_client: redis.Redis = None, max_age: int=7 * 24 * 60 * 60):
-  if not refresh_token:
-    refresh_token = jwt.create_token()
-    try:
-      if (redis_client is not None and redis_client.ping()):
-        # cache the data in Redis with key: refersh_token to the value as user_id, max_age expiration, nx = True to overwrite the existing cache if exists
-        redis_client.set(refresh_token, user.id, ex=max_age, nx=True)
-    except redis.exceptions.ConnectionError as e:
-      refresh_tokens_store[refresh_token] = user.id  # Store the refresh token in memory (or use a more persistent store like Redis)
-      print("error: Could not connect to Redis: ", e)
-
+def set_refresh_token_cookie(response: Response, refresh_token: str, max_age: int=settings.REFRESH_TOKEN_MAX_AGE):
+  # the token itself is issued/rotated by refresh_tokens (Redis, or the refresh_tokens table while Redis is down)
   response.set_cookie(
     key="refresh_token",
     value=refresh_token,
-    max_age=max_age,  # default: 7 days
+    max_age=max_age,  # default: REFRESH_TOKEN_MAX_AGE (7 days)
     path="/",  # Set the path to root so it is sent with every request
     secure=settings.COOKIE_SECURE,
     httponly=True,
@@ -50,7 +51,11 @@ def set_refresh_token_cookie(user, response: Response, refresh_token: str, redis
 @router.post("/register", tags=["users"], include_in_schema=False)
 async def register_user(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session=Depends(get_db)):  
   try:
-    service.create_user(db, form_data.username, form_data.password)
+    hashed_password = await executors.run_hash(passwords.hash_password, form_data.password)
+  except executors.Overloaded:
+    raise password_hashing_busy()
+  try:
+    await executors.run_io(service.create_user, db, form_data.username, hashed_password)
     return {"message": "User registered successfully."}
   except service.EmailAlreadyRegisteredError:
     raise HTTPException(
@@ -67,7 +72,10 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], resp
   if the username and password are correct, return the access token
   if the username and password are incorrect, raise an exception
   '''
-  user = service.authenticate_user(db, form_data.username, form_data.password)
+  try:
+    user = await service.authenticate_user(db, form_data.username, form_data.password)
+  except executors.Overloaded:
+    raise password_hashing_busy()
   if not user:
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,12 +84,13 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], resp
     )
   
   # create access token with sub as user email and expire in 15 mins
-  access_token = jwt.create_access_token(data={"sub": user.email})
+  access_token = jwt.create_access_token(data={"sub": user.email, "uid": user.id, "act": user.is_active})
 
   # Set the new csrf token as a NonHttpOnly, Secure cookie in the response
   set_csrf_token_cookie(response,"")
   # Set the new refresh token as an HttpOnly, Secure cookie in the response
-  set_refresh_token_cookie(user, response, "", redis_client)
+  new_refresh_token = await executors.run_io(refresh_tokens.issue, user.id, settings.REFRESH_TOKEN_MAX_AGE, redis_client)
+  set_refresh_token_cookie(response, new_refresh_token)
   # return access token and token type
   return schema.Token(access_token=access_token, token_type="bearer") # return token
 
@@ -103,40 +112,29 @@ async def refresh_token(
       detail="CSRF token mismatch"
     )
   
-  # fall back to in-memory store for refresh tokens, otherwise redis 
-  user_id = refresh_tokens_store.get(refresh_token)
-  try:
-    if (redis_client.ping()):
-      user_id = redis_client.get(refresh_token)
-  except redis.exceptions.ConnectionError as e:
-    print("error: Could not connect to Redis: ", e)
-
-  if not user_id:
+  # consume the refresh token and issue its successor in one step (a replayed token finds nothing)
+  rotated = await executors.run_io(refresh_tokens.rotate, refresh_token, settings.REFRESH_TOKEN_MAX_AGE, redis_client)
+  if not rotated:
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED,
       detail="Invalid refresh token."
     )
-  
-  user = service.get_user(db, user_id)
-  if not user:
+  user_id, new_refresh_token = rotated
+
+  user = await executors.run_io(service.load_user, schema.TokenData(user_id=user_id), redis_client)
+  if not user or not user.is_active:
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED,
       detail="User not found with the provided refresh token."
     )
   
   #scopes = ["read", "write", "admin"] if user.role == "super_admin" else ["read"]
-  access_token = jwt.create_access_token(data={"sub": user.email}) 
+  access_token = jwt.create_access_token(data={"sub": user.email, "uid": user.id, "act": user.is_active}) 
 
   # Set the new csrf token as a NonHttpOnly, Secure cookie
   set_csrf_token_cookie(response, "")
   # Set the new refresh token as an HttpOnly, Secure cookie
-  del refresh_tokens_store[refresh_token]
-  try:
-    if (redis_client.ping()):
-      redis_client.delete(refresh_token)
-  except redis.exceptions.ConnectionError as e:
-    print("error: Could not connect to Redis: ", e)
-  set_refresh_token_cookie(user, response, "", redis_client)
+  set_refresh_token_cookie(response, new_refresh_token)
   # return access token and token type
   return schema.Token(access_token=access_token, token_type="bearer") 
 
@@ -150,7 +148,7 @@ async def logout(
   csrf_cookie: str = Cookie(None, alias="csrf_token"),
   csrf_header: str = Header(None, alias="X-CSRF-TOKEN")):
   # revoke the token access (it will expire by default in 15 mins anyway)
-  token_data=jwt.decode_access_token(token)
+  token_data=await jwt.decode_access_token(token)
   if token_data is None:
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED,
@@ -158,9 +156,10 @@ async def logout(
       headers={"WWW-Authenticate": "Bearer"},
     )
   
-  jwt.revoke_token(token)
-  # Expire the refresh token cookie
-  set_refresh_token_cookie(None, response, refresh_token, redis_client, max_age=0)
+  await jwt.revoke_token(token)
+  # Revoke the refresh token and expire its cookie
+  await executors.run_io(refresh_tokens.revoke, refresh_token, redis_client)
+  set_refresh_token_cookie(response, refresh_token or "", max_age=0)
   # Expire the csrf token cookie
   set_csrf_token_cookie(response, csrf_cookie, max_age=0)
 
@@ -182,25 +181,50 @@ Authorization: Bearer <token>
 # this function will be called for authorization, similar to @app.get("/protected")
 # but this is faciliated with FastAPI, Depends(get_current_user)
 @router.post("/get_user_id", response_model=schema.UserId, tags=["users"], include_in_schema=False)
-async def get_current_user(token: Annotated[str, Depends(service.oauth2_scheme)], db: Session=Depends(get_db)):
+async def get_current_user(token: Annotated[str, Depends(service.oauth2_scheme)], redis_client: redis.Redis = Depends(get_redis_client)):
   # print(f"Token received for get_current_user: {token}")
   try:
-    token_data=jwt.decode_access_token(token)
+    service.count("requests")
+    token_data=await jwt.decode_access_token(token)
     if token_data is None:
+      service.count("rejected")
       raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
       )
-    
-    # get the client_id from the token sub data if authorization is successful
-    user = service.get_user_by_email(db, email=token_data.username)
+    service.count("claims_tokens" if token_data.user_id is not None else "legacy_tokens")
+    if token_data.is_active is False: # deactivated when the token was issued
+      service.count("rejected")
+      raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
+
+    # the user id comes from the signed uid claim: an in-process cache hit needs no I/O at all,
+    # otherwise Redis then the database are read on the io pool (older tokens carry the email only)
+    user = None
+    if token_data.user_id is not None:
+      cached_data = cache.get(service.user_cache_key(token_data.user_id))
+      if cached_data is not None:
+        service.count("local_hits")
+        user = schema.UserId.model_validate(cached_data)
+    if user is None:
+      user = await executors.run_io(service.load_user, token_data, redis_client)
     if user is None:
+      service.count("rejected")
       raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="User not found"
       )
+    if not user.is_active: # deactivated since (a user change drops the cached record)
+      service.count("rejected")
+      raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
     return user 
+  except HTTPException:
+    raise
   except Exception as e:
     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+async def get_admin_user(user: Annotated[schema.UserId, Depends(get_current_user)]) -> schema.UserId:
+  # everyone but the ADMIN_USERS gets 403 on the admin routes
+  if not service.is_admin(user.email):
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+  return user
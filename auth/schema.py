@@ -41,4 +41,6 @@ class Token(BaseModel): # create and read
   token_type: str 
 
 class TokenData(BaseModel):
-  username: str | None = None 
\ No newline at end of file
+  username: str | None = None
+  user_id: int | None = None # absent from tokens issued before the uid/act claims
+  is_active: bool | None = None 
\ No newline at end of file
@@ -1,11 +1,23 @@
+import threading
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from . import models, schema, repository # get sql models, Pydantic schema, Repository functions
-from passlib.context import CryptContext
+import redis
+from . import models, schema, repository, passwords # get sql models, Pydantic schema, Repository functions, password hashing
+from .revocation import revocations
+from .refresh_tokens import refresh_tokens
+from cache import cache
+from database import SessionLocal
+from redis_client import get_client
+import executors
+import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto") # password-hash before storing
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token") # tell FastAPI where to get the token
 
+# How authenticated requests were resolved (GET /stats/auth): the common request is a local cache hit, no database
+_auth_stats = {"requests": 0, "claims_tokens": 0, "legacy_tokens": 0, "local_hits": 0, "redis_hits": 0, "db_lookups": 0, "rejected": 0}
+_auth_stats_lock = threading.Lock()
+
 class EmailAlreadyRegisteredError(Exception):
   pass
 
@@ -18,35 +30,93 @@ def get_user(db: Session, user_id: int) -> schema.UserId | None:
 def get_user_by_email(db: Session, email: str) -> schema.UserId | None:
   existing_user = repository.get_user_by_email(db, email)
   if not existing_user:
-    return None 
+    return None
   return schema.UserId.model_validate(existing_user) # Build Pydantic object with ORM model
 
-def create_user(db: Session, username: str, password: str) -> schema.UserId | None:
+def get_user_credentials(db: Session, email: str) -> tuple[schema.UserId | None, str | None]:
+  """ The user and their stored password hash, (None, None) when the email is not registered. """
+  existing_user = repository.get_user_by_email(db, email)
+  if not existing_user:
+    return None, None
+  return schema.UserId.model_validate(existing_user), existing_user.hashed_password
+
+def create_user(db: Session, username: str, hashed_password: str) -> schema.UserId | None:
+  """ Register a user with a password already hashed by passwords.hash_password (on the hash pool). """
   try:
     existing_user = get_user_by_email(db, email=username)
     if existing_user:
       raise EmailAlreadyRegisteredError(f"Email {username} is already registered.")
-    hashed_pwd = pwd_context.hash(password)
-    new_user = schema.UserCreate(email=username, password=password) # Pydantic model
-    db_user = models.User(email=new_user.email, hashed_password=hashed_pwd)   # convert to ORM model 
-    user = repository.create_user(db, db_user) 
+    db_user = models.User(email=username, hashed_password=hashed_password)   # convert to ORM model
+    user = repository.create_user(db, db_user)
     return schema.UserId.model_validate(user) # back to Pydantic model without hashed password
   except Exception as e:
     print(f"Error creating user: {e}")
     return None
 
-def verify_password(plain_password, hashed_password) -> bool:
-  return pwd_context.verify(plain_password, hashed_password)
-
-def authenticate_user(db: Session, username: str, password: str) -> schema.UserId | None:
-  existing_user = get_user_by_email(db, username)
-  if not existing_user:
+async def authenticate_user(db: Session, username: str, password: str) -> schema.UserId | None:
+  """
+  Look the user up on the io pool and verify the password on the hash process pool, so neither blocks the event
+  loop. A hash of another cost than BCRYPT_ROUNDS is replaced by a fresh one once the password is verified.
+  Raises executors.Overloaded when HASH_QUEUE_LIMIT verifications are already pending.
+  """
+  user, hashed_password = await executors.run_io(get_user_credentials, db, username)
+  verified, new_hash = await executors.run_hash(passwords.verify_password, password, hashed_password)
+  if not verified:
     return None
-  db_user = repository.get_user(db, existing_user.id)  # get full user with hashed password
-  if db_user:
-    validate_user = schema.UserInDB.model_validate(db_user) # internal only 
-    if not verify_password(password, validate_user.hashed_password):
-      return None
-    return schema.UserId.model_validate(existing_user) # take the user without the hashed password and return user
-  return None
+  if new_hash:
+    await executors.run_io(repository.update_password_hash, db, user.id, new_hash)
+  return user
+
+def count(counter: str):
+  with _auth_stats_lock:
+    _auth_stats[counter] += 1
+
+def auth_stats() -> dict:
+  with _auth_stats_lock:
+    stats = dict(_auth_stats)
+  stats["db_lookups_per_request"] = round(stats["db_lookups"] / stats["requests"], 4) if stats["requests"] else 0
+  stats["revocations"] = revocations.stats()
+  stats["refresh_tokens"] = refresh_tokens.stats()
+  return stats
+
+def user_cache_key(user_id: int) -> str:
+  return f"user:{user_id}"
+
+def is_admin(email: str | None) -> bool:
+  # administrators (request profiling, /admin routes) are configured by email in ADMIN_USERS
+  return email is not None and email.lower() in settings.ADMIN_USERS
+
+def load_user(token_data: schema.TokenData, redis_client: redis.Redis | None = None) -> schema.UserId | None:
+  """
+  The user behind a verified token, from the local or shared cache tier or the database, then cached for USER_CACHE_TTL.
+  Tokens with a uid claim are looked up by primary key; older tokens (sub only) by email.
+  Args:
+    token_data: decoded claims of the access token.
+    redis_client: optional Redis client for the shared cache tier.
+  """
+  if token_data.user_id is not None:
+    key = user_cache_key(token_data.user_id)
+    cached_data = cache.get(key) # in-process tier only
+    if cached_data is not None:
+      count("local_hits")
+      return schema.UserId.model_validate(cached_data)
+    if redis_client is not None:
+      cached_data = cache.get(key, redis_client)
+      if cached_data is not None:
+        count("redis_hits")
+        return schema.UserId.model_validate(cached_data)
+  count("db_lookups")
+  with SessionLocal() as db:
+    if token_data.user_id is not None:
+      user = get_user(db, token_data.user_id)
+    else:
+      user = get_user_by_email(db, token_data.username)
+  if user:
+    cache.set(user_cache_key(user.id), user.model_dump(), redis_client, ttl=settings.USER_CACHE_TTL)
+  return user
 
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def invalidate_cached_user(mapper, connection, target: models.User):
+  # any change to a user (activation, email, deletion) drops its cached record here and, through pub/sub, in every worker
+  cache.invalidate([user_cache_key(target.id)], get_client())
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+import json
+import logging
+import threading
+import time
+import uuid
+import redis
+from redis_client import health as redis_health, subscriber_client
+import executors
+import settings
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+class TieredCache:
+  """
+  Two-tier cache: a bounded in-process LRU with TTL in front of Redis.
+  - local hit: no network at all. Expired entries are kept for a stale window; a read in that window returns the
+    stale value and schedules one background refresh per key (stale-while-revalidate).
+  - local miss: one Redis round trip (GET + PTTL pipelined), the value is then kept locally for its remaining TTL.
+  - writes go to both tiers and are announced on a pub/sub channel so other workers drop their local copy.
+  Hits and misses are counted per tier and per key family (the part of the key before the first ':').
+  """
+  def __init__(self, max_entries: int = 1024, stale_ttl: float = 60):
+    self.max_entries = max_entries
+    self.stale_ttl = stale_ttl
+    self.origin = uuid.uuid4().hex # lets a worker ignore its own invalidations
+    self._entries: OrderedDict[str, tuple] = OrderedDict() # key -> (value, fresh_until, stale_until)
+    self._lock = threading.Lock()
+    self._refreshing: set[str] = set()
+    self._stats: dict[str, dict[str, int]] = {}
+    self._listener = None
+
+  def _count(self, key: str, counter: str):
+    family = key.split(":", 1)[0]
+    with self._lock:
+      stats = self._stats.setdefault(family, {"local_hits": 0, "stale_hits": 0, "local_misses": 0, "redis_hits": 0, "redis_misses": 0, "redis_errors": 0})
+      stats[counter] += 1
+
+  def stats(self) -> dict[str, dict]:
+    """ Counters and hit ratios per key family. """
+    with self._lock:
+      snapshot = {family: dict(stats) for family, stats in self._stats.items()}
+      size = len(self._entries)
+    for stats in snapshot.values():
+      local_lookups = stats["local_hits"] + stats["stale_hits"] + stats["local_misses"]
+      redis_lookups = stats["redis_hits"] + stats["redis_misses"]
+      stats["local_hit_ratio"] = round((stats["local_hits"] + stats["stale_hits"]) / local_lookups, 4) if local_lookups else 0
+      stats["redis_hit_ratio"] = round(stats["redis_hits"] / redis_lookups, 4) if redis_lookups else 0
+    return {"entries": size, "max_entries": self.max_entries, "families": snapshot}
+
+  def _put_local(self, key: str, value, ttl: float):
+    now = time.monotonic()
+    with self._lock:
+      self._entries[key] = (value, now + ttl, now + ttl + self.stale_ttl)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False) # evict least recently used
+
+  def _drop_local(self, key: str):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def get(self, key: str, redis_client: redis.Redis | None = None, refresh=None):
+    """
+    Return the cached value for `key`, or None on a miss.
+    Args:
+      key: cache key, e.g. "metrics:AAPL".
+      redis_client: optional Redis client for the shared tier.
+      refresh: optional function reloading the value. When given, a stale local entry is returned as is while
+        `refresh()` runs once in the background; without it stale entries count as a miss.
+    """
+    now = time.monotonic()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        if now < entry[2]:
+          self._entries.move_to_end(key)
+        else:
+          del self._entries[key]
+          entry = None
+    if entry is not None:
+      value, fresh_until, _ = entry
+      if now < fresh_until:
+        self._count(key, "local_hits")
+        return value
+      if refresh is not None:
+        self._count(key, "stale_hits")
+        self._refresh_in_background(key, refresh)
+        return value
+    self._count(key, "local_misses")
+
+    if redis_client is None:
+      return None
+    try:
+      self.listen(redis_client)
+      with redis_client.pipeline(transaction=False) as pipe:
+        cached_data, remaining_ms = pipe.get(key).pttl(key).execute() # one round trip
+    except redis.exceptions.RedisError as e:
+      self._count(key, "redis_errors")
+      redis_health.record_failure(e)
+      logger.warning("cache: redis unavailable for %s: %s", key, e)
+      return None
+    if cached_data is None:
+      self._count(key, "redis_misses")
+      return None
+    self._count(key, "redis_hits")
+    value = json.loads(cached_data)
+    self._put_local(key, value, remaining_ms / 1000 if remaining_ms and remaining_ms > 0 else settings.LOCAL_CACHE_TTL)
+    return value
+
+  def get_many(self, keys: list[str], redis_client: redis.Redis | None = None) -> dict:
+    """ Fresh cached values of `keys` (missing keys are left out); local misses are read from Redis in one round trip. """
+    now = time.monotonic()
+    found, missing = {}, []
+    with self._lock:
+      for key in keys:
+        entry = self._entries.get(key)
+        if entry is not None and now < entry[1]:
+          self._entries.move_to_end(key)
+          found[key] = entry[0]
+        else:
+          missing.append(key)
+    for key in found:
+      self._count(key, "local_hits")
+    for key in missing:
+      self._count(key, "local_misses")
+
+    if redis_client is None or not missing:
+      return found
+    try:
+      self.listen(redis_client)
+      with redis_client.pipeline(transaction=False) as pipe:
+        pipe.mget(missing)
+        for key in missing:
+          pipe.pttl(key)
+        cached_data, *remaining = pipe.execute()
+    except redis.exceptions.RedisError as e:
+      for key in missing:
+        self._count(key, "redis_errors")
+      redis_health.record_failure(e)
+      logger.warning("cache: redis unavailable for %s keys: %s", len(missing), e)
+      return found
+    for key, data, remaining_ms in zip(missing, cached_data, remaining):
+      if data is None:
+        self._count(key, "redis_misses")
+        continue
+      self._count(key, "redis_hits")
+      found[key] = json.loads(data)
+      self._put_local(key, found[key], remaining_ms / 1000 if remaining_ms and remaining_ms > 0 else settings.LOCAL_CACHE_TTL)
+    return found
+
+  def set(self, key: str, value, redis_client: redis.Redis | None = None, ttl: float | None = None):
+    """ Store `value` in both tiers for `ttl` seconds (REDIS_EX by default) and invalidate other workers' copies. """
+    ttl = float(ttl if ttl is not None else settings.REDIS_EX)
+    self._put_local(key, value, ttl)
+    if redis_client is None:
+      return
+    try:
+      self.listen(redis_client)
+      with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(value), ex=int(ttl)).publish(INVALIDATION_CHANNEL, f"{self.origin}|{key}").execute()
+    except redis.exceptions.RedisError as e:
+      self._count(key, "redis_errors")
+      redis_health.record_failure(e)
+      logger.warning("cache: could not write %s to redis: %s", key, e)
+
+  def invalidate(self, keys: list[str], redis_client: redis.Redis | None = None):
+    """ Drop `keys` from both tiers, in this worker and (through pub/sub) in every other one. """
+    for key in keys:
+      self._drop_local(key)
+    if redis_client is None or not keys:
+      return
+    try:
+      with redis_client.pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        for key in keys:
+          pipe.publish(INVALIDATION_CHANNEL, f"{self.origin}|{key}")
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+      redis_health.record_failure(e)
+      logger.warning("cache: could not invalidate %s keys in redis: %s", len(keys), e)
+
+  def _refresh_in_background(self, key: str, refresh):
+    with self._lock:
+      if key in self._refreshing:
+        return
+      self._refreshing.add(key)
+
+    def run():
+      try:
+        refresh()
+      except Exception as e:
+        logger.warning("cache: background refresh of %s failed: %s", key, e)
+      finally:
+        with self._lock:
+          self._refreshing.discard(key)
+
+    executors.io_executor().submit(run)
+
+  def listen(self, redis_client: redis.Redis):
+    """ Start (once) the background subscriber dropping local entries invalidated by other workers. """
+    if self._listener is not None:
+      return
+    with self._lock:
+      if self._listener is not None:
+        return
+      self._listener = threading.Thread(target=self._listen, args=(redis_client,), name="cache-invalidation", daemon=True)
+    self._listener.start()
+
+  def _listen(self, redis_client: redis.Redis):
+    subscriber = subscriber_client(redis_client) # no read timeout: an idle channel is not a disconnect
+    subscribed = False
+    while True:
+      pubsub = subscriber.pubsub(ignore_subscribe_messages=True)
+      try:
+        pubsub.subscribe(INVALIDATION_CHANNEL)
+        if subscribed: # resubscribed after losing the connection: invalidations may have been missed, so start cold
+          with self._lock:
+            self._entries.clear()
+        subscribed = True
+        while True:
+          message = pubsub.get_message(timeout=settings.REDIS_HEALTH_INTERVAL) # None while idle, polling sends the health-check PING
+          if message is None:
+            continue
+          origin, _, key = str(message["data"]).partition("|")
+          if origin != self.origin:
+            self._drop_local(key)
+      except redis.exceptions.RedisError as e:
+        if subscribed:
+          logger.warning("cache: invalidation subscriber disconnected: %s", e)
+        pubsub.close()
+        time.sleep(5)
+
+cache = TieredCache(max_entries=settings.LOCAL_CACHE_SIZE, stale_ttl=settings.LOCAL_CACHE_STALE_TTL)
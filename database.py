@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker 
 import settings
@@ -6,9 +7,12 @@ import settings
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} # because we are going to do async calls, only for SQLite
 )
+# Async engine on the same database (aiosqlite runs the sqlite calls off the event loop)
+async_engine = create_async_engine(settings.SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
 
 # Create a sessionmaker to interact with the database (each instance of the sessionLocal will be a database session)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 # Create a base class for declarative class definitions 
 Base = declarative_base()
 
@@ -17,4 +21,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async routes use this one. Repository/service functions stay synchronous and run through `await db.run_sync(fn, *args)`
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
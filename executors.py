@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import profiling
+import settings
+
+# Managed executors for blocking work called from async routes, so the event loop never waits on it:
+# - io: provider calls (yfinance), synchronous SQLAlchemy sessions and the pandas work mixed into them
+# - compute: pure CPU-bound pandas/NumPy work
+# - fetch: fan-out of upstream downloads (option chains, ...) shared by every request and the nightly refresh
+# - hash: password hashing/verification (bcrypt), a process pool with a bounded queue (see run_hash)
+# They are created on first use (and again after a shutdown, e.g. when the app is restarted in-process).
+_executors: dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+_provider_limits: dict[str, threading.BoundedSemaphore] = {}
+_fetch_thread = threading.local()
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_stats = {"pending": 0, "completed": 0, "rejected": 0}
+
+class Overloaded(Exception):
+  """ Raised instead of queueing when a bounded pool already holds its maximum of pending tasks. """
+
+def _get(name: str, max_workers: int) -> ThreadPoolExecutor:
+  executor = _executors.get(name)
+  if executor is None:
+    with _lock:
+      executor = _executors.get(name)
+      if executor is None:
+        executor = _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+  return executor
+
+def io_executor() -> ThreadPoolExecutor:
+  return _get("io", settings.IO_WORKERS)
+
+def compute_executor() -> ThreadPoolExecutor:
+  return _get("compute", settings.COMPUTE_WORKERS)
+
+def fetch_executor() -> ThreadPoolExecutor:
+  return _get("fetch", settings.FETCH_WORKERS)
+
+def hash_executor() -> ProcessPoolExecutor:
+  # spawned, not forked: the parent runs threads (pools, Redis health monitor) that a fork would copy mid-flight
+  global _hash_pool
+  if _hash_pool is None:
+    with _lock:
+      if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=settings.HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+  return _hash_pool
+
+def provider_limit(provider: str) -> threading.BoundedSemaphore:
+  """ Semaphore bounding the concurrent upstream calls made to one provider, across the whole process. """
+  with _lock:
+    limit = _provider_limits.get(provider)
+    if limit is None:
+      limit = _provider_limits[provider] = threading.BoundedSemaphore(settings.PROVIDER_MAX_CONCURRENCY)
+  return limit
+
+def _run_fetch(provider: str, fn, *args, **kwargs):
+  _fetch_thread.active = True
+  try:
+    with provider_limit(provider):
+      return fn(*args, **kwargs)
+  finally:
+    _fetch_thread.active = False
+
+def submit_fetch(provider: str, fn, *args, **kwargs) -> Future:
+  """
+  Run the blocking upstream call `fn(*args, **kwargs)` on the shared fetch pool, holding one of the provider's
+  PROVIDER_MAX_CONCURRENCY slots while it runs. A fetch submitted from a fetch thread runs inline instead: a
+  pooled task waiting on other pooled tasks could otherwise exhaust the pool.
+  """
+  if getattr(_fetch_thread, "active", False):
+    future = Future()
+    try:
+      future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+      future.set_exception(e)
+    return future
+  return fetch_executor().submit(contextvars.copy_context().run, profiling.track, _run_fetch, provider, fn, *args, **kwargs)
+
+async def run_in(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+  """
+  Run `fn(*args, **kwargs)` on `executor` and await the result; context variables are carried over (so the
+  worker thread is sampled while it runs if the calling request is being profiled, see profiling.track).
+  """
+  loop = asyncio.get_running_loop()
+  context = contextvars.copy_context()
+  return await loop.run_in_executor(executor, functools.partial(context.run, profiling.track, fn, *args, **kwargs))
+
+async def run_io(fn, *args, **kwargs):
+  return await run_in(io_executor(), fn, *args, **kwargs)
+
+async def run_compute(fn, *args, **kwargs):
+  return await run_in(compute_executor(), fn, *args, **kwargs)
+
+def _release_hash(future: Future):
+  with _lock:
+    _hash_stats["pending"] -= 1
+    _hash_stats["completed"] += 1
+
+async def run_hash(fn, *args):
+  """
+  Run the picklable `fn(*args)` on the password hashing process pool and await the result. At most HASH_QUEUE_LIMIT
+  calls are pending (running or queued) at once: past that, Overloaded is raised straight away instead of queueing
+  work that would outlast the client's patience. A slot is released when the worker finishes, not when the caller
+  gives up, so abandoned requests still count against the limit while their hash runs.
+  """
+  global _hash_pool
+  with _lock:
+    if _hash_stats["pending"] >= settings.HASH_QUEUE_LIMIT:
+      _hash_stats["rejected"] += 1
+      raise Overloaded(f"{_hash_stats['pending']} password hashes pending (HASH_QUEUE_LIMIT={settings.HASH_QUEUE_LIMIT})")
+    _hash_stats["pending"] += 1
+  executor = hash_executor()
+  try:
+    future = executor.submit(fn, *args)
+  except Exception as e: # broken pool (a worker died) or shutting down
+    with _lock:
+      _hash_stats["pending"] -= 1
+      if isinstance(e, BrokenProcessPool) and _hash_pool is executor:
+        _hash_pool = None # the next call starts a fresh pool
+    raise
+  future.add_done_callback(_release_hash)
+  return await asyncio.wrap_future(future)
+
+def queue_stats() -> dict[str, dict[str, int]]:
+  """ Workers, started threads and tasks waiting for a thread, per thread pool created so far. """
+  with _lock:
+    executors = dict(_executors)
+  return {
+    name: {"workers": executor._max_workers, "threads": len(executor._threads), "queued": executor._work_queue.qsize()}
+    for name, executor in executors.items()
+  }
+
+def hash_stats() -> dict[str, int]:
+  with _lock:
+    return {"workers": settings.HASH_WORKERS, "limit": settings.HASH_QUEUE_LIMIT, **_hash_stats}
+
+def shutdown():
+  global _hash_pool
+  with _lock:
+    executors = list(_executors.values())
+    _executors.clear()
+    if _hash_pool is not None:
+      executors.append(_hash_pool)
+      _hash_pool = None
+  for executor in executors:
+    executor.shutdown(wait=False, cancel_futures=True)
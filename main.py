@@ -1,14 +1,54 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from auth.router import router as auth_router
+from fastapi.responses import RedirectResponse, Response
+from auth.router import router as auth_router, get_admin_user
+from auth import service as auth_service
+from auth.revocation import revocations
+from auth.refresh_tokens import refresh_tokens
 from tickers.router import router as ticker_router
+from tickers.scheduler import scheduler
 from positions.router import router as pos_router
-from database import engine, Base
+from admin.router import router as admin_router
+from database import engine, async_engine
 import settings
+import executors
+from ratelimit import RateLimitMiddleware, rate_limiter
+from profiling import ProfilingMiddleware
+import telemetry
+import redis_client
+import migrations
+from cache import cache
 from testing.seeding import seed_demo_user
 
-app = FastAPI(debug=False, title="Stock Options Analytics API", version="1.0.0", description="API for stock options analytics and portfolio management")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  # one Redis pool for the whole app lifetime, watched by a background health monitor
+  redis_client.init_redis()
+  cache.listen(redis_client.client)
+  revocations.listen(redis_client.client) # other workers' token revocations, into this worker's filters
+  refresh_tokens.start() # deletes expired rows of the refresh token fallback table
+  # nightly ticker/option refresh; every worker runs a scheduler, a database lease lets only one of them refresh
+  if settings.SCHEDULER_ENABLED:
+    scheduler.start()
+  yield
+  scheduler.stop()
+  refresh_tokens.stop()
+  # release the managed executors, Redis pools and the async engine's connections on shutdown
+  executors.shutdown()
+  await redis_client.close_redis()
+  await async_engine.dispose()
+
+app = FastAPI(debug=False, title="Stock Options Analytics API", version="1.0.0", description="API for stock options analytics and portfolio management", lifespan=lifespan)
+
+# on-demand request profiles (X-Profile header from an admin, or PROFILE_SAMPLE_RATE); innermost, so a profile
+# covers the route's own work and not the other middlewares
+if settings.PROFILING_ENABLED:
+  app.add_middleware(ProfilingMiddleware)
+
+# per-client sliding-window rate limit; added before CORS so that 429 responses still carry the CORS headers
+if settings.RATE_LIMIT_ENABLED:
+  app.add_middleware(RateLimitMiddleware)
 
 app.add_middleware(
   CORSMiddleware,
@@ -16,21 +56,56 @@ app.add_middleware(
   allow_credentials=True,         # Allow Credentials (Authorization headers, Cookies, etc) to be included in the requests
   allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Specify the allowed HTTP methods
   allow_headers=["*"],  # Specify the allowed headers
+  expose_headers=["X-Next-Cursor", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After", "X-Profile-Id"], # pagination cursor of GET /positions/, rate limit state, saved profile
 )
 
+# request latency per route for GET /metrics; outermost, so it also times rate-limited and CORS-rejected requests
+if settings.METRICS_ENABLED:
+  app.add_middleware(telemetry.MetricsMiddleware)
+  telemetry.instrument_engine(engine, "sync")
+  telemetry.instrument_engine(async_engine.sync_engine, "async")
+  telemetry.register_collector(telemetry.collect_app_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+  # Prometheus text exposition: routes, provider calls, database statements, caches, executors, auth, rate limits
+  return Response(telemetry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Redirect to Swagger
 @app.get("/", include_in_schema=False)
 async def redirect_to_docs():
   return RedirectResponse(url="/docs")
 
+# internals of the pools, auth and rate limiter: administrators only (ADMIN_USERS), like /tickers/stats/*
+@app.get("/stats/redis", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def redis_stats():
+  # pool size, connection waits, health checks and reconnects of the shared Redis pools
+  return redis_client.stats()
+
+@app.get("/stats/hash", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def hash_stats():
+  # workers, pending/completed hashes and logins rejected by HASH_QUEUE_LIMIT of the password hashing pool
+  return executors.hash_stats()
+
+@app.get("/stats/ratelimit", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def ratelimit_stats():
+  # allowed/limited requests and how they were checked (Redis script or the local fallback)
+  return rate_limiter.stats()
+
+@app.get("/stats/auth", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def auth_stats():
+  # how authenticated requests resolved their user: in-process cache, Redis or a database lookup
+  return auth_service.auth_stats()
+
 # Add the routers 
 app.include_router(auth_router, prefix="/auth")
 app.include_router(pos_router, prefix="/positions")
 app.include_router(ticker_router, prefix="/tickers")
+app.include_router(admin_router, prefix="/admin")
 
 
-# Create all the tables defined in the Base class'metadata within the connected database
-Base.metadata.create_all(bind=engine) 
+# Bring the database schema up to date (versioned migrations, see migrations/)
+migrations.migrate(engine)
 
 # create a demo user for testing
 seed_demo_user() 
@@ -0,0 +1,47 @@
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema migrations. Each module in this package named `v<NNNN>_<name>.py` defines
+#   VERSION: int, increasing
+#   DESCRIPTION: str
+#   upgrade(connection): applies the change on an open transaction
+# Applied versions are recorded in `schema_migrations`; every pending migration runs (in order) in its own transaction.
+
+def discover() -> list:
+  migrations = []
+  for module in pkgutil.iter_modules(__path__):
+    if module.name.startswith("v"):
+      migrations.append(importlib.import_module(f"{__name__}.{module.name}"))
+  migrations.sort(key=lambda migration: migration.VERSION)
+  return migrations
+
+def applied_versions(engine: Engine) -> set[int]:
+  with engine.begin() as connection:
+    connection.execute(text(
+      "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, description VARCHAR, applied_at DATETIME)"
+    ))
+    return {row.version for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+def migrate(engine: Engine) -> list[int]:
+  """ Apply every pending migration to `engine`'s database and return the versions applied. """
+  done = applied_versions(engine)
+  applied = []
+  for migration in discover():
+    if migration.VERSION in done:
+      continue
+    with engine.begin() as connection:
+      migration.upgrade(connection)
+      connection.execute(
+        text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+        {"version": migration.VERSION, "description": migration.DESCRIPTION, "applied_at": datetime.now(ZoneInfo("UTC"))},
+      )
+    logger.info("migrations: applied %04d %s", migration.VERSION, migration.DESCRIPTION)
+    applied.append(migration.VERSION)
+  return applied
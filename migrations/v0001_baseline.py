@@ -0,0 +1,8 @@
+from database import Base
+
+VERSION = 1
+DESCRIPTION = "create the tables of every model (existing tables are left as they are)"
+
+def upgrade(connection):
+  # models must be imported before this runs (main imports every router, and with them every model)
+  Base.metadata.create_all(bind=connection)
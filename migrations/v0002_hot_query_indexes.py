@@ -0,0 +1,18 @@
+from sqlalchemy import text
+
+VERSION = 2
+DESCRIPTION = "composite indexes for option lookups, positions by owner and ticker staleness scans"
+
+# IF NOT EXISTS: databases created by the baseline already have them (they are declared on the models too)
+STATEMENTS = [
+  # repository.get_option / get_option_chain_fetched_date / get_option_chain_keys_after
+  "CREATE INDEX IF NOT EXISTS ix_options_chain_strike ON options (ticker, expire_date, type, strike_price)",
+  # retrieve_positions_by_owner_id: WHERE owner_id = ? ORDER BY open_date DESC, id DESC, without a temp b-tree sort
+  "CREATE INDEX IF NOT EXISTS ix_positions_owner_open_date ON positions (owner_id, open_date, id)",
+  # tickers not refreshed since a given time
+  "CREATE INDEX IF NOT EXISTS ix_tickers_fetched_date ON tickers (fetched_date)",
+]
+
+def upgrade(connection):
+  for statement in STATEMENTS:
+    connection.execute(text(statement))
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import Base
+
+VERSION = 3
+DESCRIPTION = "materialized per-user position summaries, built from the existing positions"
+
+def upgrade(connection):
+  from positions import service # imported here: the service pulls in the models and repositories
+  Base.metadata.tables["position_summaries"].create(bind=connection, checkfirst=True) # with ix_position_summaries_ticker
+  # positions.repository.get_open_option_position_columns_by_tickers, on every ticker refresh
+  connection.execute(text("CREATE INDEX IF NOT EXISTS ix_positions_ticker_category ON positions (ticker, category)"))
+  with Session(bind=connection) as db:
+    service.check_summaries(db, repair=True)
+    db.flush()
@@ -0,0 +1,7 @@
+from database import Base
+
+VERSION = 4
+DESCRIPTION = "refresh tokens table (fallback when Redis is unavailable), indexed by expiry for the sweeper"
+
+def upgrade(connection):
+  Base.metadata.tables["refresh_tokens"].create(bind=connection, checkfirst=True) # with ix_refresh_tokens_expires_at
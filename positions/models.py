@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, Boolean, Date, String, ForeignKey
+from sqlalchemy import Column, Integer, Float, Boolean, Date, String, ForeignKey, Index
 from sqlalchemy.types import Enum
 from sqlalchemy.orm import relationship 
 from database import Base 
@@ -22,5 +22,33 @@ class Position(Base):
     owner = relationship("User", back_populates="positions")
     ticker_belongs_to = relationship("Ticker", back_populates="positions")
 
+    __table_args__ = (
+        Index("ix_positions_owner_open_date", "owner_id", "open_date", "id"), # a user's positions, newest first
+        Index("ix_positions_ticker_category", "ticker", "category"), # open option positions to revalue on a price change
+    )
+
     def __str__(self):
         return f"Position ID: {self.id}, Category: {self.category}, ticker: {self.ticker}, option_price: {self.option_price}, Open Date: {self.open_date}, Close Date: {self.close_date}, Is Active: {self.is_active}, Closed Price: {self.closed_price}"
+
+
+class PositionSummary(Base):
+    __tablename__ = "position_summaries" # materialized per-user totals per (ticker, category), maintained by positions.service
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    ticker = Column(String, primary_key=True)
+    category = Column(Enum('Long', 'Short', 'Call','Put'), primary_key=True)
+    open_positions = Column(Integer, default=0)
+    closed_positions = Column(Integer, default=0)
+    wins = Column(Integer, default=0) # closed positions with a positive realized P&L
+    realized_pnl = Column(Float, default=0)
+    hold_days = Column(Float, default=0) # summed over closed positions with both dates
+    held_positions = Column(Integer, default=0) # closed positions counted in hold_days
+    open_qty = Column(Float, default=0) # signed: Long/Call +qty, Short/Put -qty
+    open_cost = Column(Float, default=0) # stocks: signed trade_price * qty, options: premium * qty
+    unrealized_pnl = Column(Float, default=0) # valued at last_price
+    exposure = Column(Float, default=0) # last_price * open_qty
+    last_price = Column(Float, nullable=True) # ticker close the open positions are valued at (NULL: unpriced)
+
+    __table_args__ = (
+        Index("ix_position_summaries_ticker", "ticker"), # groups to revalue on a price change
+    )
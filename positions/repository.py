@@ -1,5 +1,8 @@
+from sqlalchemy import case, delete, func, insert, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session 
 from . import models # database models
+from tickers.models import Ticker
 
 # create
 def create_position(db: Session, position: models.Position) -> models.Position:
@@ -8,19 +11,39 @@ def create_position(db: Session, position: models.Position) -> models.Position:
   db.refresh(position)
   return position
 
+# create (bulk: [{"owner_id": ..., "ticker": ..., ...}, ...], one transaction)
+def create_positions(db: Session, rows: list[dict]) -> None:
+  if rows:
+    db.execute(insert(models.Position.__table__), rows) # Core executemany: the ORM bulk path splits batches on NULL columns
+  db.commit()
+
 # read
 def get_position_by_id(db: Session, position_id: int) -> models.Position | None:
   return db.query(models.Position).filter(models.Position.id == position_id).first()
 
 # read all
-def retrieve_positions_by_owner_id(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[models.Position]:
+# read (keyset page, newest first: positions strictly after the (open_date, id) of the previous page's last row)
+def retrieve_positions_by_owner_id(db: Session, user_id: int, limit: int = 100, after: tuple | None = None) -> list[models.Position]:
   return db.query(models.Position)\
-            .filter(models.Position.owner_id == user_id)\
+            .filter(models.Position.owner_id == user_id, *_after_keyset(after))\
             .order_by(models.Position.open_date.desc(), models.Position.id.desc())\
-            .offset(skip)\
             .limit(limit)\
             .all()
 
+# read (every position of a user after the keyset, as batches of plain rows fetched `batch_size` at a time from the driver cursor)
+def stream_positions_by_owner_id(db: Session, user_id: int, columns: list[str], after: tuple | None = None, batch_size: int = 500):
+  statement = select(*(getattr(models.Position, column) for column in columns))\
+                .where(models.Position.owner_id == user_id, *_after_keyset(after))\
+                .order_by(models.Position.open_date.desc(), models.Position.id.desc())\
+                .execution_options(yield_per=batch_size)
+  yield from db.execute(statement).partitions()
+
+def _after_keyset(after: tuple | None) -> list:
+  if after is None:
+    return []
+  # row value: SQLite seeks ix_positions_owner_open_date to the cursor (an OR of the two cases only filters the walk)
+  return [tuple_(models.Position.open_date, models.Position.id) < tuple_(*after)]
+
 # update
 def update_position(db: Session, position: models.Position) -> models.Position:
   db.merge(position) # merge is used to update an existing record
@@ -34,3 +57,110 @@ def remove_position(db: Session, position: models.Position) -> models.Position |
   db.commit()
   return None
 
+
+# read (column-oriented batch for analytics/summaries: one query joined to the latest ticker close, dates as julian day numbers)
+def _get_position_columns(db: Session, *conditions) -> dict[str, tuple]:
+  columns = {
+    "id": models.Position.id,
+    "owner_id": models.Position.owner_id,
+    "ticker": models.Position.ticker,
+    "category": models.Position.category,
+    "qty": models.Position.qty,
+    "option_price": models.Position.option_price,
+    "trade_price": models.Position.trade_price,
+    "closed_price": models.Position.closed_price,
+    "is_active": models.Position.is_active,
+    "open_day": func.julianday(models.Position.open_date), # plain floats: no per-row date parsing
+    "close_day": func.julianday(models.Position.close_date),
+    "last_price": Ticker.closed_price,
+  }
+  statement = select(*columns.values())\
+                .outerjoin(Ticker, Ticker.ticker == models.Position.ticker)\
+                .where(*conditions)
+  # run the compiled SQL on the driver: plain tuples, without the ORM/type processing of every row
+  compiled = statement.compile(db.get_bind(), compile_kwargs={"render_postcompile": True}) # expands IN lists
+  rows = db.connection().exec_driver_sql(str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)).fetchall()
+  return dict(zip(columns, zip(*rows))) if rows else {name: () for name in columns}
+
+def get_position_columns_by_owner_id(db: Session, user_id: int) -> dict[str, tuple]:
+  return _get_position_columns(db, models.Position.owner_id == user_id)
+
+# read (open option positions on the given tickers, every owner)
+def get_open_option_position_columns_by_tickers(db: Session, tickers: list[str]) -> dict[str, tuple]:
+  return _get_position_columns(db, models.Position.ticker.in_(tickers), *_open_option_conditions())
+
+# read (a user's open option positions)
+def get_open_option_position_columns_by_owner_id(db: Session, user_id: int) -> dict[str, tuple]:
+  return _get_position_columns(db, models.Position.owner_id == user_id, *_open_option_conditions())
+
+def _open_option_conditions() -> list:
+  # open as in the summaries: not (inactive with a closed_price)
+  return [
+    models.Position.category.in_(["Call", "Put"]),
+    or_(models.Position.is_active.is_not(False), models.Position.closed_price.is_(None)),
+  ]
+
+# read
+def get_position_owner_ids(db: Session) -> list[int]:
+  owners = select(models.Position.owner_id).union(select(models.PositionSummary.owner_id))
+  return [owner_id for (owner_id,) in db.execute(owners).all() if owner_id is not None]
+
+# read
+def get_last_price(db: Session, ticker: str) -> float | None:
+  return db.execute(select(Ticker.closed_price).where(Ticker.ticker == ticker)).scalar()
+
+# read
+def get_position_summaries(db: Session, user_id: int) -> list[models.PositionSummary]:
+  return db.query(models.PositionSummary).filter(models.PositionSummary.owner_id == user_id).all()
+
+# create or update (adds each delta to its group's totals in one executemany; not committed, so it lands in the caller's transaction)
+def apply_position_summary_deltas(db: Session, deltas: list[dict]) -> None:
+  if not deltas:
+    return
+  key = ("owner_id", "ticker", "category")
+  statement = sqlite_insert(models.PositionSummary.__table__) # Core executemany, see create_positions
+  statement = statement.on_conflict_do_update(
+    index_elements=list(key),
+    set_={
+      column: statement.table.c[column] + statement.excluded[column] if column != "last_price" else statement.excluded[column]
+      for column in deltas[0] if column not in key
+    },
+  )
+  db.execute(statement, deltas)
+  db.execute(delete(models.PositionSummary).where(
+    models.PositionSummary.owner_id.in_({delta["owner_id"] for delta in deltas}),
+    models.PositionSummary.open_positions == 0, models.PositionSummary.closed_positions == 0,
+  )) # groups whose last position is gone
+
+# update (revalue every group of the given tickers at the current close: exposure, and the unrealized P&L of stock
+# groups, are linear in the price; option groups need their strikes, see bulk_update_position_summaries)
+def revalue_position_summaries(db: Session, tickers: list[str]) -> None:
+  last_price = select(Ticker.closed_price).where(Ticker.ticker == models.PositionSummary.ticker).scalar_subquery()
+  is_stock = models.PositionSummary.category.in_(["Long", "Short"])
+  db.execute(
+    update(models.PositionSummary)
+      .where(models.PositionSummary.ticker.in_(tickers))
+      .values(
+        last_price=last_price,
+        exposure=func.coalesce(last_price * models.PositionSummary.open_qty, 0),
+        unrealized_pnl=case(
+          (is_stock, func.coalesce(last_price * models.PositionSummary.open_qty - models.PositionSummary.open_cost, 0)),
+          else_=models.PositionSummary.unrealized_pnl,
+        ),
+      )
+      .execution_options(synchronize_session=False)
+  )
+  db.commit()
+
+# update (bulk, by primary key: [{"owner_id": ..., "ticker": ..., "category": ..., "unrealized_pnl": ...}, ...])
+def bulk_update_position_summaries(db: Session, rows: list[dict]) -> None:
+  if rows:
+    db.execute(update(models.PositionSummary), rows)
+  db.commit()
+
+# replace all summary rows of a user
+def replace_position_summaries(db: Session, user_id: int, rows: list[dict]) -> None:
+  db.execute(delete(models.PositionSummary).where(models.PositionSummary.owner_id == user_id))
+  if rows:
+    db.execute(insert(models.PositionSummary), rows)
+  db.commit()
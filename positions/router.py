@@ -1,7 +1,14 @@
 from hmac import new
-from fastapi import APIRouter, Depends, HTTPException, status
-from database import get_db 
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from database import get_db, get_async_db
 from sqlalchemy.orm import Session 
+from sqlalchemy.ext.asyncio import AsyncSession
+import executors
+import io
+import redis
+from redis_client import get_redis_client
 from auth import schema as user_schema 
 from auth.router import get_current_user
 from tickers import service as tickers_service, schemas as tickers_schemas 
@@ -39,16 +46,53 @@ def add_position(position: schemas.Position, current_user: user_schema.UserId =
 
   return new_position
 
-# READ ALL
+# IMPORT (CSV journal with the columns of the csv export; returns a per-row error report)
+@router.post("/import", response_model=schemas.Import_Report, tags=["positions"])
+async def import_positions(file: UploadFile, current_user: user_schema.UserId = Depends(get_current_user), db: Session=Depends(get_db), redis_client: redis.Redis = Depends(get_redis_client)):
+  lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="") # read line by line from the spooled upload
+  return await executors.run_io(service.import_positions, db, current_user.id, lines, redis_client=redis_client)
+
+# READ ALL (keyset pages: pass the X-Next-Cursor header of a page as `cursor` to get the next one; ndjson/csv stream everything)
 @router.get("/", response_model=list[schemas.Position], tags=["positions"])
-async def retrieve_positions(current_user: user_schema.UserId = Depends(get_current_user),db: Session=Depends(get_db)):
-  positions = service.retrieve_positions(db, current_user.id) # limit and offset incorporated.
-  return [schemas.Position.model_validate(p) for p in positions] 
+async def retrieve_positions(
+  response: Response,
+  limit: int = Query(100, ge=1, le=1000),
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+  format: Literal["json", "ndjson", "csv"] = Query("json", description="ndjson/csv stream every position after the cursor"),
+  current_user: user_schema.UserId = Depends(get_current_user),
+  db: AsyncSession=Depends(get_async_db),
+):
+  try:
+    after = service.decode_cursor(cursor) if cursor else None
+  except ValueError as error:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+  if format != "json": # the generator opens its own session: the request's one is closed before the body is sent
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(service.export_positions(current_user.id, format, after), media_type=media_type)
+
+  positions, next_cursor = await db.run_sync(service.retrieve_positions, current_user.id, limit, after)
+  if next_cursor:
+    response.headers["X-Next-Cursor"] = next_cursor
+  return positions
+
+# ANALYTICS (declared before /{position_id} so the path is not read as an id)
+@router.get("/analytics", response_model=schemas.Position_Analytics, tags=["positions"])
+async def get_analytics(current_user: user_schema.UserId = Depends(get_current_user), db: AsyncSession=Depends(get_async_db)):
+  # blocking work off the event loop: the pending revalue writes through a sync session, the frame work is pandas
+  await executors.run_io(service.revalue_pending) # closes fetched since, not revalued yet
+  summaries = await db.run_sync(service.get_summary_rows, current_user.id)
+  return await executors.run_compute(service.get_analytics, summaries)
+
+# GREEKS (open option positions, per position and aggregated)
+@router.get("/greeks", response_model=schemas.Portfolio_Greeks, tags=["positions"])
+async def get_greeks(current_user: user_schema.UserId = Depends(get_current_user), db: AsyncSession=Depends(get_async_db)):
+  columns, quotes = await db.run_sync(service.get_greeks_inputs, current_user.id)
+  return await executors.run_compute(service.get_greeks, columns, quotes) # vectorized Black-Scholes, off the event loop
 
 # READ
 @router.get("/{position_id}", response_model=schemas.Position, tags=["positions"])
-async def retrieve_a_position(position_id: int, current_user: user_schema.UserId = Depends(get_current_user),db: Session=Depends(get_db)):
-  position = service.get_position(db, position_id)
+async def retrieve_a_position(position_id: int, current_user: user_schema.UserId = Depends(get_current_user),db: AsyncSession=Depends(get_async_db)):
+  position = await db.run_sync(service.get_position, position_id)
   if position is None:
     raise HTTPException(status_code=404, detail="No data found, id may be invalid.")
   if position.owner_id != current_user.id:
@@ -58,28 +102,28 @@ async def retrieve_a_position(position_id: int, current_user: user_schema.UserId
 # UPDATE
 @router.put("/{position_id}", response_model=schemas.Position, tags=["positions"])
 async def update_position(position_id: int, update_position: schemas.Position, current_user: user_schema.UserId = Depends(get_current_user),db: Session=Depends(get_db)):
-  position = service.get_position(db, position_id)
+  position = await executors.run_io(service.get_position, db, position_id)
   if position is None:
     raise HTTPException(status_code=404, detail="No data found, id may be invalid.")
   if position.owner_id != current_user.id:
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to modify this position.")
-  ticker = tickers_service.get_closed_price(db, position.ticker)
+  ticker = await executors.run_io(tickers_service.get_closed_price, db, position.ticker)
   if not ticker:
     raise HTTPException(status_code=404, detail="No data found, symbol may be delisted.")
 
-  position = service.update_position(db, position_id, update_position)
+  position = await executors.run_io(service.update_position, db, position_id, update_position)
   if position is None:
     raise HTTPException(status_code=404, detail="No data found, id may be invalid.")
   return schemas.Position.model_validate(position)
 
 # DELETE
 @router.delete("/{position_id}", status_code=204, tags=["positions"])
-async def remove_position(position_id: int, current_user: user_schema.UserId = Depends(get_current_user),db: Session=Depends(get_db)):
-  existing_position = service.get_position(db, position_id)
+async def remove_position(position_id: int, current_user: user_schema.UserId = Depends(get_current_user),db: AsyncSession=Depends(get_async_db)):
+  existing_position = await db.run_sync(service.get_position, position_id)
   if existing_position is None:
     raise HTTPException(status_code=404, detail="No data found, id may be invalid.")
   if existing_position.owner_id != current_user.id:
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this position.")
-  service.remove_position(db, position_id)
+  await db.run_sync(service.remove_position, position_id)
   return None
 
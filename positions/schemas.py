@@ -40,4 +40,59 @@ class Position_Owner_Details(Position):
 
   model_config = {
     "from_attributes": True
-  }  # Enable ORM mode to work with SQLAlchemy models
\ No newline at end of file
+  }  # Enable ORM mode to work with SQLAlchemy models
+class Exposure(BaseModel):
+  positions: int = 0 # open positions
+  exposure: float = 0 # signed notional at the last close: Long/Call +qty, Short/Put -qty
+  unrealized_pnl: float = 0
+
+class Position_Analytics(BaseModel):
+  positions: int = 0
+  open_positions: int = 0
+  closed_positions: int = 0
+  unpriced_positions: int = 0 # open positions whose ticker has no stored close (left out of unrealized P&L)
+  unrealized_pnl: float = 0
+  realized_pnl: float = 0
+  total_pnl: float = 0
+  win_rate: Optional[float] = None # share of closed positions with a positive realized P&L
+  avg_hold_days: Optional[float] = None # closed positions, open_date to close_date
+  exposure_by_ticker: dict[str, Exposure] = {}
+  exposure_by_category: dict[str, Exposure] = {}
+
+class Import_Error(BaseModel):
+  row: int # line number in the file (the header is line 1)
+  error: str
+
+class Import_Report(BaseModel):
+  rows: int = 0
+  imported: int = 0
+  failed: int = 0
+  duration: float = 0 # seconds
+  errors: list[Import_Error] = []
+
+class Greeks(BaseModel):
+  delta: float = 0 # share-equivalent: qty * per-share delta
+  gamma: float = 0
+  theta: float = 0 # per calendar day
+  vega: float = 0 # per volatility point (0.01)
+
+class Position_Greeks(BaseModel):
+  id: int
+  ticker: str
+  category: PositionType
+  qty: int
+  strike_price: float
+  expire_date: datetime
+  spot: Optional[float] = None # last close of the underlying
+  iv: Optional[float] = None
+  price: Optional[float] = None # Black-Scholes value per share
+  delta: Optional[float] = None # qty * per-share Greeks, None when unpriced
+  gamma: Optional[float] = None
+  theta: Optional[float] = None
+  vega: Optional[float] = None
+
+class Portfolio_Greeks(BaseModel):
+  positions: list[Position_Greeks] = []
+  unpriced_positions: int = 0 # no stored close for the underlying, or no quote/iv for the contract
+  totals: Greeks = Greeks()
+  by_ticker: dict[str, Greeks] = {}
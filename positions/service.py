@@ -1,9 +1,32 @@
 from . import schemas, models, repository
+from tickers import greeks, repository as tickers_repository
 from sqlalchemy.orm import Session 
-from datetime import datetime
+from database import SessionLocal
+from pydantic import ValidationError
+from datetime import date, datetime
+import base64
+import csv
+import io
+import json
+import logging
+import threading
+import time
+import executors
+import settings
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# tickers whose close changed on a request path, revalued off that request (see defer_revalue)
+_pending_revalue: set[str] = set()
+_revalue_lock = threading.Lock()
+_revalue_scheduled = False
 
 def create_position(db: Session, position: schemas.Position) -> schemas.Position | None:
-  position = repository.create_position(db, models.Position(**position.model_dump())) # create in db
+  db_position = models.Position(**position.model_dump())
+  apply_summary_delta(db, db_position, 1) # committed together with the position
+  position = repository.create_position(db, db_position) # create in db
   return schemas.Position.model_validate(position) # convert back to pydantic model
 
 def get_position(db: Session, id: int):
@@ -17,19 +40,164 @@ def get_position(db: Session, id: int):
     print(f"Error retrieving position by id: {e}")
     return None
   
-def retrieve_positions(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[schemas.Position]:  
-  db_positions = repository.retrieve_positions_by_owner_id(db, user_id, skip, limit)
-  positions = [schemas.Position.model_validate(position) for position in db_positions]
-  return positions
+def retrieve_positions(db: Session, user_id: int, limit: int = 100, after: tuple | None = None) -> tuple[list[schemas.Position], str | None]:
+  """ One page of a user's positions, newest first, and the cursor of the next page (None on the last one). """
+  db_positions = repository.retrieve_positions_by_owner_id(db, user_id, limit + 1, after) # one extra row tells whether a next page exists
+  positions = [schemas.Position.model_validate(position) for position in db_positions[:limit]]
+  next_cursor = encode_cursor(db_positions[limit - 1]) if len(db_positions) > limit else None
+  return positions, next_cursor
+
+def encode_cursor(position: models.Position) -> str:
+  keyset = json.dumps([position.open_date.isoformat() if position.open_date else None, position.id])
+  return base64.urlsafe_b64encode(keyset.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+  """ (open_date, id) of an opaque cursor; raises ValueError when it was not issued by encode_cursor. """
+  try:
+    open_date, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return date.fromisoformat(open_date), int(id)
+  except Exception as e:
+    raise ValueError(f"Invalid cursor: {cursor}") from e
+
+EXPORT_FIELDS = list(schemas.Position.model_fields)
+
+def export_positions(user_id: int, format: str = "ndjson", after: tuple | None = None, batch_size: int = 500):
+  """
+  Stream every position of a user after the cursor (newest first) as NDJSON lines or CSV, one chunk per batch.
+  Rows come from a server-side cursor on a session owned by the generator, so memory stays flat for any journal size.
+  """
+  buffer = io.StringIO()
+  writer = csv.DictWriter(buffer, EXPORT_FIELDS)
+  if format == "csv":
+    writer.writeheader()
+  with SessionLocal() as db:
+    for rows in repository.stream_positions_by_owner_id(db, user_id, EXPORT_FIELDS, after, batch_size):
+      positions = [export_row(row) for row in rows]
+      if format != "csv":
+        yield "".join(json.dumps(position) + "\n" for position in positions)
+        continue
+      writer.writerows(positions)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  if buffer.tell(): # csv header of an empty journal
+    yield buffer.getvalue()
+
+def export_row(row) -> dict:
+  # same values as the JSON response (schemas.Position): dates as midnight datetimes
+  position = dict(zip(EXPORT_FIELDS, row))
+  for field in ("open_date", "close_date"):
+    if position[field] is not None:
+      position[field] = datetime.combine(position[field], datetime.min.time()).isoformat()
+  return position
+
+IMPORT_FIELDS = [field for field in schemas.Position.model_fields if field != "id"]
+
+def import_positions(db: Session, user_id: int, lines, chunk_size: int = 1000, redis_client=None) -> schemas.Import_Report:
+  """
+  Bulk import of a CSV journal (the columns of the csv export; unknown columns and `id` are ignored).
+  The file is parsed as it is read and written `chunk_size` rows per transaction. Tickers and option chains are
+  validated once for the whole file, each chunk's new ones with batched provider calls. Invalid rows are skipped
+  and reported with their line number.
+  Option strikes are checked against the listed chain while it is still listed; contracts already expired can no longer be.
+  """
+  report = schemas.Import_Report()
+  started = time.perf_counter()
+  validated = {"prices": {}, "strikes": {}} # ticker -> close (None: not found), chain -> listed strikes, shared by every chunk
+  chunk = []
+  for line, row in enumerate(csv.DictReader(lines), start=2):
+    chunk.append((line, row))
+    if len(chunk) == chunk_size:
+      import_chunk(db, user_id, chunk, validated, report, redis_client)
+      chunk = []
+  if chunk:
+    import_chunk(db, user_id, chunk, validated, report, redis_client)
+  report.errors.sort(key=lambda error: error.row) # parse errors are found before a chunk's lookup errors
+  report.failed = len(report.errors)
+  report.duration = round(time.perf_counter() - started, 3)
+  return report
+
+def import_chunk(db: Session, user_id: int, chunk: list[tuple], validated: dict, report: schemas.Import_Report, redis_client=None):
+  from tickers import service as tickers_service # imported here: tickers.service imports this module
+  report.rows += len(chunk)
+  parsed = []
+  for line, row in chunk:
+    try:
+      parsed.append((line, parse_import_row(row)))
+    except ValueError as e:
+      report.errors.append(schemas.Import_Error(row=line, error=import_error(e)))
+
+  prices, strikes = validated["prices"], validated["strikes"]
+  unavailable = {}
+  new_tickers = sorted({position.ticker for _, position in parsed if position.ticker not in prices})
+  if new_tickers:
+    try:
+      found = tickers_service.get_closed_prices(db, new_tickers, redis_client)
+      prices.update({ticker: found.get(ticker) for ticker in new_tickers})
+    except Exception as e: # provider down: not cached, the next chunk tries again
+      unavailable = dict.fromkeys(new_tickers, f"Market data unavailable: {e}")
+  new_chains = sorted({chain_key(position) for _, position in parsed if is_listed_option(position)} - strikes.keys())
+  if new_chains:
+    listed = tickers_service.get_listed_strikes(db, new_chains)
+    strikes.update({key: {(kind, round(strike, 2)) for kind, strike in listed.get(key, ())} for key in new_chains})
+
+  rows = []
+  for line, position in parsed:
+    error = unavailable.get(position.ticker)
+    if error is None and prices.get(position.ticker) is None:
+      error = "No data found, symbol may be delisted."
+    if error is None and is_listed_option(position) and (position.category.value, round(position.trade_price, 2)) not in strikes[chain_key(position)]:
+      error = "No data found, strike price may not be correct."
+    if error is not None:
+      report.errors.append(schemas.Import_Error(row=line, error=error))
+      continue
+    rows.append({**position.model_dump(exclude={"id"}), "category": position.category.value, "owner_id": user_id})
+  if not rows:
+    return
+
+  open_days = [row["open_date"].toordinal() if row["open_date"] else None for row in rows]
+  close_days = [row["close_date"].toordinal() if row["close_date"] else None for row in rows]
+  columns = {name: tuple(row[name] for row in rows) for name in ("owner_id", "ticker", "category", "qty", "option_price", "trade_price", "closed_price", "is_active")}
+  columns.update(open_day=tuple(open_days), close_day=tuple(close_days), last_price=tuple(prices[row["ticker"]] for row in rows))
+  repository.apply_position_summary_deltas(db, summarize(columns)) # one delta per touched group, committed together with the chunk
+  repository.create_positions(db, rows)
+  report.imported += len(rows)
+
+def parse_import_row(row: dict) -> schemas.Position:
+  """ Validate one CSV row (empty cells fall back to the field defaults) with the rules of POST /positions/. """
+  values = {key.strip().lower(): value.strip() for key, value in row.items() if key and isinstance(value, str) and value.strip()}
+  position = schemas.Position.model_validate({field: values[field] for field in IMPORT_FIELDS if field in values})
+  position.ticker = position.ticker.upper()
+  if position.category in (schemas.PositionType.call, schemas.PositionType.put):
+    if position.close_date is None:
+      raise ValueError("Option positions must have an expire date.")
+    if position.category == schemas.PositionType.call and position.trade_price < 0:
+      raise ValueError("Call option strike price must be non-negative.")
+    if position.category == schemas.PositionType.put and position.trade_price <= 0:
+      raise ValueError("Put option strike price must be positive.")
+  return position
+
+def import_error(error: ValueError) -> str:
+  if isinstance(error, ValidationError):
+    return "; ".join(f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+  return str(error)
+
+def is_listed_option(position: schemas.Position) -> bool:
+  # the provider only lists unexpired chains
+  return position.category in (schemas.PositionType.call, schemas.PositionType.put) and position.close_date.date() >= date.today()
+
+def chain_key(position: schemas.Position) -> tuple:
+  return (position.ticker, datetime.combine(position.close_date.date(), datetime.min.time()))
 
 def update_position(db: Session, position_id: int, position: schemas.Position) -> schemas.Position | None:
   try:
     existing_position = repository.get_position_by_id(db, position_id) # check if exiting in database
     if existing_position:
+      apply_summary_delta(db, existing_position, -1) # take the old version out of its summary...
       for attr, value in position.model_dump(exclude_unset=True).items(): # only returns fields the user sent
         if value and getattr(existing_position, attr) != value: # loop and check if new value is not empty and not the same as existing ones 
           setattr(existing_position, attr, value) # otherwise, set the new value
-      
+      apply_summary_delta(db, existing_position, 1) # ...and add the new one (ticker/category may have changed)
       position = repository.update_position(db, existing_position)
       return schemas.Position.model_validate(position)
     else: 
@@ -42,6 +210,7 @@ def remove_position(db: Session, position_id: int):
   try:
     existing_position = repository.get_position_by_id(db, position_id) # check if exiting in database
     if existing_position:
+      apply_summary_delta(db, existing_position, -1)
       repository.remove_position(db, existing_position)
       return existing_position
     else:
@@ -49,4 +218,258 @@ def remove_position(db: Session, position_id: int):
   except Exception as e:
     print(f"Error removing position by id: {e}")
 
+SUMMARY_COUNTS = ["open_positions", "closed_positions", "wins", "held_positions"]
+SUMMARY_TOTALS = ["realized_pnl", "hold_days", "open_qty", "open_cost", "unrealized_pnl", "exposure"]
+
+def position_contributions(columns: dict[str, tuple]) -> dict[str, np.ndarray]:
+  """
+  What each position adds to its (owner, ticker, category) summary, computed with NumPy over a column batch
+  (see repository.get_position_columns_by_owner_id).
+  - stocks: Long (last - trade_price) * qty, Short (trade_price - last) * qty; realized with closed_price instead of last.
+  - options: trade_price is the strike and option_price the premium paid. Open contracts are valued at their
+    intrinsic value at the underlying's last close (a lower bound, time value is unknown); closed ones at closed_price.
+  A position is closed (realized) once it is inactive and has a closed_price.
+  """
+  def floats(name: str) -> np.ndarray:
+    return np.array(columns[name], dtype=float) # None -> nan
+
+  category = np.array(columns["category"], dtype=object)
+  qty = np.nan_to_num(floats("qty"))
+  premium = np.nan_to_num(floats("option_price"))
+  trade_price = np.nan_to_num(floats("trade_price"))
+  closed_price = floats("closed_price")
+  last = floats("last_price")
+  is_active = floats("is_active") != 0 # stored as 0/1, NULL (nan) counts as active
+  hold_days = floats("close_day") - floats("open_day")
+
+  is_stock = (category == "Long") | (category == "Short")
+  is_call = category == "Call"
+  sign = np.where((category == "Short") | (category == "Put"), -1.0, 1.0)
+  closed = ~is_active & ~np.isnan(closed_price)
+  is_open = ~closed
+  priced = is_open & ~np.isnan(last)
+
+  # stocks: signed price move; options: value now (intrinsic) or at close, minus the premium paid
+  intrinsic = np.where(is_call, np.maximum(last - trade_price, 0), np.maximum(trade_price - last, 0))
+  open_cost = np.where(is_stock, sign * trade_price, premium) * qty
+  value = np.where(is_stock, sign * last, intrinsic) * qty
+  realized = np.where(is_stock, (closed_price - trade_price) * sign, closed_price - premium) * qty
+  held = closed & ~np.isnan(hold_days)
+  return {
+    "open_positions": is_open.astype(int),
+    "closed_positions": closed.astype(int),
+    "wins": (closed & (realized > 0)).astype(int),
+    "held_positions": held.astype(int),
+    "realized_pnl": np.where(closed, realized, 0),
+    "hold_days": np.where(held, hold_days, 0),
+    "open_qty": np.where(is_open, sign * qty, 0),
+    "open_cost": np.where(is_open, open_cost, 0),
+    "unrealized_pnl": np.where(priced, value - open_cost, 0),
+    "exposure": np.where(priced, last * sign * qty, 0),
+  }
+
+def summarize(columns: dict[str, tuple]) -> list[dict]:
+  """ Summary rows (one per owner, ticker and category) of a column batch of positions. """
+  if len(columns["ticker"]) == 0:
+    return []
+  frame = pd.DataFrame(position_contributions(columns))
+  frame["owner_id"], frame["ticker"], frame["category"] = columns["owner_id"], columns["ticker"], columns["category"]
+  frame["last_price"] = np.array(columns["last_price"], dtype=float)
+  groups = frame.groupby(["owner_id", "ticker", "category"], sort=True)
+  summary = groups[SUMMARY_COUNTS + SUMMARY_TOTALS].sum()
+  summary["last_price"] = groups["last_price"].first() # one ticker per group, so one price
+  summary = summary.reset_index().astype(object)
+  return summary.where(pd.notna(summary), None).to_dict(orient="records")
+
+def summary_delta(db: Session, position: models.Position, sign: int) -> dict:
+  """ What adding (sign=1) or removing (sign=-1) `position` changes in its summary row, valued at the ticker's close. """
+  open_day = position.open_date.toordinal() if position.open_date else None # differences match julianday()
+  close_day = position.close_date.toordinal() if position.close_date else None
+  last_price = repository.get_last_price(db, position.ticker)
+  category = getattr(position.category, "value", position.category)
+  columns = {
+    "owner_id": (position.owner_id,), "ticker": (position.ticker,), "category": (category,), "qty": (position.qty,),
+    "option_price": (position.option_price,), "trade_price": (position.trade_price,), "closed_price": (position.closed_price,),
+    "is_active": (position.is_active,), "open_day": (open_day,), "close_day": (close_day,), "last_price": (last_price,),
+  }
+  delta = {name: sign * values[0].item() for name, values in position_contributions(columns).items()}
+  return {"owner_id": position.owner_id, "ticker": position.ticker, "category": category, **delta, "last_price": last_price}
+
+def apply_summary_delta(db: Session, position: models.Position, sign: int):
+  # groups are kept valued at the current close (the ticker refresh calls revalue_summaries), so deltas simply add up
+  repository.apply_position_summary_deltas(db, [summary_delta(db, position, sign)])
+
+def revalue_summaries(db: Session, tickers: list[str]):
+  """
+  Revalue the open positions of every summary on `tickers` at the tickers' current close (called whenever
+  tickers.service changes closed_price). Exposure and stock P&L are updated in SQL; option groups are re-summed from their open
+  contracts, since intrinsic value is not linear in the price.
+  """
+  if not tickers:
+    return
+  repository.revalue_position_summaries(db, tickers)
+  columns = repository.get_open_option_position_columns_by_tickers(db, tickers)
+  rows = [
+    {key: row[key] for key in ("owner_id", "ticker", "category", "unrealized_pnl")}
+    for row in summarize(columns)
+  ]
+  repository.bulk_update_position_summaries(db, rows)
+
+def defer_revalue(tickers: list[str]):
+  """
+  Queue `tickers` for revalue_summaries on the io pool, so a quote fetched for a request does not wait for the
+  summary rewrite and a burst of quotes shares one revalue. The nightly refresh revalues its tickers directly.
+  """
+  global _revalue_scheduled
+  if not tickers:
+    return
+  with _revalue_lock:
+    _pending_revalue.update(tickers)
+    if _revalue_scheduled:
+      return
+    _revalue_scheduled = True
+  executors.io_executor().submit(revalue_pending)
+
+def revalue_pending():
+  """ Revalue the summaries of the tickers queued by defer_revalue (in this worker). """
+  global _revalue_scheduled
+  with _revalue_lock:
+    tickers = sorted(_pending_revalue)
+    _pending_revalue.clear()
+    _revalue_scheduled = False
+  if not tickers:
+    return
+  try:
+    with SessionLocal() as db:
+      revalue_summaries(db, tickers)
+  except Exception as e: # the nightly refresh revalues them again
+    logger.warning("position summaries: revalue of %s failed: %s", ", ".join(tickers), e)
+
+def get_summary_rows(db: Session, user_id: int) -> list[dict]:
+  """ The materialized summaries of a user as plain rows, the input of get_analytics. """
+  return [
+    {column: getattr(row, column) for column in ["ticker", "category", "last_price"] + SUMMARY_COUNTS + SUMMARY_TOTALS}
+    for row in repository.get_position_summaries(db, user_id)
+  ]
+
+def get_analytics(summaries: list[dict]) -> schemas.Position_Analytics:
+  """
+  Portfolio P&L of a user from their summary rows (get_summary_rows: one row per ticker and category, maintained
+  incrementally by create/update/remove_position and revalued by the ticker refresh). Pure pandas, no I/O.
+  """
+  if not summaries:
+    return schemas.Position_Analytics()
+  frame = pd.DataFrame(summaries)
+  totals = frame[SUMMARY_COUNTS + SUMMARY_TOTALS].sum()
+  open_frame = frame[frame["open_positions"] > 0]
+  analytics = schemas.Position_Analytics(
+    positions=int(totals["open_positions"] + totals["closed_positions"]),
+    open_positions=int(totals["open_positions"]),
+    closed_positions=int(totals["closed_positions"]),
+    unpriced_positions=int(open_frame.loc[open_frame["last_price"].isna(), "open_positions"].sum()),
+    unrealized_pnl=round(float(totals["unrealized_pnl"]), 2),
+    realized_pnl=round(float(totals["realized_pnl"]), 2),
+    win_rate=round(float(totals["wins"] / totals["closed_positions"]), 4) if totals["closed_positions"] else None,
+    avg_hold_days=round(float(totals["hold_days"] / totals["held_positions"]), 1) if totals["held_positions"] else None,
+    exposure_by_ticker=group_exposure(open_frame, "ticker"),
+    exposure_by_category=group_exposure(open_frame, "category"),
+  )
+  analytics.total_pnl = round(analytics.unrealized_pnl + analytics.realized_pnl, 2)
+  return analytics
+
+def group_exposure(frame: pd.DataFrame, key: str) -> dict[str, schemas.Exposure]:
+  """ Open positions, exposure and unrealized P&L summed per key (ticker or category). """
+  groups = frame.groupby(key)[["open_positions", "exposure", "unrealized_pnl"]].sum()
+  return {
+    str(label): schemas.Exposure(positions=int(row.open_positions), exposure=round(float(row.exposure), 2), unrealized_pnl=round(float(row.unrealized_pnl), 2))
+    for label, row in groups.iterrows()
+  }
+
+def option_expiries(columns: dict) -> pd.DatetimeIndex:
+  return pd.to_datetime(np.array(columns["close_day"], dtype=float) - 2440587.5, unit="D").normalize() # julian day -> date
+
+def get_greeks_inputs(db: Session, user_id: int, batch_size: int = 100) -> tuple[dict, dict]:
+  """
+  The reads behind get_greeks: the open option positions of a user (column lists) and the stored chain snapshot
+  quotes of their contracts, keyed by (ticker, expiry, kind, strike).
+  """
+  columns = repository.get_open_option_position_columns_by_owner_id(db, user_id)
+  quotes = {}
+  if len(columns["id"]) == 0:
+    return columns, quotes
+  chain_keys = sorted({(ticker, expiry.to_pydatetime()) for ticker, expiry in zip(columns["ticker"], option_expiries(columns)) if not pd.isna(expiry)})
+  for i in range(0, len(chain_keys), batch_size): # bounded OR per query
+    for _, ticker, expire_date, kind, strike, bid, ask, iv in tickers_repository.get_options_by_chain(db, chain_keys[i:i + batch_size]):
+      quotes[(ticker, expire_date, kind, round(strike, 2))] = (bid, ask, iv)
+  return columns, quotes
+
+def get_greeks(columns: dict, quotes: dict) -> schemas.Portfolio_Greeks:
+  """
+  Greeks of every open option position of a user (get_greeks_inputs), evaluated in one vectorized call (tickers.greeks):
+  strike = trade_price, expiry = close_date, underlying at its last stored close, volatility solved from the stored
+  chain snapshot's bid/ask. Positions are long contracts (the premium is paid), scaled by qty like the P&L. No I/O.
+  """
+  if len(columns["id"]) == 0:
+    return schemas.Portfolio_Greeks()
+  expiries = option_expiries(columns)
+  contract_quotes = [
+    quotes.get((ticker, expiry.to_pydatetime(), kind, round(strike or 0, 2)), (None, None, None)) if not pd.isna(expiry) else (None, None, None)
+    for ticker, expiry, kind, strike in zip(columns["ticker"], expiries, columns["category"], columns["trade_price"])
+  ]
+  bids, asks, ivs = (np.array(values, dtype=float) for values in zip(*contract_quotes))
+  result = greeks.evaluate_contracts(
+    np.array(columns["last_price"], dtype=float), np.array(columns["trade_price"], dtype=float), expiries,
+    np.array(columns["category"], dtype=object) == "Call", bids, asks, ivs, settings.RISK_FREE_RATE,
+  )
+  qty = np.nan_to_num(np.array(columns["qty"], dtype=float))
+  priced = ~np.isnan(result["iv"]) & ~np.isnan(result["price"]) & ~np.isnan(result["years"])
+  frame = pd.DataFrame({name: np.where(priced, result[name] * qty, np.nan) for name in ("delta", "gamma", "theta", "vega")})
+  frame["ticker"] = columns["ticker"]
+
+  def optional(value) -> float | None:
+    return None if np.isnan(value) else round(float(value), 6)
+
+  positions = [
+    schemas.Position_Greeks(
+      id=columns["id"][i], ticker=columns["ticker"][i], category=columns["category"][i], qty=columns["qty"][i],
+      strike_price=columns["trade_price"][i], expire_date=expiries[i].to_pydatetime(), spot=columns["last_price"][i],
+      iv=optional(result["iv"][i]), price=optional(np.where(priced[i], result["price"][i], np.nan)),
+      **{name: optional(frame[name].iat[i]) for name in ("delta", "gamma", "theta", "vega")},
+    )
+    for i in range(len(frame))
+  ]
+  totals = frame[["delta", "gamma", "theta", "vega"]].sum() # NaN (unpriced) rows are skipped
+  by_ticker = frame.groupby("ticker")[["delta", "gamma", "theta", "vega"]].sum()
+  return schemas.Portfolio_Greeks(
+    positions=positions,
+    unpriced_positions=int((~priced).sum()),
+    totals=schemas.Greeks(**{name: round(float(value), 6) for name, value in totals.items()}),
+    by_ticker={str(ticker): schemas.Greeks(**{name: round(float(value), 6) for name, value in row.items()}) for ticker, row in by_ticker.iterrows()},
+  )
+
+def check_summaries(db: Session, user_ids: list[int] | None = None, repair: bool = False, tolerance: float = 0.01) -> list[dict]:
+  """
+  Consistency check: rebuild the summaries of `user_ids` (every owner by default) from scratch and diff them with
+  the stored ones. Returns one entry per mismatching group; with `repair` the rebuilt rows replace the stored ones.
+  """
+  diffs = []
+  for user_id in user_ids if user_ids is not None else repository.get_position_owner_ids(db):
+    expected = {(row["ticker"], row["category"]): row for row in summarize(repository.get_position_columns_by_owner_id(db, user_id))}
+    stored = {(row.ticker, row.category): row for row in repository.get_position_summaries(db, user_id)}
+    mismatched = False
+    for key in sorted(expected.keys() | stored.keys()):
+      row, actual = expected.get(key), stored.get(key)
+      fields = {}
+      for column in SUMMARY_COUNTS + SUMMARY_TOTALS:
+        want = row[column] if row else 0
+        have = getattr(actual, column) if actual else 0
+        if abs((want or 0) - (have or 0)) > tolerance:
+          fields[column] = {"expected": want, "stored": have}
+      if fields:
+        diffs.append({"owner_id": user_id, "ticker": key[0], "category": key[1], "fields": fields})
+        mismatched = True
+    if repair and mismatched:
+      repository.replace_position_summaries(db, user_id, list(expected.values()))
+  return diffs
+
 # todo: weekly cron job to auto-close positions on expiry date
\ No newline at end of file
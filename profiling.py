@@ -0,0 +1,344 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+import executors
+import settings
+
+logger = logging.getLogger(__name__)
+
+# On-demand profiles of single requests, written to PROFILE_DIR and listed at GET /admin/profiles:
+# - triggered by an X-Profile header sent with an admin's token (ADMIN_USERS), or for a PROFILE_SAMPLE_RATE fraction
+#   of the requests under PROFILE_SAMPLE_PATHS (adjustable at runtime, PUT /admin/profiling)
+# - a sampler thread records the stacks of the threads working on the request every PROFILE_INTERVAL seconds: the
+#   event loop thread, and io/fetch pool threads while they run a task submitted on its behalf (see track)
+# - a report holds the wall time, the CPU time of that work, the hottest functions and the stacks in folded form
+#   (one "frame;frame;frame count" line per stack, as read by flamegraph.pl and speedscope)
+# Requests not profiled pay one header scan (and a random draw when sampling is on).
+
+PROFILE_HEADER = b"x-profile"
+EVENT_LOOP = "event-loop"
+_ID = re.compile(r"[0-9a-f]{32}")
+_ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+_current: contextvars.ContextVar["RequestProfile | None"] = contextvars.ContextVar("request_profile", default=None)
+
+def _frame_label(code) -> str:
+  path = code.co_filename
+  if path.startswith(_ROOT):
+    path = path[len(_ROOT):]
+  else: # libraries: the package and module name are enough
+    path = "/".join(path.split(os.sep)[-2:])
+  name = getattr(code, "co_qualname", code.co_name) # Python 3.11+: Class.method
+  return f"{name} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+class RequestProfile:
+  """ Stack samples and CPU time of the threads working on one request. """
+  def __init__(self, method: str, path: str, query: str, trigger: str, interval: float):
+    self.id = uuid.uuid4().hex
+    self.method, self.path, self.query, self.trigger = method, path, query, trigger
+    self.interval = interval
+    self.started_at = datetime.now(timezone.utc)
+    self.status = None
+    self.wall = 0.0
+    self._started = time.perf_counter()
+    self._threads: dict[int, list] = {} # thread id -> [group, nesting depth, thread CPU time when it started]
+    self._cpu = Counter() # thread group -> CPU seconds spent on the request
+    self._samples = Counter() # thread group -> samples
+    self._stacks = Counter() # folded stack -> samples
+    self._labels = {} # code object -> frame label
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._sampler = None
+
+  def enter(self, group: str | None = None):
+    """ Sample the calling thread until the matching leave(); `group` names it in the report (default: its pool). """
+    ident = threading.get_ident()
+    with self._lock:
+      state = self._threads.get(ident)
+      if state is not None: # nested tracked work on the same thread: already counted
+        state[1] += 1
+        return
+      group = group or threading.current_thread().name.rsplit("_", 1)[0] # io_3 -> io
+      self._threads[ident] = [group, 1, time.thread_time()]
+
+  def leave(self):
+    ident = threading.get_ident()
+    with self._lock:
+      state = self._threads[ident]
+      state[1] -= 1
+      if state[1] == 0:
+        del self._threads[ident]
+        self._cpu[state[0]] += time.thread_time() - state[2]
+
+  def start(self):
+    self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id[:8]}", daemon=True)
+    self._sampler.start()
+
+  def stop(self):
+    self.wall = time.perf_counter() - self._started
+    self._stop.set()
+    if self._sampler is not None:
+      self._sampler.join()
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      self.sample()
+
+  def sample(self):
+    frames = sys._current_frames()
+    with self._lock:
+      threads = [(ident, state[0]) for ident, state in self._threads.items()]
+    for ident, group in threads:
+      frame = frames.get(ident)
+      stack = []
+      while frame is not None and frame.f_code not in _ROOTS:
+        label = self._labels.get(frame.f_code)
+        if label is None:
+          label = self._labels[frame.f_code] = _frame_label(frame.f_code)
+        stack.append(label)
+        frame = frame.f_back
+      stack.append(group) # root frame: which thread (pool) the work ran on
+      with self._lock:
+        self._stacks[";".join(reversed(stack))] += 1
+        self._samples[group] += 1
+
+  def folded(self) -> str:
+    with self._lock:
+      return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+  def report(self, top: int = 25) -> dict:
+    with self._lock:
+      stacks, samples, cpu = dict(self._stacks), dict(self._samples), dict(self._cpu)
+    inclusive, own = Counter(), Counter()
+    for stack, count in stacks.items():
+      frames = stack.split(";")[1:]
+      if frames:
+        own[frames[-1]] += count
+      for frame in set(frames): # a recursive function counts once per sample
+        inclusive[frame] += count
+    total = sum(samples.values())
+    cpu_total = sum(cpu.values())
+    return {
+      "id": self.id,
+      "method": self.method,
+      "path": self.path,
+      "query": self.query,
+      "status": self.status,
+      "trigger": self.trigger,
+      "started_at": self.started_at.isoformat(),
+      "wall_seconds": round(self.wall, 6),
+      # thread CPU time of the tracked work; the event loop's share includes other requests served meanwhile
+      "cpu_seconds": round(cpu_total, 6),
+      "cpu_ratio": round(cpu_total / self.wall, 3) if self.wall else None,
+      "interval_seconds": self.interval,
+      "samples": total,
+      "threads": {group: {"samples": samples.get(group, 0), "cpu_seconds": round(cpu.get(group, 0.0), 6)} for group in sorted(set(samples) | set(cpu))},
+      # share of the samples in which a function was on the stack (inclusive) or running itself (own)
+      "inclusive": [{"frame": frame, "samples": count, "share": round(count / total, 3)} for frame, count in inclusive.most_common(top)],
+      "own": [{"frame": frame, "samples": count, "share": round(count / total, 3)} for frame, count in own.most_common(top)],
+    }
+
+def track(fn, *args, **kwargs):
+  """
+  Run `fn(*args, **kwargs)`, sampling the calling thread meanwhile if the context it runs in belongs to a profiled
+  request. The executors run submitted tasks through it, in the context copied from the submitter.
+  """
+  profile = _current.get()
+  if profile is None:
+    return fn(*args, **kwargs)
+  profile.enter()
+  try:
+    return fn(*args, **kwargs)
+  finally:
+    profile.leave()
+
+# where the stacks are cut: the thread machinery below them is the same in every sample
+_ROOTS = {track.__code__, asyncio.BaseEventLoop._run_once.__code__}
+
+def _header(scope, name: bytes) -> str | None:
+  for key, value in scope.get("headers", []):
+    if key == name:
+      return value.decode("latin-1")
+  return None
+
+class Profiler:
+  """
+  Decides which requests are profiled and keeps their reports: `<id>.json` (summary) and `<id>.folded` (stacks) in
+  `directory`, the oldest deleted past `max_reports`. At most `max_concurrent` requests are profiled at once.
+  """
+  def __init__(self, directory: str, interval: float, sample_rate: float, sample_paths: list[str], max_reports: int = 200, max_concurrent: int = 2):
+    self.directory = directory
+    self.interval = interval
+    self.sample_rate = sample_rate
+    self.sample_paths = tuple(sample_paths)
+    self.max_reports = max_reports
+    self.max_concurrent = max_concurrent
+    self._active = 0
+    self._lock = threading.Lock()
+    self._stats = {"profiled": 0, "requested": 0, "sampled": 0, "refused": 0, "busy": 0, "saved": 0, "save_errors": 0}
+
+  def _count(self, counter: str):
+    with self._lock:
+      self._stats[counter] += 1
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {**self._stats, "active": self._active, "sample_rate": self.sample_rate, "sample_paths": list(self.sample_paths)}
+
+  def configure(self, sample_rate: float | None = None, sample_paths: list[str] | None = None):
+    """ Change the sampling of this worker (until restart; other workers keep theirs). """
+    if sample_rate is not None:
+      self.sample_rate = sample_rate
+    if sample_paths is not None:
+      self.sample_paths = tuple(sample_paths)
+
+  async def trigger(self, scope) -> str | None:
+    """ Why `scope`'s request should be profiled ("header" or "sample"), None when it should not. """
+    if _header(scope, PROFILE_HEADER) is not None:
+      if await self._admin_token(scope):
+        return "header"
+      self._count("refused") # not an admin: served unprofiled
+    if self.sample_rate > 0 and scope["path"].startswith(self.sample_paths) and random.random() < self.sample_rate:
+      return "sample"
+    return None
+
+  async def _admin_token(self, scope) -> bool:
+    from auth import jwt, service # lazy: the executors import this module, it must not load the auth package with them
+    scheme, _, token = (_header(scope, b"authorization") or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+      return False
+    token_data = await jwt.decode_access_token(token)
+    return token_data is not None and token_data.is_active is not False and service.is_admin(token_data.username)
+
+  def begin(self, scope, trigger: str) -> RequestProfile | None:
+    with self._lock:
+      if self._active >= self.max_concurrent:
+        self._stats["busy"] += 1
+        return None
+      self._active += 1
+      self._stats["profiled"] += 1
+      self._stats["requested" if trigger == "header" else "sampled"] += 1
+    profile = RequestProfile(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), trigger, self.interval)
+    profile.start()
+    return profile
+
+  def end(self, profile: RequestProfile):
+    profile.stop()
+    with self._lock:
+      self._active -= 1
+
+  def save(self, profile: RequestProfile):
+    """ Write `profile`'s report and stacks, then delete the reports past max_reports. """
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      base = os.path.join(self.directory, profile.id)
+      with open(f"{base}.folded", "w") as f:
+        f.write(profile.folded())
+      with open(f"{base}.json", "w") as f: # written last: listed reports always have their stacks
+        json.dump(profile.report(), f, indent=2)
+      self._count("saved")
+      self._prune()
+    except OSError as e:
+      self._count("save_errors")
+      logger.warning("profiling: could not save profile %s: %s", profile.id, e)
+
+  def _reports(self) -> list[str]:
+    # report paths, newest first
+    try:
+      names = [name for name in os.listdir(self.directory) if name.endswith(".json") and _ID.fullmatch(name[:-5])]
+    except FileNotFoundError:
+      return []
+    paths = [os.path.join(self.directory, name) for name in names]
+    return sorted(paths, key=lambda path: os.stat(path).st_mtime, reverse=True)
+
+  def _prune(self):
+    for path in self._reports()[self.max_reports:]:
+      for suffix in (".json", ".folded"):
+        try:
+          os.remove(path[:-5] + suffix)
+        except FileNotFoundError: # pruned by another worker
+          pass
+
+  def reports(self, limit: int = 50) -> list[dict]:
+    """ Summaries of the latest `limit` reports (every worker's, they share the directory), newest first. """
+    summaries = []
+    for path in self._reports()[:limit]:
+      try:
+        with open(path) as f:
+          report = json.load(f)
+      except (OSError, ValueError): # deleted or being written meanwhile
+        continue
+      summaries.append({key: report[key] for key in (
+        "id", "method", "path", "query", "status", "trigger", "started_at", "wall_seconds", "cpu_seconds", "samples",
+      )})
+    return summaries
+
+  def report(self, profile_id: str) -> dict | None:
+    if not _ID.fullmatch(profile_id):
+      return None
+    try:
+      with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return None
+
+  def folded(self, profile_id: str) -> str | None:
+    if not _ID.fullmatch(profile_id):
+      return None
+    try:
+      with open(os.path.join(self.directory, f"{profile_id}.folded")) as f:
+        return f.read()
+    except OSError:
+      return None
+
+class ProfilingMiddleware:
+  """
+  ASGI middleware profiling the requests the profiler picks; their responses carry X-Profile-Id, the id of the
+  report saved once the response is sent.
+  """
+  def __init__(self, app, profiler: "Profiler | None" = None):
+    self.app = app
+    self.profiler = profiler or request_profiler
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      return await self.app(scope, receive, send)
+    trigger = await self.profiler.trigger(scope)
+    profile = self.profiler.begin(scope, trigger) if trigger else None
+    if profile is None:
+      return await self.app(scope, receive, send)
+
+    async def send_with_id(message):
+      if message["type"] == "http.response.start":
+        profile.status = message["status"]
+        message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]}
+      await send(message)
+
+    token = _current.set(profile)
+    profile.enter(EVENT_LOOP)
+    try:
+      await self.app(scope, receive, send_with_id)
+    finally:
+      profile.leave()
+      _current.reset(token)
+      self.profiler.end(profile)
+      await executors.run_io(self.profiler.save, profile)
+
+request_profiler = Profiler(
+  directory=settings.PROFILE_DIR,
+  interval=settings.PROFILE_INTERVAL,
+  sample_rate=settings.PROFILE_SAMPLE_RATE,
+  sample_paths=settings.PROFILE_SAMPLE_PATHS,
+  max_reports=settings.PROFILE_MAX_REPORTS,
+  max_concurrent=settings.PROFILE_MAX_CONCURRENT,
+)
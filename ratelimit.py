@@ -0,0 +1,183 @@
+import itertools
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import NamedTuple
+import redis
+from redis_client import get_async_redis_client, health as redis_health
+import settings
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+# Sliding-window log of one client, checked and updated atomically in one round trip.
+# KEYS: the client's window (sorted set of request units scored by time, ms); ARGV: now, window (ms), capacity, cost,
+# request id. Returns {allowed (0/1), remaining units, ms until a unit frees up (allowed) or the cost fits (refused)}.
+SLIDING_WINDOW_SCRIPT = """
+local now, window, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local used = redis.call('ZCARD', KEYS[1])
+if used + cost <= capacity then
+  local members = {}
+  for i = 1, cost do
+    members[#members + 1] = now
+    members[#members + 1] = ARGV[5] .. ':' .. i
+  end
+  redis.call('ZADD', KEYS[1], unpack(members))
+  redis.call('PEXPIRE', KEYS[1], window)
+  local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+  return {1, capacity - used - cost, tonumber(oldest[2]) + window - now}
+end
+local needed = redis.call('ZRANGE', KEYS[1], used + cost - capacity - 1, used + cost - capacity - 1, 'WITHSCORES')
+local retry = window
+if needed[2] then retry = tonumber(needed[2]) + window - now end
+return {0, capacity - used, retry}
+"""
+
+class Decision(NamedTuple):
+  allowed: bool
+  remaining: int
+  reset: float # seconds until a unit frees up (allowed) or until the refused request would fit
+
+class SlidingWindowLimiter:
+  """
+  Per-client sliding-window limiter: each client may spend RATE_LIMIT_CAPACITY units over any RATE_LIMIT_WINDOW
+  seconds, a request costing the weight of its route (RATE_LIMIT_COSTS, 1 by default, 0 for exempt routes).
+  - with Redis: the window is shared by every worker and checked by one script call (SLIDING_WINDOW_SCRIPT).
+  - without Redis (circuit open or a failed call): an in-process window per client, bounded to
+    RATE_LIMIT_LOCAL_CLIENTS clients (least recently seen evicted); each worker then limits on its own.
+  """
+  def __init__(self, capacity: int, window: float, costs: dict[str, int], max_local_clients: int = 10000):
+    self.capacity = capacity
+    self.window = window
+    self.costs = sorted(costs.items(), key=lambda item: len(item[0]), reverse=True) # longest prefix first
+    self.max_local_clients = max_local_clients
+    self._ids = itertools.count()
+    self._origin = uuid.uuid4().hex[:8]
+    self._script = None
+    self._local: OrderedDict[str, deque] = OrderedDict() # client -> (time, cost) of the requests in its window
+    self._lock = threading.Lock()
+    self._stats = {"allowed": 0, "limited": 0, "redis_checks": 0, "local_checks": 0, "redis_errors": 0}
+
+  def _count(self, counter: str):
+    with self._lock:
+      self._stats[counter] += 1
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {**self._stats, "local_clients": len(self._local), "capacity": self.capacity, "window": self.window}
+
+  def cost(self, path: str) -> int:
+    for prefix, cost in self.costs:
+      if path.startswith(prefix):
+        return cost
+    return 1
+
+  async def hit(self, client: str, cost: int) -> Decision:
+    """ Spend `cost` units of `client`'s window if they are available. """
+    redis_client = get_async_redis_client()
+    decision = None
+    if redis_client is not None:
+      try:
+        decision = await self._hit_redis(redis_client, client, cost)
+        self._count("redis_checks")
+      except redis.exceptions.RedisError as e:
+        self._count("redis_errors")
+        redis_health.record_failure(e)
+        logger.warning("ratelimit: redis unavailable, limiting locally: %s", e)
+    if decision is None:
+      decision = self.hit_local(client, cost, time.time())
+      self._count("local_checks")
+    self._count("allowed" if decision.allowed else "limited")
+    return decision
+
+  async def _hit_redis(self, redis_client, client: str, cost: int) -> Decision:
+    if self._script is None:
+      self._script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+    now_ms = int(time.time() * 1000)
+    request_id = f"{self._origin}{next(self._ids)}"
+    allowed, remaining, reset_ms = await self._script(
+      keys=[f"{RATE_LIMIT_PREFIX}{client}"], args=[now_ms, int(self.window * 1000), self.capacity, cost, request_id], client=redis_client,
+    )
+    return Decision(bool(allowed), int(remaining), max(int(reset_ms), 0) / 1000)
+
+  def hit_local(self, client: str, cost: int, now: float) -> Decision:
+    with self._lock:
+      requests = self._local.get(client)
+      if requests is None:
+        requests = self._local[client] = deque()
+        while len(self._local) > self.max_local_clients:
+          self._local.popitem(last=False)
+      else:
+        self._local.move_to_end(client)
+      while requests and requests[0][0] <= now - self.window:
+        requests.popleft()
+      used = sum(units for _, units in requests)
+      if used + cost <= self.capacity:
+        requests.append((now, cost))
+        return Decision(True, self.capacity - used - cost, requests[0][0] + self.window - now)
+      freed, retry = 0, self.window
+      for started, units in requests: # oldest first: wait until enough units have left the window
+        freed += units
+        if used - freed + cost <= self.capacity:
+          retry = started + self.window - now
+          break
+      return Decision(False, self.capacity - used, retry)
+
+def client_key(scope) -> str:
+  # the peer address; behind a proxy (RATE_LIMIT_TRUST_FORWARDED) the first X-Forwarded-For hop
+  if settings.RATE_LIMIT_TRUST_FORWARDED:
+    for name, value in scope.get("headers", []):
+      if name == b"x-forwarded-for":
+        return value.decode("latin-1").split(",")[0].strip()
+  client = scope.get("client")
+  return client[0] if client else "unknown"
+
+class RateLimitMiddleware:
+  """
+  ASGI middleware spending each request's route cost from its client's window before the app runs. Responses carry
+  RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset; refused requests get 429 with Retry-After.
+  CORS preflights and zero-cost routes (docs, stats) are not counted.
+  """
+  def __init__(self, app, limiter: "SlidingWindowLimiter | None" = None):
+    self.app = app
+    self.limiter = limiter or rate_limiter
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or scope["method"] == "OPTIONS":
+      return await self.app(scope, receive, send)
+    cost = self.limiter.cost(scope["path"])
+    if cost == 0:
+      return await self.app(scope, receive, send)
+    decision = await self.limiter.hit(client_key(scope), cost)
+    headers = [
+      (b"ratelimit-limit", str(self.limiter.capacity).encode()),
+      (b"ratelimit-remaining", str(decision.remaining).encode()),
+      (b"ratelimit-reset", str(math.ceil(decision.reset)).encode()),
+    ]
+    if not decision.allowed:
+      retry_after = str(max(1, math.ceil(decision.reset))).encode()
+      body = json.dumps({"detail": f"Rate limit exceeded, retry in {retry_after.decode()}s."}).encode()
+      await send({"type": "http.response.start", "status": 429, "headers": headers + [
+        (b"retry-after", retry_after), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+      ]})
+      await send({"type": "http.response.body", "body": body})
+      return
+
+    async def send_with_headers(message):
+      if message["type"] == "http.response.start":
+        message = {**message, "headers": list(message.get("headers", [])) + headers}
+      await send(message)
+    await self.app(scope, receive, send_with_headers)
+
+rate_limiter = SlidingWindowLimiter(
+  capacity=settings.RATE_LIMIT_CAPACITY,
+  window=settings.RATE_LIMIT_WINDOW,
+  costs=settings.RATE_LIMIT_COSTS,
+  max_local_clients=settings.RATE_LIMIT_LOCAL_CLIENTS,
+)
@@ -1,20 +1,209 @@
+import logging
+import threading
+import time
 import redis
+import redis.asyncio as aioredis
 import settings
-from fastapi import Depends
-
-# Create Redis connection pool
-def create_redis_pool() -> redis.ConnectionPool:
-  return redis.ConnectionPool(
-    host=settings.REDIS_URL, 
-    password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
-    port=settings.REDIS_PORT, 
-    db=0, 
-    decode_responses=True
-  )
-
-# Get Redis client using the connection pool
-def get_redis_client(pool: redis.ConnectionPool = Depends(create_redis_pool)) -> redis.Redis:
-  try:
-    return redis.Redis(connection_pool=pool)
-  except redis.ConnectionError: # if error: send None
-    return None
\ No newline at end of file
+
+logger = logging.getLogger(__name__)
+
+class PoolStats:
+  """ Connection checkout counters of a pool class (one for the sync pool, one for the async pool). """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.checkouts = 0
+    self.in_use = set() # ids of connections handed out and not released yet
+    self.wait_seconds_total = 0.0
+    self.wait_seconds_max = 0.0
+
+  def checked_out(self, connection, waited: float):
+    with self._lock:
+      self.checkouts += 1
+      self.in_use.add(id(connection))
+      self.wait_seconds_total += waited
+      self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+  def released(self, connection):
+    with self._lock: # the pool also releases connections that failed during checkout, those were never counted
+      self.in_use.discard(id(connection))
+
+  def snapshot(self) -> dict:
+    with self._lock:
+      return {
+        "checkouts": self.checkouts,
+        "in_use": len(self.in_use),
+        "wait_seconds_total": round(self.wait_seconds_total, 6),
+        "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0,
+        "wait_seconds_max": round(self.wait_seconds_max, 6),
+      }
+
+class InstrumentedPool(redis.BlockingConnectionPool):
+  """ Bounded pool: callers wait up to REDIS_POOL_TIMEOUT for a free connection; checkouts and waits are counted. """
+  stats = PoolStats()
+
+  def get_connection(self, command_name, *keys, **options):
+    started = time.perf_counter()
+    connection = super().get_connection(command_name, *keys, **options)
+    self.stats.checked_out(connection, time.perf_counter() - started)
+    return connection
+
+  def release(self, connection):
+    super().release(connection)
+    self.stats.released(connection)
+
+class InstrumentedAsyncPool(aioredis.BlockingConnectionPool):
+  stats = PoolStats()
+
+  async def get_connection(self, command_name, *keys, **options):
+    started = time.perf_counter()
+    connection = await super().get_connection(command_name, *keys, **options)
+    self.stats.checked_out(connection, time.perf_counter() - started)
+    return connection
+
+  async def release(self, connection):
+    await super().release(connection)
+    self.stats.released(connection)
+
+class RedisHealth:
+  """
+  Circuit breaker over the shared pool, readable without any network call.
+  A background monitor pings Redis every REDIS_HEALTH_INTERVAL seconds; request paths report their own failures.
+  After REDIS_BREAKER_THRESHOLD consecutive failures the circuit opens and callers get no client (cache and
+  locks fall back to local behaviour) until the monitor's next successful ping closes it again.
+  """
+  def __init__(self, threshold: int = 3, interval: float = 5):
+    self.threshold = threshold
+    self.interval = interval
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self.available = False
+    self.consecutive_failures = 0
+    self.failures = 0
+    self.reconnects = 0
+    self.opened_at = None
+    self.last_check = None
+
+  def is_available(self) -> bool:
+    return self.available
+
+  def record_success(self):
+    with self._lock:
+      if not self.available and self.last_check is not None:
+        self.reconnects += 1
+        logger.info("redis: connection restored, closing circuit")
+      self.available = True
+      self.consecutive_failures = 0
+      self.opened_at = None
+
+  def record_failure(self, error: Exception | None = None):
+    with self._lock:
+      self.failures += 1
+      self.consecutive_failures += 1
+      if self.available and self.consecutive_failures >= self.threshold:
+        self.available = False
+        self.opened_at = time.time()
+        logger.warning("redis: %s consecutive failures, opening circuit: %s", self.consecutive_failures, error)
+
+  def check(self, client: redis.Redis):
+    try:
+      client.ping()
+      self.record_success()
+    except redis.exceptions.RedisError as e:
+      with self._lock: # a failed health check opens the circuit straight away
+        self.failures += 1
+        self.consecutive_failures = max(self.consecutive_failures + 1, self.threshold)
+        if self.available:
+          self.opened_at = time.time()
+          logger.warning("redis: health check failed, opening circuit: %s", e)
+        self.available = False
+    self.last_check = time.time()
+
+  def start(self, client: redis.Redis):
+    self.check(client)
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run, args=(client,), name="redis-health", daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self.available = False
+
+  def _run(self, client: redis.Redis):
+    while not self._stop.wait(self.interval):
+      self.check(client)
+
+  def snapshot(self) -> dict:
+    with self._lock:
+      return {
+        "available": self.available,
+        "consecutive_failures": self.consecutive_failures,
+        "failures": self.failures,
+        "reconnects": self.reconnects,
+        "opened_at": self.opened_at,
+        "last_check": self.last_check,
+      }
+
+health = RedisHealth(threshold=settings.REDIS_BREAKER_THRESHOLD, interval=settings.REDIS_HEALTH_INTERVAL)
+client: redis.Redis | None = None
+async_client: aioredis.Redis | None = None
+
+def connection_kwargs() -> dict:
+  return {
+    "host": settings.REDIS_URL,
+    "password": settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+    "port": int(settings.REDIS_PORT or 6379),
+    "db": 0,
+    "decode_responses": True,
+    "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT,
+    "max_connections": settings.REDIS_POOL_SIZE,
+    "timeout": settings.REDIS_POOL_TIMEOUT,
+  }
+
+def subscriber_client(redis_client: redis.Redis) -> redis.Redis:
+  """
+  A client of its own for a long-lived pub/sub subscription, connected like `redis_client`.
+  Pooled connections carry REDIS_SOCKET_TIMEOUT, so an idle subscription read off them would fail after a second:
+  this one has no read timeout, is kept alive by TCP keepalive and a PING every REDIS_HEALTH_INTERVAL seconds
+  (sent while polling with `get_message(timeout=...)`), and does not hold a slot of the shared pool.
+  """
+  kwargs = dict(redis_client.connection_pool.connection_kwargs)
+  kwargs.update(socket_timeout=None, socket_keepalive=True, health_check_interval=settings.REDIS_HEALTH_INTERVAL)
+  return redis.Redis(connection_pool=redis.ConnectionPool(connection_class=redis_client.connection_pool.connection_class, **kwargs))
+
+# Create the application-lifetime connection pools (sync and async), called once at startup
+def init_redis():
+  global client, async_client
+  client = redis.Redis(connection_pool=InstrumentedPool(**connection_kwargs()))
+  async_client = aioredis.Redis(connection_pool=InstrumentedAsyncPool(**connection_kwargs()))
+  health.start(client)
+
+async def close_redis():
+  global client, async_client
+  health.stop()
+  if client is not None:
+    client.connection_pool.disconnect()
+  if async_client is not None:
+    await async_client.connection_pool.disconnect()
+  client, async_client = None, None
+
+def get_client() -> redis.Redis | None:
+  """ Shared sync client, or None when Redis is down (circuit open) or was never initialised. """
+  return client if health.is_available() else None
+
+# FastAPI dependencies: no per-request pool and no ping, None means "run without Redis"
+def get_redis_client() -> redis.Redis | None:
+  return get_client()
+
+def get_async_redis_client() -> aioredis.Redis | None:
+  return async_client if health.is_available() else None
+
+def stats() -> dict:
+  return {
+    "pool_size": settings.REDIS_POOL_SIZE,
+    "pool_timeout": settings.REDIS_POOL_TIMEOUT,
+    "sync": InstrumentedPool.stats.snapshot(),
+    "async": InstrumentedAsyncPool.stats.snapshot(),
+    "health": health.snapshot(),
+  }
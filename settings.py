@@ -19,4 +19,89 @@ SQLALCHEMY_DATABASE_URL=os.environ.get("SQLALCHEMY_DATABASE_URL")
 REDIS_URL=os.environ.get("REDIS_URL", "localhost")  # Default to localhost if not set
 REDIS_PASSWORD=os.environ.get("REDIS_PASSWORD", "")  # Default to empty string if not set
 REDIS_PORT=os.environ.get("REDIS_PORT")
-REDIS_EX=os.environ.get("REDIS_EX", 600)  # Default to 600 seconds if not set
\ No newline at end of file
+REDIS_EX=os.environ.get("REDIS_EX", 600)  # Default to 600 seconds if not set
+REDIS_POOL_SIZE=int(os.environ.get("REDIS_POOL_SIZE", 50)) # max connections of the shared pool (sync and async each)
+REDIS_POOL_TIMEOUT=float(os.environ.get("REDIS_POOL_TIMEOUT", 2)) # seconds a caller waits for a free pooled connection
+REDIS_SOCKET_TIMEOUT=float(os.environ.get("REDIS_SOCKET_TIMEOUT", 1)) # seconds before a Redis connect/command is considered failed
+REDIS_HEALTH_INTERVAL=float(os.environ.get("REDIS_HEALTH_INTERVAL", 5)) # seconds between background health checks
+REDIS_BREAKER_THRESHOLD=int(os.environ.get("REDIS_BREAKER_THRESHOLD", 3)) # consecutive request failures before the circuit opens
+# ============================
+# Market Data Constants
+# ============================
+MARKET_DATA_PROVIDER=os.environ.get("MARKET_DATA_PROVIDER", "yfinance").lower() # 'yfinance' (default) or 'fixture' (offline, deterministic)
+MARKET_DATA_FIXTURE_PATH=os.environ.get("MARKET_DATA_FIXTURE_PATH") # Optional: JSON file with pinned prices/info for the fixture provider
+MARKET_DATA_FIXTURE_LATENCY=float(os.environ.get("MARKET_DATA_FIXTURE_LATENCY", 0)) # Optional: simulated upstream latency (seconds) for the fixture provider
+OPTION_SNAPSHOT_TTL=int(os.environ.get("OPTION_SNAPSHOT_TTL", 900)) # Optional: seconds a stored option chain snapshot serves quotes before the chain is downloaded again
+RISK_FREE_RATE=float(os.environ.get("RISK_FREE_RATE", 0.045)) # Optional: annual continuously compounded rate used by the option pricing (tickers.greeks)
+CHAIN_CACHE_MIN_TTL=int(os.environ.get("CHAIN_CACHE_MIN_TTL", 300)) # Optional: seconds cached option volume totals are kept for an expiry that is days away
+CHAIN_CACHE_MAX_TTL=int(os.environ.get("CHAIN_CACHE_MAX_TTL", 3600)) # Optional: seconds they are kept for expiries CHAIN_CACHE_HORIZON_DAYS or more away
+CHAIN_CACHE_HORIZON_DAYS=int(os.environ.get("CHAIN_CACHE_HORIZON_DAYS", 60)) # Optional: days to expiry from which the longest TTL applies (linear in between)
+PRICE_BAR_TTL=int(os.environ.get("PRICE_BAR_TTL", 900)) # Optional: seconds a stored bar of the current (unsettled) session is trusted before it is refetched
+INTRADAY_BAR_INTERVAL=os.environ.get("INTRADAY_BAR_INTERVAL", "5m") # Optional: bar size of the intraday session the VWAP metric is computed from
+INTRADAY_BAR_TTL=int(os.environ.get("INTRADAY_BAR_TTL", 300)) # Optional: seconds cached intraday bars are kept
+HV_WINDOWS=[int(w) for w in os.environ.get("HV_WINDOWS", "10,20,30,60").split(",")] # Optional: historical volatility windows (trading days); HV reports the 30-day one when listed
+PRICE_STATS_TTL=int(os.environ.get("PRICE_STATS_TTL", 300)) # Optional: seconds the computed HV/VWAP metrics are cached
+
+# ============================
+# Scheduler Constants
+# ============================
+SCHEDULER_ENABLED=os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true" # Optional: run the in-process refresh scheduler in this worker
+REFRESH_SCHEDULE_TIME=os.environ.get("REFRESH_SCHEDULE_TIME", "22:00") # Optional: New York time of the nightly ticker/option refresh, on NYSE trading days
+JOB_LEASE_SECONDS=int(os.environ.get("JOB_LEASE_SECONDS", 600)) # Optional: seconds a worker holds a job lease without a heartbeat before another worker may take over
+
+# ============================
+# Execution Constants
+# ============================
+IO_WORKERS=int(os.environ.get("IO_WORKERS", 32)) # Optional: threads for blocking provider/database work offloaded from async routes
+COMPUTE_WORKERS=int(os.environ.get("COMPUTE_WORKERS", os.cpu_count() or 4)) # Optional: threads for CPU-bound pandas/NumPy work
+FETCH_WORKERS=int(os.environ.get("FETCH_WORKERS", 16)) # Optional: threads of the shared pool fanning out upstream downloads (option chains)
+PROVIDER_MAX_CONCURRENCY=int(os.environ.get("PROVIDER_MAX_CONCURRENCY", 8)) # Optional: max concurrent upstream calls per market data provider, process-wide
+HASH_WORKERS=int(os.environ.get("HASH_WORKERS", min(4, os.cpu_count() or 1))) # Optional: processes hashing/verifying passwords (bcrypt) off the event loop
+HASH_QUEUE_LIMIT=int(os.environ.get("HASH_QUEUE_LIMIT", 8 * HASH_WORKERS)) # Optional: max password hashes pending at once; logins past it get an immediate 503
+
+# ============================
+# Security Constants
+# ============================
+BCRYPT_ROUNDS=int(os.environ.get("BCRYPT_ROUNDS", 12)) # Optional: bcrypt cost (log2 rounds); stored hashes of another cost are rehashed on the next login
+REVOCATION_BUCKET_SECONDS=int(os.environ.get("REVOCATION_BUCKET_SECONDS", 300)) # Optional: revoked tokens are grouped in Bloom filters per this much expiry time, dropped once all expired
+REVOCATION_BLOOM_CAPACITY=int(os.environ.get("REVOCATION_BLOOM_CAPACITY", 20000)) # Optional: revoked tokens per bucket filter before its false positive rate degrades
+REVOCATION_BLOOM_ERROR_RATE=float(os.environ.get("REVOCATION_BLOOM_ERROR_RATE", 0.001)) # Optional: false positive rate of a bucket filter (each one costs a Redis check)
+REFRESH_TOKEN_MAX_AGE=int(os.environ.get("REFRESH_TOKEN_MAX_AGE", 7 * 24 * 60 * 60)) # Optional: seconds a refresh token (and its cookie) is valid; each use replaces it
+REFRESH_TOKEN_SWEEP_INTERVAL=float(os.environ.get("REFRESH_TOKEN_SWEEP_INTERVAL", 300)) # Optional: seconds between deletions of expired refresh tokens from the database fallback store
+USER_CACHE_TTL=int(os.environ.get("USER_CACHE_TTL", 60)) # Optional: seconds an authenticated user's record is cached (dropped as soon as the user changes)
+ADMIN_USERS=[email.strip().lower() for email in os.environ.get("ADMIN_USERS", "").split(",") if email.strip()] # Optional: comma-separated emails of the users allowed to profile requests and read the reports (/admin)
+
+# ============================
+# Rate Limit Constants
+# ============================
+RATE_LIMIT_ENABLED=os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true" # Optional: per-client sliding-window rate limiting of every route
+RATE_LIMIT_CAPACITY=int(os.environ.get("RATE_LIMIT_CAPACITY", 120)) # Optional: units a client may spend per window (a request costs its route's weight)
+RATE_LIMIT_WINDOW=float(os.environ.get("RATE_LIMIT_WINDOW", 60)) # Optional: seconds of the sliding window
+RATE_LIMIT_COSTS={ # Optional: "path-prefix=cost,..." weights of the routes that fan out into provider calls or heavy work; 0 exempts a route (default 1)
+  prefix: int(cost) for prefix, _, cost in (item.strip().rpartition("=") for item in os.environ.get(
+    "RATE_LIMIT_COSTS",
+    "/tickers/metrics/=10,/tickers/historical_prices/=5,/tickers/options/=3,/positions/import=20,/auth/token=5,/auth/register=5,"
+    "/docs=0,/redoc=0,/openapi.json=0,/metrics=0",
+  ).split(",") if item.strip())
+}
+RATE_LIMIT_LOCAL_CLIENTS=int(os.environ.get("RATE_LIMIT_LOCAL_CLIENTS", 10000)) # Optional: clients tracked in-process while Redis is down (least recently seen evicted)
+RATE_LIMIT_TRUST_FORWARDED=os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true" # Optional: identify clients by X-Forwarded-For (only behind a trusted proxy)
+
+# ============================
+# Observability Constants
+# ============================
+METRICS_ENABLED=os.environ.get("METRICS_ENABLED", "true").lower() == "true" # Optional: record request/provider/database timings for GET /metrics (Prometheus format)
+PROFILING_ENABLED=os.environ.get("PROFILING_ENABLED", "true").lower() == "true" # Optional: allow on-demand request profiles (X-Profile header from an admin, or PROFILE_SAMPLE_RATE)
+PROFILE_DIR=os.environ.get("PROFILE_DIR", "profiles") # Optional: directory the request profiles are written to (shared by the workers, listed at GET /admin/profiles)
+PROFILE_SAMPLE_RATE=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)) # Optional: fraction of the requests under PROFILE_SAMPLE_PATHS profiled unasked (0: on request only); PUT /admin/profiling changes it
+PROFILE_SAMPLE_PATHS=[path.strip() for path in os.environ.get("PROFILE_SAMPLE_PATHS", "/tickers/,/positions/").split(",") if path.strip()] # Optional: path prefixes the sampling applies to
+PROFILE_INTERVAL=float(os.environ.get("PROFILE_INTERVAL", 0.005)) # Optional: seconds between two stack samples of a profiled request
+PROFILE_MAX_REPORTS=int(os.environ.get("PROFILE_MAX_REPORTS", 200)) # Optional: reports kept in PROFILE_DIR, the oldest deleted
+PROFILE_MAX_CONCURRENT=int(os.environ.get("PROFILE_MAX_CONCURRENT", 2)) # Optional: requests profiled at once per worker; more are served unprofiled
+
+# ============================
+# Cache Constants
+# ============================
+LOCAL_CACHE_SIZE=int(os.environ.get("LOCAL_CACHE_SIZE", 1024)) # Optional: max entries of the in-process cache in front of Redis
+LOCAL_CACHE_TTL=float(os.environ.get("LOCAL_CACHE_TTL", 60)) # Optional: seconds an entry is kept locally when Redis reports no TTL for it
+LOCAL_CACHE_STALE_TTL=float(os.environ.get("LOCAL_CACHE_STALE_TTL", 120)) # Optional: seconds an expired entry may still be served while it is refreshed in the background
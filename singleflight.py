@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+import logging
+import redis
+from redis_client import health as redis_health
+
+logger = logging.getLogger(__name__)
+
+# compare-and-delete, so a leader never releases a lock that expired and was taken by another worker
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class _Call:
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+class SingleFlight:
+  """
+  Coalesce concurrent cache misses for the same key into one fetch.
+  - within a process: the first caller (leader) runs the fetch, later callers block on its result (wait).
+  - across workers: the leader also takes a Redis lock (SET NX PX). A worker that loses the lock polls until
+    it is released, then re-reads the shared cache through `recheck` (hit) and only fetches itself if the
+    cache is still empty.
+  Counters are kept per key family (the part of the key before the first ':').
+  """
+  def __init__(self, lock_timeout: float = 30, poll_interval: float = 0.05):
+    self.lock_timeout = lock_timeout
+    self.poll_interval = poll_interval
+    self._lock = threading.Lock()
+    self._calls: dict[str, _Call] = {}
+    self._stats: dict[str, dict[str, int]] = {}
+
+  def _count(self, key: str, counter: str):
+    family = key.split(":", 1)[0]
+    with self._lock:
+      stats = self._stats.setdefault(family, {"leads": 0, "waits": 0, "remote_waits": 0, "hits": 0})
+      stats[counter] += 1
+
+  def stats(self) -> dict[str, dict[str, int]]:
+    with self._lock:
+      return {family: dict(stats) for family, stats in self._stats.items()}
+
+  def do(self, key: str, fn, recheck=None, redis_client: redis.Redis | None = None):
+    """
+    Run `fn()` once for all concurrent callers of `key` and return its result to each of them.
+    Args:
+      key: cache key being filled, e.g. "metrics:AAPL".
+      fn: fetch function, called without arguments.
+      recheck: optional function returning the cached value (or None) once another worker released the lock.
+      redis_client: optional Redis client for the cross-worker lock; without it coalescing is process-local.
+    """
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = _Call()
+
+    if not leader:
+      self._count(key, "waits")
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+
+    try:
+      call.result = self._lead(key, fn, recheck, redis_client)
+    except Exception as error:
+      call.error = error
+      raise
+    finally:
+      with self._lock:
+        del self._calls[key]
+      call.done.set()
+    return call.result
+
+  def _lead(self, key: str, fn, recheck, redis_client: redis.Redis | None):
+    lock_key = f"singleflight:{key}"
+    token = uuid.uuid4().hex
+    locked = False
+    if redis_client is not None:
+      try:
+        locked = bool(redis_client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)))
+        if not locked: # another worker is fetching: wait for it and read what it cached
+          self._count(key, "remote_waits")
+          deadline = time.monotonic() + self.lock_timeout
+          while redis_client.exists(lock_key) and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+          if recheck is not None:
+            cached = recheck()
+            if cached is not None:
+              self._count(key, "hits")
+              return cached
+      except redis.exceptions.RedisError as e: # coalescing degrades to process-local, it never fails the request
+        redis_health.record_failure(e)
+        logger.warning("singleflight: redis lock unavailable for %s: %s", key, e)
+
+    self._count(key, "leads")
+    try:
+      return fn()
+    finally:
+      if locked:
+        try:
+          redis_client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except redis.exceptions.RedisError as e:
+          logger.warning("singleflight: could not release %s: %s", lock_key, e)
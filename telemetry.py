@@ -0,0 +1,216 @@
+import bisect
+import threading
+import time
+
+# Prometheus text-format metrics (GET /metrics), kept dependency-free:
+# - recorded on the hot path: HTTP request latency per route, market data provider calls, database queries
+#   (a lock and a bisect per observation, a few microseconds)
+# - collected at scrape time from the counters the app already keeps: cache, single-flight, executors, Redis
+#   pools, auth, rate limiting (collectors, see register_collector)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+  pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+  return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+  def __init__(self, name: str, help: str, labels: tuple = ()):
+    self.name, self.help, self.labels = name, help, labels
+    self._values: dict[tuple, float] = {}
+    self._lock = threading.Lock()
+
+  def inc(self, *label_values, amount: float = 1):
+    with self._lock:
+      self._values[label_values] = self._values.get(label_values, 0) + amount
+
+  def render(self) -> list[str]:
+    with self._lock:
+      values = dict(self._values)
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+    lines += [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in sorted(values.items())]
+    return lines
+
+class Histogram:
+  def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+    self.name, self.help, self.labels, self.buckets = name, help, labels, tuple(buckets)
+    self._values: dict[tuple, list] = {} # label values -> [count per bucket (+Inf last), sum]
+    self._lock = threading.Lock()
+
+  def observe(self, value: float, *label_values):
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      series = self._values.get(label_values)
+      if series is None:
+        series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+      series[0][index] += 1
+      series[1] += value
+
+  def render(self) -> list[str]:
+    with self._lock:
+      values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    for key, (counts, total) in sorted(values.items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets + (float("inf"),), counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else _number(bound)
+        bucket = 'le="' + le + '"'
+        lines.append(f"{self.name}_bucket{_labels(self.labels, key, bucket)} {cumulative}")
+      lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(round(total, 6))}")
+      lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+    return lines
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template, method and status.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+provider_calls = Counter("provider_calls_total", "Market data provider calls by method and outcome.", ("provider", "method", "outcome"))
+provider_latency = Histogram("provider_call_duration_seconds", "Market data provider call latency by method.", ("provider", "method"),
+                             buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+db_latency = Histogram("db_query_duration_seconds", "Database statements by engine and kind (SELECT, INSERT, ...).", ("engine", "operation"))
+db_errors = Counter("db_query_errors_total", "Database statements that raised, by engine.", ("engine",))
+
+_metrics = [http_requests, http_latency, provider_calls, provider_latency, db_latency, db_errors]
+_collectors = []
+
+def register_collector(collector):
+  """
+  Add a scrape-time collector: a function returning [(name, type, help, [(labels dict, value), ...]), ...] read
+  from counters kept elsewhere. A failing collector is skipped, it never breaks the scrape.
+  """
+  _collectors.append(collector)
+
+def render() -> str:
+  lines = []
+  for metric in _metrics:
+    lines += metric.render()
+  for collector in _collectors:
+    try:
+      families = collector()
+    except Exception:
+      continue
+    for name, kind, help, samples in families:
+      lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+      for labels, value in samples:
+        names = tuple(labels)
+        lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}")
+  return "\n".join(lines) + "\n"
+
+def timed_call(provider: str, method: str, fn, *args, **kwargs):
+  """ Call `fn` and record its latency and outcome as a provider call. """
+  started = time.perf_counter()
+  outcome = "error"
+  try:
+    result = fn(*args, **kwargs)
+    outcome = "ok"
+    return result
+  finally:
+    provider_latency.observe(time.perf_counter() - started, provider, method)
+    provider_calls.inc(provider, method, outcome)
+
+def instrument_engine(engine, name: str):
+  """ Time every statement `engine` (a sync Engine; pass async_engine.sync_engine for the async one) executes. """
+  from sqlalchemy import event
+
+  @event.listens_for(engine, "before_cursor_execute")
+  def before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+  @event.listens_for(engine, "after_cursor_execute")
+  def after(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    db_latency.observe(time.perf_counter() - started, name, operation)
+
+  @event.listens_for(engine, "handle_error")
+  def error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+      started.pop()
+    db_errors.inc(name)
+
+class MetricsMiddleware:
+  """ ASGI middleware recording each HTTP request's latency and status under its route template (/tickers/{ticker}). """
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      return await self.app(scope, receive, send)
+    started = time.perf_counter()
+    status = [500]
+    async def send_with_status(message):
+      if message["type"] == "http.response.start":
+        status[0] = message["status"]
+      await send(message)
+    try:
+      await self.app(scope, receive, send_with_status)
+    finally:
+      route = scope.get("route") # set by the router on a match (the template, not the concrete path)
+      template = getattr(route, "path", None) or "unmatched"
+      http_latency.observe(time.perf_counter() - started, scope["method"], template)
+      http_requests.inc(scope["method"], template, str(status[0]))
+
+def _families(name: str, kind: str, help: str, label: str, stats: dict[str, dict], keys: dict[str, str]) -> list:
+  # one family per counter of a {label value: {counter: value}} stats dict, e.g. cache stats per key family
+  return [
+    (f"{name}_{suffix}", kind, f"{help} ({counter})", [({label: key}, values[counter]) for key, values in stats.items() if counter in values])
+    for counter, suffix in keys.items()
+  ]
+
+def collect_app_stats() -> list:
+  """ Counters the app keeps for its /stats endpoints, in exposition form. """
+  import cache, executors, profiling, ratelimit, redis_client
+  from auth import service as auth_service
+  from tickers.service import flights
+
+  cache_stats = cache.cache.stats()
+  families = [("cache_entries", "gauge", "Entries in the in-process cache tier.", [({}, cache_stats["entries"])])]
+  families += [(
+    "cache_lookups_total", "counter", "Cache lookups by key family (metrics, price_history, ...) and result.",
+    [({"family": family, "result": result}, stats[result]) for family, stats in cache_stats["families"].items()
+     for result in ("local_hits", "stale_hits", "local_misses", "redis_hits", "redis_misses", "redis_errors")],
+  )]
+  families.append((
+    "singleflight_calls_total", "counter", "Coalesced cache fills by key family and role (lead, wait, ...).",
+    [({"family": family, "role": role}, count) for family, stats in flights.stats().items() for role, count in stats.items()],
+  ))
+  queues = executors.queue_stats()
+  families += _families("executor", "gauge", "Thread pools", "pool", queues, {"workers": "workers", "threads": "threads", "queued": "queue_depth"})
+  hashing = executors.hash_stats()
+  families += [
+    ("password_hash_pending", "gauge", "Password hashes running or queued on the hash process pool.", [({}, hashing["pending"])]),
+    ("password_hash_total", "counter", "Password hashes by outcome.", [({"outcome": "completed"}, hashing["completed"]), ({"outcome": "rejected"}, hashing["rejected"])]),
+  ]
+  pools = redis_client.stats()
+  clients = {"sync": pools["sync"], "async": pools["async"]}
+  families += _families("redis_pool", "gauge", "Shared Redis connection pools", "client", clients, {"in_use": "in_use"})
+  families += _families("redis_pool", "counter", "Shared Redis connection pools", "client", clients,
+                        {"checkouts": "checkouts_total", "wait_seconds_total": "wait_seconds_total"})
+  auth = auth_service.auth_stats()
+  families.append((
+    "auth_requests_total", "counter", "Authenticated request resolution (local/Redis cache hits, database lookups, rejections).",
+    [({"result": key}, value) for key, value in auth.items() if isinstance(value, int) and key != "requests"],
+  ))
+  revocations = auth["revocations"]
+  sizes = ("buckets", "filter_entries", "filter_bytes", "local_entries")
+  families.append(("token_revocation_events_total", "counter", "Token revocation store counters (revocations, checks, filter hits, ...).",
+                   [({"event": key}, value) for key, value in revocations.items() if key not in sizes]))
+  families.append(("token_revocation_size", "gauge", "Token revocation store size (filter buckets, entries, bytes).",
+                   [({"measure": key}, revocations[key]) for key in sizes]))
+  families.append(("refresh_token_events_total", "counter", "Refresh token store counters.",
+                   [({"event": key}, value) for key, value in auth["refresh_tokens"].items()]))
+  limits = ratelimit.rate_limiter.stats()
+  families.append(("rate_limit_requests_total", "counter", "Rate-limited requests by decision and check path.",
+                   [({"result": key}, limits[key]) for key in ("allowed", "limited", "redis_checks", "local_checks", "redis_errors")]))
+  profiles = profiling.request_profiler.stats()
+  families.append(("request_profiles_total", "counter", "On-demand request profiles by outcome (requested, sampled, busy, saved, ...).",
+                   [({"event": key}, profiles[key]) for key in ("requested", "sampled", "refused", "busy", "saved", "save_errors")]))
+  return families
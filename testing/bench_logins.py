@@ -0,0 +1,108 @@
+"""
+Latency of a cheap endpoint during a login storm, with bcrypt run inline on the event loop (the login route before
+the hash pool) and on the bounded hash process pool (executors.run_hash).
+
+Runs in-process against the auth router on a throwaway SQLite database: a probe requests a no-op route every few
+milliseconds (latency counted from when the request was due) while `--logins` logins are fired at once, and the
+probe's p50/p99/max latency is reported next to the logins' outcome (200, 503 rejected by HASH_QUEUE_LIMIT) and
+the time the storm took.
+
+  python -m testing.bench_logins [--logins 40] [--rounds 12]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+def percentile(values: list[float], q: float) -> float:
+  values = sorted(values)
+  return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+async def probe(client, stop: asyncio.Event, interval: float) -> list[float]:
+  # latency is measured from when the request was due, not when it was sent: a blocked event loop delays both
+  latencies = []
+  due = time.perf_counter()
+  while not stop.is_set():
+    await client.get("/ping")
+    latencies.append((time.perf_counter() - due) * 1000)
+    due = max(due + interval, time.perf_counter())
+    await asyncio.sleep(due - time.perf_counter())
+  return latencies
+
+async def storm(app, logins: int, interval: float) -> dict:
+  import httpx
+  transport = httpx.ASGITransport(app=app)
+  async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, stop, interval))
+    await asyncio.sleep(0.2) # idle latency first
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+      client.post("/auth/token", data={"username": f"user{i}@bench", "password": "correct horse"}) for i in range(logins)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    latencies = await prober
+  codes = [response.status_code for response in responses]
+  return {
+    "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99), "max": round(max(latencies), 1),
+    "ok": codes.count(200), "rejected": codes.count(503), "seconds": round(elapsed, 2),
+  }
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--logins", type=int, default=40, help="concurrent logins in the storm")
+  parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost (BCRYPT_ROUNDS)")
+  parser.add_argument("--interval", type=float, default=0.005, help="seconds between probe requests")
+  args = parser.parse_args()
+
+  directory = tempfile.mkdtemp(prefix="bench-logins-")
+  os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+  os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+  os.environ.setdefault("SECRET_KEY", "bench")
+  os.environ.setdefault("ALGORITHM", "HS256")
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  from fastapi import FastAPI
+  import auth.models, positions.models, tickers.models # register every model before migrating
+  import migrations
+  import executors
+  import settings
+  from auth import passwords
+  from auth.router import router
+  from database import engine, SessionLocal
+
+  migrations.migrate(engine)
+  hashed_password = passwords.hash_password("correct horse")
+  with SessionLocal() as db:
+    db.add_all([auth.models.User(email=f"user{i}@bench", hashed_password=hashed_password) for i in range(args.logins)])
+    db.commit()
+
+  app = FastAPI()
+  app.include_router(router, prefix="/auth")
+  @app.get("/ping")
+  async def ping():
+    return {}
+
+  async def inline(fn, *args): # the login route before the hash pool: bcrypt on the event loop
+    return fn(*args)
+
+  run_hash = executors.run_hash
+  executors.run_hash = inline
+  before = asyncio.run(storm(app, args.logins, args.interval))
+  executors.run_hash = run_hash
+  asyncio.run(storm(app, min(settings.HASH_WORKERS, args.logins), args.interval)) # start the worker processes
+  after = asyncio.run(storm(app, args.logins, args.interval))
+  executors.shutdown()
+
+  print(f"{args.logins} concurrent logins, bcrypt cost {args.rounds}, {settings.HASH_WORKERS} hash workers, queue limit {settings.HASH_QUEUE_LIMIT}")
+  for label, result in (("inline (event loop)", before), ("hash process pool  ", after)):
+    print(
+      f"{label}: probe p50 {result['p50']}ms p99 {result['p99']}ms max {result['max']}ms | "
+      f"logins ok {result['ok']} rejected {result['rejected']} in {result['seconds']}s"
+    )
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark of the /tickers/metrics computation (compute_metrics) before and after the HV/VWAP metrics.
+
+Runs offline against the fixture provider (with a simulated upstream latency per call) on a throwaway SQLite bar
+store and reports the median time per symbol of:
+  - baseline: compute_metrics with HV/VWAP left as placeholders (the metrics before they were filled in), second pass
+  - cold:     HV/VWAP computed, daily and intraday bars downloaded for the first time
+  - warm:     HV/VWAP served from their own cache entry (price_stats:, PRICE_STATS_TTL), the steady state
+and the cost of the rolling kernels alone over ten years of daily bars.
+
+  python -m testing.bench_metrics [--symbols 20] [--latency 0.02]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+def median_ms(fn, symbols: list[str]) -> float:
+  timings = []
+  for symbol in symbols:
+    started = time.perf_counter()
+    fn(symbol)
+    timings.append((time.perf_counter() - started) * 1000)
+  return round(statistics.median(timings), 2)
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--symbols", type=int, default=20, help="symbols per measurement")
+  parser.add_argument("--latency", type=float, default=0.02, help="simulated provider latency per call (seconds)")
+  args = parser.parse_args()
+
+  directory = tempfile.mkdtemp(prefix="bench-metrics-")
+  os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+  os.environ["MARKET_DATA_PROVIDER"] = "fixture"
+  os.environ["MARKET_DATA_FIXTURE_LATENCY"] = str(args.latency)
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  import numpy as np
+  import auth.models, positions.models, tickers.models # register every model before migrating
+  import migrations
+  from database import engine
+  from tickers import service, indicators
+  import settings
+
+  migrations.migrate(engine)
+  price_stats = service.get_price_stats
+  placeholders = lambda ticker, redis_client=None: {"HV": {}, "VWAP": None, "VWAPSession": None}
+
+  service.get_price_stats = placeholders
+  median_ms(service.compute_metrics, [f"B{i:03d}" for i in range(args.symbols)]) # warm the other cached parts (PCR, ...) too
+  baseline = median_ms(service.compute_metrics, [f"B{i:03d}" for i in range(args.symbols)])
+  service.get_price_stats = price_stats
+  symbols = [f"M{i:03d}" for i in range(args.symbols)]
+  cold = median_ms(service.compute_metrics, symbols)
+  warm = median_ms(service.compute_metrics, symbols)
+
+  closes = 100 * np.exp(np.cumsum(np.random.default_rng(7).normal(0, 0.01, 2520)))
+  started = time.perf_counter()
+  for _ in range(1000):
+    indicators.historical_volatility(closes, settings.HV_WINDOWS)
+  kernels = round((time.perf_counter() - started), 3) # ms per call over 1000 calls
+
+  print(f"provider latency {args.latency * 1000:.0f}ms per call, median of {args.symbols} symbols")
+  print(f"baseline (HV/VWAP placeholders): {baseline}ms")
+  print(f"cold (bars downloaded):          {cold}ms")
+  print(f"warm (price_stats cached):       {warm}ms ({warm - baseline:+.2f}ms vs baseline)")
+  print(f"HV kernels, {len(settings.HV_WINDOWS)} windows over 2520 closes: {kernels}ms per call")
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Per-request cost of the rate limit middleware (ratelimit.RateLimitMiddleware).
+
+Calls a no-op route straight through ASGI (no HTTP server in between), bare and behind the middleware, and reports
+the median and p99 time per request of each and their difference; then fires requests from one client until it
+is refused, to show the 429 and its headers. Uses Redis when --redis is given and reachable (REDIS_URL), the local
+fallback otherwise.
+
+  python -m testing.bench_ratelimit [--requests 20000] [--redis]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+def percentile(values: list[float], q: float) -> float:
+  values = sorted(values)
+  return values[min(len(values) - 1, int(q * len(values)))]
+
+async def call(app, path: str, client: str) -> tuple[int, dict]:
+  scope = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+    "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [], "client": (client, 50000), "server": ("bench", 80),
+  }
+  response = {}
+  async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+  async def send(message):
+    if message["type"] == "http.response.start":
+      response["status"] = message["status"]
+      response["headers"] = {name.decode(): value.decode() for name, value in message["headers"]}
+  await app(scope, receive, send)
+  return response["status"], response["headers"]
+
+async def measure(app, requests: int) -> list[float]:
+  timings = []
+  for i in range(requests):
+    started = time.perf_counter()
+    await call(app, "/ping", f"10.0.{i % 250}.{i % 200}") # many clients: nobody is limited while timing
+    timings.append((time.perf_counter() - started) * 1e6)
+  return timings
+
+async def run(args) -> None:
+  from fastapi import FastAPI
+  from ratelimit import RateLimitMiddleware, SlidingWindowLimiter
+  import redis_client
+  import settings
+
+  if args.redis:
+    redis_client.init_redis()
+    await asyncio.sleep(0.5) # first health check
+  app = FastAPI()
+  @app.get("/ping")
+  async def ping():
+    return {}
+  limiter = SlidingWindowLimiter(settings.RATE_LIMIT_CAPACITY, settings.RATE_LIMIT_WINDOW, settings.RATE_LIMIT_COSTS)
+  limited = RateLimitMiddleware(app, limiter)
+
+  await measure(app, 1000) # warm up both paths
+  await measure(limited, 1000)
+  bare = await measure(app, args.requests)
+  wrapped = await measure(limited, args.requests)
+  stats = limiter.stats()
+  print(f"{args.requests} requests, checked by {'redis' if stats['redis_checks'] else 'the local fallback'}")
+  print(f"bare:             median {percentile(bare, 0.5):7.1f}us p99 {percentile(bare, 0.99):7.1f}us")
+  print(f"with rate limit:  median {percentile(wrapped, 0.5):7.1f}us p99 {percentile(wrapped, 0.99):7.1f}us")
+  print(f"limiter overhead: median {percentile(wrapped, 0.5) - percentile(bare, 0.5):7.1f}us")
+
+  for i in range(settings.RATE_LIMIT_CAPACITY + 1):
+    status, headers = await call(limited, "/ping", "192.0.2.1")
+    if status == 429:
+      print(f"one client refused after {i} requests: 429, Retry-After {headers['retry-after']}s, "
+            f"RateLimit-Remaining {headers['ratelimit-remaining']}")
+      break
+  if args.redis:
+    await redis_client.close_redis()
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--requests", type=int, default=20000, help="timed requests per variant")
+  parser.add_argument("--redis", action="store_true", help="check against Redis (REDIS_URL) instead of the local fallback")
+  args = parser.parse_args()
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  asyncio.run(run(args))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
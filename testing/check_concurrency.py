@@ -0,0 +1,92 @@
+"""
+Check that concurrent requests do not serialize behind a slow upstream: async routes must hand their provider,
+pandas and database work to the executors (executors.run_io) instead of running it on the event loop.
+
+Runs in-process against the tickers router on a throwaway SQLite database, with the fixture provider sleeping
+`--latency` seconds per upstream call. Fires one /tickers/metrics request, then `--concurrency` at once (distinct
+symbols: no cache hit or coalesced fetch), and compares the wall times; a cheap route is probed meanwhile. The same
+batch is then run with the blocking work inline on the event loop, which is what serializing looks like.
+Exits 1 when the concurrent batch takes more than `--max-ratio` times the single request.
+
+  python -m testing.check_concurrency [--concurrency 8] [--latency 0.2] [--max-ratio 3]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+_symbols = itertools.count()
+
+async def batch(app, requests: int) -> dict:
+  import httpx
+  transport = httpx.ASGITransport(app=app)
+  async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=None) as client:
+    symbols = [f"C{next(_symbols):04d}" for _ in range(requests)]
+    started = time.perf_counter()
+    metrics = asyncio.gather(*(client.get(f"/tickers/metrics/{symbol}") for symbol in symbols))
+    due = time.perf_counter() + 0.01
+    await asyncio.sleep(0.01) # the batch is in flight
+    await client.get("/ping")
+    probe = time.perf_counter() - due # from when it was due: a blocked event loop delays the send too
+    responses = await metrics
+    elapsed = time.perf_counter() - started
+  return {"seconds": elapsed, "probe_ms": probe * 1000, "ok": sum(response.status_code == 200 for response in responses)}
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--concurrency", type=int, default=8, help="concurrent /tickers/metrics requests")
+  parser.add_argument("--latency", type=float, default=0.2, help="seconds the fixture provider sleeps per upstream call")
+  parser.add_argument("--max-ratio", type=float, default=3.0, help="fail when the batch takes more than this many single requests")
+  args = parser.parse_args()
+
+  directory = tempfile.mkdtemp(prefix="check-concurrency-")
+  os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'check.db')}"
+  os.environ["MARKET_DATA_PROVIDER"] = "fixture"
+  os.environ["MARKET_DATA_FIXTURE_LATENCY"] = str(args.latency)
+  os.environ.setdefault("SECRET_KEY", "check")
+  os.environ.setdefault("ALGORITHM", "HS256")
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  from fastapi import FastAPI
+  import auth.models, positions.models, tickers.models # register every model before migrating
+  import migrations
+  import executors
+  from database import engine
+  from tickers.router import router
+
+  migrations.migrate(engine)
+  app = FastAPI()
+  app.include_router(router, prefix="/tickers")
+  @app.get("/ping")
+  async def ping():
+    return {}
+
+  asyncio.run(batch(app, 1)) # warm up: imports, pools, first queries
+  single = asyncio.run(batch(app, 1))
+  pooled = asyncio.run(batch(app, args.concurrency))
+
+  async def inline(fn, *args, **kwargs): # the routes before the executors: blocking work on the event loop
+    return fn(*args, **kwargs)
+  run_io = executors.run_io
+  executors.run_io = inline
+  serialized = asyncio.run(batch(app, args.concurrency))
+  executors.run_io = run_io
+  executors.shutdown()
+
+  ratio = pooled["seconds"] / single["seconds"]
+  print(f"fixture provider latency {args.latency}s per call")
+  print(f"1 request:                         {single['seconds']:6.2f}s")
+  print(f"{args.concurrency} concurrent, executors:         {pooled['seconds']:6.2f}s ({ratio:.1f}x one request), "
+        f"probe {pooled['probe_ms']:.0f}ms, {pooled['ok']}/{args.concurrency} ok")
+  print(f"{args.concurrency} concurrent, inline (reference): {serialized['seconds']:6.2f}s "
+        f"({serialized['seconds'] / single['seconds']:.1f}x one request), probe {serialized['probe_ms']:.0f}ms")
+  if pooled["ok"] != args.concurrency or ratio > args.max_ratio:
+    print(f"FAIL: concurrent requests serialize (more than {args.max_ratio}x one request) or failed")
+    return 1
+  print("OK: concurrent requests overlap")
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,31 @@
+"""
+Consistency check of the materialized position summaries.
+
+Rebuilds the per-user summaries from the positions table and prints every group whose stored totals differ.
+Exits with status 1 on a difference; with --repair the rebuilt summaries replace the stored ones.
+
+  python -m testing.check_summaries [--user 1] [--repair]
+"""
+import argparse
+import json
+import sys
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--user", type=int, action="append", help="owner id to check (repeatable, default: every owner)")
+  parser.add_argument("--repair", action="store_true", help="replace mismatching summaries with the rebuilt ones")
+  args = parser.parse_args()
+
+  import auth.models, tickers.models # register every model
+  from database import SessionLocal
+  from positions import service
+
+  with SessionLocal() as db:
+    diffs = service.check_summaries(db, args.user, repair=args.repair)
+  for diff in diffs:
+    print(json.dumps(diff))
+  print(f"{len(diffs)} summary group(s) differ{' (repaired)' if diffs and args.repair else ''}")
+  return 1 if diffs and not args.repair else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Query-plan regression check for the hot repository queries.
+
+Seeds a large throwaway SQLite database (schema built by the migrations), calls every repository read/write on
+it, captures the SQL they emit and runs EXPLAIN QUERY PLAN on each statement. Exits with status 1 when a
+statement falls back to a full table scan (SCAN <table> without an index) that is not explicitly allowed.
+
+  python -m testing.query_plans [--rows 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+def seed(engine, rows: int):
+  from sqlalchemy import insert
+  from auth.models import User, RefreshToken
+  from positions.models import Position
+  from tickers.models import Ticker, Option, PriceBar, PriceBarRange, RefreshRun
+
+  rng = random.Random(7)
+  now = datetime.now(ZoneInfo("UTC"))
+  symbols = [f"T{i:05d}" for i in range(max(rows // 40, 10))]
+  users = max(rows // 1000, 2)
+  with engine.begin() as connection:
+    connection.execute(insert(User), [{"id": i, "email": f"user{i}", "hashed_password": "x"} for i in range(1, users + 1)])
+    connection.execute(insert(Ticker), [{"ticker": s, "closed_price": 100.0, "fetched_date": now - timedelta(days=rng.randint(0, 5))} for s in symbols])
+    options = []
+    for i in range(rows):
+      symbol = symbols[i % len(symbols)]
+      expiry = datetime(2030, 1, 4) + timedelta(weeks=(i // len(symbols)) % 8)
+      strike = 50.0 + (i // (len(symbols) * 8)) * 2.5
+      for kind in ("Call", "Put"):
+        options.append({
+          "id": f"{symbol}{expiry:%y%m%d}{kind[0]}{int(strike * 1000):08d}", "type": kind, "ticker": symbol, "strike_price": strike,
+          "expire_date": expiry, "bid": 1.0, "ask": 1.1, "volume": 10.0, "iv": 0.3, "itm": False, "fetched_date": now,
+        })
+    connection.execute(insert(Option).prefix_with("OR IGNORE"), options)
+    connection.execute(insert(Position), [{
+      "category": "Long", "ticker": symbols[i % len(symbols)], "qty": 100, "trade_price": 10.0,
+      "open_date": date(2020, 1, 1) + timedelta(days=rng.randint(0, 1800)), "owner_id": 1 + i % users,
+    } for i in range(rows // 4)])
+    connection.execute(insert(PriceBar), [
+      {"ticker": s, "date": date(2024, 1, 1) + timedelta(days=d), "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0}
+      for s in symbols[:200] for d in range(250)
+    ])
+    connection.execute(insert(PriceBarRange), [
+      {"ticker": s, "start_date": date(2024, 1, 1), "end_date": date(2024, 9, 7), "settled": True, "fetched_date": now} for s in symbols
+    ])
+    connection.execute(insert(RefreshToken), [
+      {"token_hash": f"{i:064x}", "user_id": 1 + i % users, "expires_at": now + timedelta(seconds=rng.randint(-86400, 7 * 86400))} for i in range(rows // 4)
+    ])
+    connection.execute(insert(RefreshRun), [{"job": "nightly_refresh", "status": "succeeded", "checkpoint": None} for _ in range(1000)])
+  connection = engine.raw_connection()
+  connection.execute("ANALYZE") # the planner's choices should hold with real statistics
+  connection.commit()
+  connection.close()
+  return symbols
+
+def hot_queries(symbols: list[str]) -> list[tuple]:
+  """ (name, fn(db), allow_scan) for every repository function on a request or refresh path. """
+  from auth import repository as users
+  from positions import repository as positions
+  from tickers import models, repository as tickers
+
+  now = datetime.now(ZoneInfo("UTC"))
+  expiry = datetime(2030, 1, 4)
+  option = models.Option(ticker=symbols[3], expire_date=expiry, type="Call", strike_price=52.5)
+  chain_keys = [(symbols[1], expiry), (symbols[2], expiry)]
+  option_id = f"{symbols[1]}{expiry:%y%m%d}C{50000:08d}" # seeded contract (strike 50)
+  return [
+    ("tickers.get_ticker", lambda db: tickers.get_ticker(db, symbols[5]), False),
+    ("tickers.get_tickers", lambda db: tickers.get_tickers(db, symbols[:100]), False),
+    ("tickers.get_ticker_symbols_after", lambda db: tickers.get_ticker_symbols_after(db, symbols[100], 100), False),
+    ("tickers.bulk_update_tickers", lambda db: tickers.bulk_update_tickers(db, [{"ticker": symbols[0], "closed_price": 1.0, "fetched_date": now}]), False),
+    ("tickers.get_option_by_id", lambda db: tickers.get_option_by_id(db, option_id), False),
+    ("tickers.get_option", lambda db: tickers.get_option(db, option), False),
+    ("tickers.get_option_chain_fetched_date", lambda db: tickers.get_option_chain_fetched_date(db, symbols[3], expiry), False),
+    ("tickers.get_option_chain_keys_after", lambda db: tickers.get_option_chain_keys_after(db, (symbols[10], expiry), 100), False),
+    ("tickers.get_option_ids_by_chain", lambda db: tickers.get_option_ids_by_chain(db, chain_keys), False),
+    ("tickers.get_option_strikes_by_chain", lambda db: tickers.get_option_strikes_by_chain(db, chain_keys), False),
+    ("tickers.get_options_by_chain", lambda db: tickers.get_options_by_chain(db, chain_keys), False),
+    ("tickers.bulk_update_options", lambda db: tickers.bulk_update_options(db, [{"id": option_id, "bid": 1.0}]), False),
+    ("tickers.get_price_bars", lambda db: tickers.get_price_bars(db, symbols[0], date(2024, 2, 1), date(2024, 3, 1)), False),
+    ("tickers.get_price_bar_ranges", lambda db: tickers.get_price_bar_ranges(db, symbols[0]), False),
+    ("tickers.get_unfinished_refresh_run", lambda db: tickers.get_unfinished_refresh_run(db, "nightly_refresh"), False),
+    ("tickers.get_refresh_runs", lambda db: tickers.get_refresh_runs(db, 10), True), # newest rows by rowid, bounded by LIMIT
+    ("positions.get_position_by_id", lambda db: positions.get_position_by_id(db, 42), False),
+    ("positions.retrieve_positions_by_owner_id", lambda db: positions.retrieve_positions_by_owner_id(db, 1, 100), False),
+    ("positions.retrieve_positions_by_owner_id (cursor)", lambda db: positions.retrieve_positions_by_owner_id(db, 1, 100, (date(2022, 6, 1), 5000)), False),
+    ("positions.stream_positions_by_owner_id", lambda db: list(positions.stream_positions_by_owner_id(db, 1, ["id", "open_date"], (date(2022, 6, 1), 5000))), False),
+    ("positions.get_open_option_position_columns_by_owner_id", lambda db: positions.get_open_option_position_columns_by_owner_id(db, 1), False),
+    ("positions.get_position_summaries", lambda db: positions.get_position_summaries(db, 1), False),
+    ("positions.get_open_option_position_columns_by_tickers", lambda db: positions.get_open_option_position_columns_by_tickers(db, symbols[:3]), False),
+    ("positions.revalue_position_summaries", lambda db: positions.revalue_position_summaries(db, symbols[:3]), False),
+    ("auth.get_user_by_email", lambda db: users.get_user_by_email(db, "user1"), False),
+    ("auth.pop_refresh_token", lambda db: users.pop_refresh_token(db, f"{7:064x}", now), False),
+    ("auth.delete_expired_refresh_tokens", lambda db: users.delete_expired_refresh_tokens(db, now, 1000), False),
+  ]
+
+def full_scans(plan: list[tuple]) -> list[str]:
+  # plan rows are (id, parent, notused, detail); "SCAN t USING [COVERING] INDEX ..." walks an index, not the table
+  return [row[3] for row in plan if row[3].startswith("SCAN ") and " USING " not in row[3] and "CONSTANT ROW" not in row[3]]
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument("--rows", type=int, default=200_000, help="number of option contracts per type to seed")
+  args = parser.parse_args()
+
+  directory = tempfile.mkdtemp(prefix="query-plans-")
+  os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'plans.db')}"
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  from sqlalchemy import event
+  import auth.models, positions.models, tickers.models # register every model before migrating
+  import migrations
+  from database import engine, SessionLocal
+
+  migrations.migrate(engine)
+  symbols = seed(engine, args.rows)
+
+  captured = []
+  @event.listens_for(engine, "before_cursor_execute")
+  def capture(conn, cursor, statement, parameters, context, executemany):
+    if not statement.lstrip().upper().startswith(("EXPLAIN", "BEGIN", "COMMIT", "ROLLBACK")):
+      captured.append((statement, parameters[0] if executemany and parameters else parameters))
+
+  failures = 0
+  for name, query, allow_scan in hot_queries(symbols):
+    captured.clear()
+    with SessionLocal() as db:
+      query(db)
+      db.rollback()
+    statements = list(captured)
+    for statement, parameters in statements:
+      with engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+      scans = full_scans(plan)
+      status = "ok" if not scans else "allowed" if allow_scan else "FULL SCAN"
+      print(f"{status:9} {name}: {' | '.join(row[3] for row in plan)}")
+      if scans and not allow_scan:
+        failures += 1
+  print(f"{failures} statement(s) fall back to a full table scan" if failures else "every hot query uses an index")
+  return 1 if failures else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
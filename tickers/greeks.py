@@ -0,0 +1,110 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+  return np.exp(-0.5 * x * x) / SQRT_2PI
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+  """ Standard normal CDF through the Abramowitz-Stegun 7.1.26 erf approximation (absolute error < 1.5e-7). """
+  z = np.abs(x) / np.sqrt(2)
+  t = 1 / (1 + 0.3275911 * z)
+  poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+  erf = 1 - poly * np.exp(-z * z)
+  return 0.5 * (1 + np.sign(x) * erf)
+
+def years_to_expiry(expiries, now: datetime | None = None) -> np.ndarray:
+  """ Years (365-day) from `now` to the 16:00 New York close of each expiry date; negative once expired. """
+  now = now or datetime.now(ZoneInfo("UTC"))
+  closes = (pd.to_datetime(pd.Series(expiries, dtype=object)).dt.normalize() + pd.Timedelta(hours=16)).dt.tz_localize("America/New_York")
+  return ((closes - pd.Timestamp(now)).dt.total_seconds() / (365 * 86400)).to_numpy(dtype=float)
+
+def black_scholes(spot, strike, years, vol, rate, is_call) -> dict[str, np.ndarray]:
+  """
+  Black-Scholes price and Greeks (no dividends) for arrays of contracts, broadcast together.
+  Returns per-unit price, delta, gamma, theta (per calendar day) and vega (per 1 point of volatility, i.e. 0.01).
+  Expired contracts (years <= 0) or contracts without a volatility are worth their intrinsic value, with a 0/1
+  delta and no gamma, theta or vega; rows with a missing spot or strike come back NaN.
+  """
+  spot, strike, years, vol, rate = (np.asarray(value, dtype=float) for value in (spot, strike, years, vol, rate))
+  is_call = np.asarray(is_call, dtype=bool)
+  spot, strike, years, vol, rate, is_call = np.broadcast_arrays(spot, strike, years, vol, rate, is_call)
+  intrinsic = np.where(is_call, np.maximum(spot - strike, 0), np.maximum(strike - spot, 0))
+  live = (years > 0) & (vol > 0) & (spot > 0) & (strike > 0)
+
+  with np.errstate(divide="ignore", invalid="ignore"):
+    t = np.where(live, years, 1.0)
+    sigma = np.where(live, vol, 1.0)
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(np.where(live, spot / strike, 1.0)) + (rate + 0.5 * sigma * sigma) * t) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+  discount = np.exp(-rate * t)
+  pdf_d1 = norm_pdf(d1)
+  call = spot * norm_cdf(d1) - strike * discount * norm_cdf(d2)
+  put = strike * discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+  decay = -spot * pdf_d1 * sigma / (2 * sqrt_t)
+  theta = np.where(is_call, decay - rate * strike * discount * norm_cdf(d2), decay + rate * strike * discount * norm_cdf(-d2))
+
+  expired_delta = np.where(intrinsic > 0, np.where(is_call, 1.0, -1.0), 0.0)
+  return {
+    "price": np.where(live, np.where(is_call, call, put), intrinsic),
+    "delta": np.where(live, np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1), expired_delta),
+    "gamma": np.where(live, pdf_d1 / (spot * sigma * sqrt_t), 0.0),
+    "theta": np.where(live, theta / 365, 0.0),
+    "vega": np.where(live, spot * pdf_d1 * sqrt_t / 100, 0.0),
+  }
+
+def implied_volatility(price, spot, strike, years, rate, is_call, tolerance: float = 1e-6, max_iterations: int = 100) -> np.ndarray:
+  """
+  Volatility at which Black-Scholes reproduces `price`, solved for every contract at once: Newton steps on vega,
+  kept inside a bisection bracket [0.001, 5] so a flat vega (deep in/out of the money) cannot diverge.
+  NaN where the price is outside the no-arbitrage bounds (below intrinsic value or above the spot/strike) or expired.
+  """
+  price, spot, strike, years, rate = (np.asarray(value, dtype=float) for value in (price, spot, strike, years, rate))
+  is_call = np.asarray(is_call, dtype=bool)
+  price, spot, strike, years, rate, is_call = np.broadcast_arrays(price, spot, strike, years, rate, is_call)
+  discounted_strike = strike * np.exp(-rate * np.maximum(years, 0))
+  lower_bound = np.where(is_call, np.maximum(spot - discounted_strike, 0), np.maximum(discounted_strike - spot, 0))
+  upper_bound = np.where(is_call, spot, discounted_strike)
+  solvable = (years > 0) & (spot > 0) & (strike > 0) & (price > lower_bound) & (price < upper_bound)
+
+  low, high = np.full(price.shape, 1e-3), np.full(price.shape, 5.0)
+  vol = np.full(price.shape, 0.3)
+  active = solvable.copy()
+  for _ in range(max_iterations):
+    if not active.any():
+      break
+    model = black_scholes(spot[active], strike[active], years[active], vol[active], rate[active], is_call[active])
+    error = model["price"] - price[active]
+    done = np.abs(error) < tolerance
+    # price is increasing in volatility: shrink the bracket around the root
+    low[active] = np.where(error < 0, vol[active], low[active])
+    high[active] = np.where(error > 0, vol[active], high[active])
+    vega = model["vega"] * 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+      newton = vol[active] - error / vega
+    inside = (vega > 1e-8) & (newton > low[active]) & (newton < high[active])
+    step = np.where(inside, newton, (low[active] + high[active]) / 2)
+    vol[active] = np.where(done, vol[active], step)
+    indices = np.flatnonzero(active)
+    active[indices[done]] = False
+  return np.where(solvable, vol, np.nan)
+
+def mid_price(bid, ask) -> np.ndarray:
+  """ Midpoint of a two-sided quote, NaN when either side is missing or zero. """
+  bid, ask = np.asarray(bid, dtype=float), np.asarray(ask, dtype=float)
+  return np.where((bid > 0) & (ask > 0) & (ask >= bid), (bid + ask) / 2, np.nan)
+
+def evaluate_contracts(spot, strike, expiries, is_call, bid, ask, provider_iv, rate: float, now: datetime | None = None) -> dict[str, np.ndarray]:
+  """
+  Implied volatility, model price and Greeks of a batch of contracts in one pass. The volatility is solved from the
+  bid/ask midpoint; the provider's implied volatility is used where the quote is one-sided or cannot be inverted.
+  """
+  years = years_to_expiry(expiries, now)
+  solved = implied_volatility(mid_price(bid, ask), spot, strike, years, rate, is_call)
+  provider_iv = np.asarray(provider_iv, dtype=float)
+  iv = np.where(np.isnan(solved), np.where(provider_iv > 0, provider_iv, np.nan), solved)
+  return {"years": years, "iv": iv, **black_scholes(spot, strike, years, iv, rate, is_call)}
@@ -0,0 +1,38 @@
+import numpy as np
+
+TRADING_DAYS = 252
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+  """
+  Sample standard deviation of every `window`-long slice of `values` (result[i] covers values[i:i + window]),
+  from prefix sums of the values and their squares: one pass for any number of windows, no Python loop.
+  """
+  values = np.asarray(values, dtype=float)
+  if window < 2 or values.shape[0] < window:
+    return np.array([])
+  centered = values - values.mean() # keeps the sums of squares well conditioned
+  sums = np.concatenate(([0.0], np.cumsum(centered)))
+  squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+  window_sums = sums[window:] - sums[:-window]
+  window_squares = squares[window:] - squares[:-window]
+  variance = (window_squares - window_sums * window_sums / window) / (window - 1)
+  return np.sqrt(np.maximum(variance, 0))
+
+def historical_volatility(closes: np.ndarray, windows: list[int]) -> dict[int, float | None]:
+  """ Annualized close-to-close volatility (%) over the last `window` daily log returns, per window (None: too few bars). """
+  closes = np.asarray(closes, dtype=float)
+  closes = closes[np.isfinite(closes) & (closes > 0)]
+  returns = np.diff(np.log(closes))
+  volatility = {}
+  for window in windows:
+    rolling = rolling_std(returns, window)
+    volatility[window] = round(float(rolling[-1] * np.sqrt(TRADING_DAYS) * 100), 2) if rolling.shape[0] else None
+  return volatility
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+  """ Cumulative volume-weighted average of the typical price (high + low + close) / 3, bar by bar. """
+  typical = (np.asarray(high, dtype=float) + np.asarray(low, dtype=float) + np.asarray(close, dtype=float)) / 3
+  volume = np.nan_to_num(np.asarray(volume, dtype=float))
+  traded = np.cumsum(volume)
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.where(traded > 0, np.cumsum(np.nan_to_num(typical) * volume) / traded, np.nan)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, String, DateTime, ForeignKey, Boolean 
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.types import Enum
 from sqlalchemy.orm import relationship 
 from database import Base
@@ -11,7 +11,7 @@ class Ticker(Base):
     ticker = Column(String, primary_key=True)
     closed_price = Column(Float)
     # fetched_date = Column(Date, default=date.today) 
-    fetched_date = Column(DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("UTC")))
+    fetched_date = Column(DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("UTC")), index=True)
 
     positions = relationship("Position", back_populates="ticker_belongs_to")
     options = relationship("Option", back_populates="ticker_of") # one-to-many relationship with Option
@@ -34,3 +34,50 @@ class Option(Base):
     fetched_date = Column(DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("UTC")))
 
     ticker_of = relationship("Ticker", back_populates="options") 
+
+    __table_args__ = (
+        Index("ix_options_chain_strike", "ticker", "expire_date", "type", "strike_price"), # contract lookup by (chain, type, strike)
+    )
+
+class PriceBar(Base):
+    __tablename__ = "price_bars" # local daily OHLCV store backing historical prices
+
+    ticker = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+
+class PriceBarRange(Base):
+    __tablename__ = "price_bar_ranges" # date ranges already fetched into price_bars, so gaps (weekends, holidays) are not refetched
+
+    id = Column(Integer, primary_key=True)
+    ticker = Column(String, index=True)
+    start_date = Column(Date)
+    end_date = Column(Date) # exclusive
+    settled = Column(Boolean, default=True) # False when the range reaches into the current session: only trusted while fresh
+    fetched_date = Column(DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("UTC")))
+
+class RefreshRun(Base):
+    __tablename__ = "refresh_runs" # one row per scheduled refresh run, with a resumable checkpoint
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String, index=True)
+    status = Column(Enum('running', 'succeeded', 'failed'))
+    started_at = Column(DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("UTC")))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration = Column(Float, default=0) # seconds spent running, summed over resumed attempts
+    processed = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    checkpoint = Column(String, nullable=True) # JSON: {"stage": "tickers"|"options", "after": last key of the last committed page}
+    error = Column(String, nullable=True)
+
+class JobLease(Base):
+    __tablename__ = "job_leases" # single-runner lock shared by every worker using this database
+
+    job = Column(String, primary_key=True)
+    owner = Column(String)
+    expires_at = Column(DateTime(timezone=True))
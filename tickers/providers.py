@@ -0,0 +1,302 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache, wraps
+from zoneinfo import ZoneInfo
+import json
+import time
+import zlib
+import numpy as np
+import pandas as pd
+import yfinance as yf
+import executors
+import settings
+import telemetry
+
+# same shape as yf.Ticker.option_chain(), so callers can use .calls / .puts regardless of the backend
+OptionChain = namedtuple("OptionChain", ["calls", "puts", "underlying"])
+
+HISTORY_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# upstream calls timed per provider and method (provider_call_duration_seconds on /metrics)
+UPSTREAM_METHODS = ("get_quotes", "get_history", "get_option_expirations", "get_option_chains", "get_info", "get_earnings_dates")
+
+def _timed(provider: str, method: str, fn):
+  @wraps(fn)
+  def call(self, *args, **kwargs):
+    return telemetry.timed_call(provider, method, fn, self, *args, **kwargs)
+  return call
+
+class MarketDataProvider:
+  """
+  Interface for market data backends. Every method is batched over symbols (or expiries) so a backend
+  can serve a whole page of work with one upstream round trip.
+  """
+  name = "base"
+
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    for method in UPSTREAM_METHODS:
+      if method in cls.__dict__: # each backend's own implementations, so a call is timed once
+        setattr(cls, method, _timed(cls.name, method, cls.__dict__[method]))
+
+  def get_quotes(self, symbols: list[str]) -> dict[str, float]:
+    """ Latest closing price per symbol. Symbols without data are left out of the result. """
+    raise NotImplementedError
+
+  def get_history(self, symbols: list[str], start: date, end: date, interval: str = "1d") -> dict[str, pd.DataFrame]:
+    """
+    OHLCV bars per symbol for [start, end). Each frame is indexed by a DatetimeIndex named 'Date' and has
+    the columns Open, High, Low, Close, Volume. Symbols without data are left out of the result.
+    """
+    raise NotImplementedError
+
+  def get_option_expirations(self, symbol: str) -> list[str]:
+    """ Listed expiration dates in 'YYYY-MM-DD' format. """
+    raise NotImplementedError
+
+  def get_option_chains(self, symbol: str, expiries: list[str]) -> dict[str, OptionChain]:
+    """ Option chains (calls and puts, yfinance column layout) keyed by expiry. """
+    raise NotImplementedError
+
+  def get_option_chain(self, symbol: str, expiry: str) -> OptionChain:
+    return self.get_option_chains(symbol, [expiry])[expiry]
+
+  def get_info(self, symbols: list[str]) -> dict[str, dict]:
+    """ Fundamentals (marketCap, trailingPE, beta, dividendRate, ...) keyed by symbol. """
+    raise NotImplementedError
+
+  def get_earnings_dates(self, symbol: str) -> pd.DataFrame:
+    """ Earnings calendar indexed by 'Earnings Date' with EPS Estimate, Reported EPS and Surprise(%) columns. """
+    raise NotImplementedError
+
+def _upstream_symbols(symbols: list[str]) -> dict[str, list[str]]:
+  # yf.download uppercases symbols and keys its columns by them: upstream symbol -> the caller's spellings of it
+  upstream = {}
+  for symbol in symbols:
+    upstream.setdefault(symbol.upper(), []).append(symbol)
+  return upstream
+
+class YFinanceProvider(MarketDataProvider):
+  """ Default backend: Yahoo Finance through yfinance. """
+  name = "yfinance"
+
+  def get_quotes(self, symbols: list[str]) -> dict[str, float]:
+    if not symbols:
+      return {}
+    upstream = _upstream_symbols(symbols)
+    data = yf.download(list(upstream), period="1d", auto_adjust=True, progress=False, threads=True) # one multi-symbol request
+    if data is None or data.empty:
+      return {}
+    closes = data["Close"]
+    if isinstance(closes, pd.Series): # single symbol without a column level
+      closes = closes.to_frame(next(iter(upstream)))
+    quotes = {}
+    for symbol, requested in upstream.items():
+      if symbol not in closes.columns:
+        continue
+      column = closes[symbol].dropna()
+      if column.shape[0] != 0:
+        quotes.update(dict.fromkeys(requested, float(column.iloc[-1])))
+    return quotes
+
+  def get_history(self, symbols: list[str], start: date, end: date, interval: str = "1d") -> dict[str, pd.DataFrame]:
+    if not symbols:
+      return {}
+    upstream = _upstream_symbols(symbols)
+    data = yf.download(list(upstream), start=start, end=end, interval=interval, group_by="ticker", auto_adjust=True, progress=False, threads=True)
+    if data is None or data.empty:
+      return {}
+    history = {}
+    for symbol, requested in upstream.items():
+      if symbol not in data.columns.get_level_values(0):
+        continue
+      frame = data[symbol][HISTORY_COLUMNS].dropna(how="all")
+      if frame.shape[0] != 0:
+        frame.index.name = "Date" # intraday frames come back as 'Datetime'
+        history.update(dict.fromkeys(requested, frame))
+    return history
+
+  def get_option_expirations(self, symbol: str) -> list[str]:
+    return list(yf.Ticker(symbol).options)
+
+  def get_option_chains(self, symbol: str, expiries: list[str]) -> dict[str, OptionChain]:
+    data = yf.Ticker(symbol) # share the ticker object so the expiry list is only downloaded once
+    futures = [executors.submit_fetch(self.name, data.option_chain, exp) for exp in expiries] # shared, bounded pool
+    chains = [future.result() for future in futures]
+    return {exp: OptionChain(chain.calls, chain.puts, chain.underlying) for exp, chain in zip(expiries, chains)}
+
+  def get_info(self, symbols: list[str]) -> dict[str, dict]:
+    return {symbol: yf.Ticker(symbol).info for symbol in symbols}
+
+  def get_earnings_dates(self, symbol: str) -> pd.DataFrame:
+    earnings_dates = yf.Ticker(symbol).get_earnings_dates()
+    if earnings_dates is None:
+      return pd.DataFrame(columns=["EPS Estimate", "Reported EPS", "Surprise(%)"])
+    return earnings_dates
+
+class FixtureProvider(MarketDataProvider):
+  """
+  Deterministic offline backend for load tests and profiling. Every value is derived from the symbol (and the
+  date, for bars) so overlapping requests always agree, and nothing touches the network.
+  An optional JSON fixture file can pin prices/info per symbol and list delisted symbols:
+    {"delisted": ["XYZ"], "symbols": {"AAPL": {"price": 190.5, "info": {"beta": 1.2}}}}
+  `latency` (seconds) is slept on every call to simulate a slow upstream.
+  """
+  name = "fixture"
+
+  def __init__(self, fixture_path: str | None = None, latency: float = 0.0):
+    self.latency = latency
+    self.delisted = set()
+    self.symbols = {}
+    if fixture_path:
+      with open(fixture_path, "r") as f:
+        fixture = json.load(f)
+      self.delisted = {s.upper() for s in fixture.get("delisted", [])}
+      self.symbols = {s.upper(): v for s, v in fixture.get("symbols", {}).items()}
+
+  def _wait(self):
+    if self.latency > 0:
+      time.sleep(self.latency)
+
+  def _known(self, symbol: str) -> bool:
+    return symbol.upper() not in self.delisted
+
+  def _seed(self, symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode())
+
+  def _base_price(self, symbol: str) -> float:
+    pinned = self.symbols.get(symbol.upper(), {}).get("price")
+    if pinned is not None:
+      return float(pinned)
+    return float(10 + self._seed(symbol) % 490) # between 10 and 500
+
+  def _closes(self, symbol: str, days: pd.DatetimeIndex) -> np.ndarray:
+    # smooth wave plus hashed per-day noise: the close on a given day only depends on (symbol, day)
+    seed = self._seed(symbol)
+    ordinals = days.to_julian_date().to_numpy()
+    phase = (seed % 628) / 100
+    noise = np.modf(np.abs(np.sin(ordinals * 12.9898 + seed) * 43758.5453))[0] - 0.5
+    return self._base_price(symbol) * (1 + 0.08 * np.sin(ordinals / 23 + phase) + 0.02 * noise)
+
+  def _bars(self, symbol: str, index: pd.DatetimeIndex) -> pd.DataFrame:
+    closes = self._closes(symbol, index)
+    spread = closes * 0.01
+    volume = (1e6 + (self._seed(symbol) % 9e6)) * (1 + 0.5 * np.cos(index.to_julian_date().to_numpy()))
+    frame = pd.DataFrame({
+      "Open": closes - spread * 0.3,
+      "High": closes + spread,
+      "Low": closes - spread,
+      "Close": closes,
+      "Volume": np.round(volume),
+    }, index=index)
+    frame.index.name = "Date"
+    return frame
+
+  def get_quotes(self, symbols: list[str]) -> dict[str, float]:
+    self._wait()
+    last_session = pd.bdate_range(end=pd.Timestamp(date.today()), periods=1)
+    return {s: float(np.round(self._closes(s, last_session)[0], 2)) for s in symbols if self._known(s)}
+
+  def get_history(self, symbols: list[str], start: date, end: date, interval: str = "1d") -> dict[str, pd.DataFrame]:
+    self._wait()
+    days = pd.bdate_range(start=pd.Timestamp(start), end=pd.Timestamp(end) - pd.Timedelta(days=1))
+    if interval != "1d": # intraday: regular session bars in exchange time
+      step = pd.Timedelta(interval.replace("m", "min"))
+      sessions = [pd.date_range(d + pd.Timedelta(hours=9, minutes=30), d + pd.Timedelta(hours=16), freq=step, inclusive="left") for d in days]
+      index = sessions[0].append(sessions[1:]) if sessions else pd.DatetimeIndex([])
+      index = index.tz_localize("America/New_York")
+    else:
+      index = days
+    if len(index) == 0:
+      return {}
+    return {s: self._bars(s, index) for s in symbols if self._known(s)}
+
+  def get_option_expirations(self, symbol: str) -> list[str]:
+    self._wait()
+    if not self._known(symbol):
+      return []
+    today = date.today()
+    first_friday = today + timedelta(days=(4 - today.weekday()) % 7)
+    return [str(first_friday + timedelta(weeks=w)) for w in range(8)]
+
+  def _chain_side(self, symbol: str, expiry: str, spot: float, is_call: bool) -> pd.DataFrame:
+    step = 1.0 if spot < 50 else 5.0 if spot < 300 else 10.0
+    strikes = np.arange(np.floor(spot * 0.7 / step) * step, spot * 1.3 + step, step)
+    days_left = max((date.fromisoformat(expiry) - date.today()).days, 1)
+    iv = 0.25 + 0.1 * np.abs(strikes / spot - 1) + (self._seed(symbol) % 20) / 100
+    intrinsic = np.maximum(spot - strikes, 0) if is_call else np.maximum(strikes - spot, 0)
+    time_value = spot * iv * np.sqrt(days_left / 365) * 0.4 * np.exp(-((strikes / spot - 1) ** 2) * 20)
+    mid = np.round(intrinsic + time_value, 2)
+    seed = (self._seed(symbol) + zlib.crc32(expiry.encode()) + (0 if is_call else 1)) % (2**32)
+    volume = np.random.default_rng(seed).integers(0, 5000, size=strikes.shape[0]).astype(float)
+    flag = "C" if is_call else "P"
+    expiry_code = expiry[2:].replace("-", "")
+    return pd.DataFrame({
+      "contractSymbol": [f"{symbol.upper()}{expiry_code}{flag}{int(round(k * 1000)):08d}" for k in strikes],
+      "lastTradeDate": pd.Timestamp(datetime.now(ZoneInfo("UTC"))),
+      "strike": strikes,
+      "lastPrice": mid,
+      "bid": np.round(np.maximum(mid - 0.05, 0), 2),
+      "ask": np.round(mid + 0.05, 2),
+      "change": 0.0,
+      "percentChange": 0.0,
+      "volume": volume,
+      "openInterest": volume * 3,
+      "impliedVolatility": iv,
+      "inTheMoney": intrinsic > 0,
+      "contractSize": "REGULAR",
+      "currency": "USD",
+    })
+
+  def get_option_chains(self, symbol: str, expiries: list[str]) -> dict[str, OptionChain]:
+    self._wait()
+    spot = self._base_price(symbol)
+    return {
+      exp: OptionChain(self._chain_side(symbol, exp, spot, True), self._chain_side(symbol, exp, spot, False), {"symbol": symbol.upper()})
+      for exp in expiries
+    }
+
+  def get_info(self, symbols: list[str]) -> dict[str, dict]:
+    self._wait()
+    info = {}
+    for symbol in symbols:
+      if not self._known(symbol):
+        info[symbol] = {}
+        continue
+      seed = self._seed(symbol)
+      price = self._base_price(symbol)
+      info[symbol] = {
+        "symbol": symbol.upper(),
+        "volume": 1_000_000 + seed % 9_000_000,
+        "averageVolume": 1_500_000 + seed % 8_000_000,
+        "marketCap": int(price * (1e8 + seed % 1e10)),
+        "trailingPE": 5 + (seed % 4000) / 100,
+        "trailingEps": round(price / (5 + (seed % 4000) / 100), 2),
+        "beta": 0.5 + (seed % 150) / 100,
+        "dividendRate": round(price * 0.02, 2) if seed % 2 == 0 else None,
+        "dividendYield": 0.02 if seed % 2 == 0 else None,
+        "exDividendDate": int(datetime(date.today().year, 1, 15, tzinfo=ZoneInfo("UTC")).timestamp()) if seed % 2 == 0 else None,
+        **self.symbols.get(symbol.upper(), {}).get("info", {}),
+      }
+    return info
+
+  def get_earnings_dates(self, symbol: str) -> pd.DataFrame:
+    self._wait()
+    seed = self._seed(symbol)
+    upcoming = pd.Timestamp(date.today() + timedelta(days=seed % 90 + 1)).tz_localize("America/New_York") + pd.Timedelta(hours=16)
+    index = pd.DatetimeIndex([upcoming - pd.DateOffset(months=3 * q) for q in range(8)], name="Earnings Date")
+    estimates = np.round(1 + (seed % 300) / 100 + np.arange(8) * -0.02, 2)
+    reported = np.round(estimates * 1.03, 2)
+    reported[0] = np.nan # upcoming quarter has not reported yet
+    return pd.DataFrame({
+      "EPS Estimate": estimates,
+      "Reported EPS": reported,
+      "Surprise(%)": np.round((reported - estimates) / estimates * 100, 2),
+    }, index=index)
+
+@lru_cache(maxsize=1)
+def get_provider() -> MarketDataProvider:
+  """ Process-wide provider selected by MARKET_DATA_PROVIDER ('yfinance' or 'fixture'). """
+  if settings.MARKET_DATA_PROVIDER == "fixture":
+    return FixtureProvider(settings.MARKET_DATA_FIXTURE_PATH, settings.MARKET_DATA_FIXTURE_LATENCY)
+  return YFinanceProvider()
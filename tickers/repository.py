@@ -1,10 +1,28 @@
+from sqlalchemy import and_, func, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session 
 from . import models # database models
+from datetime import date, datetime
 
 # read
 def get_ticker(db: Session, ticker: str) -> models.Ticker | None:
   return db.query(models.Ticker).filter(models.Ticker.ticker==ticker).first()
 
+# read (many symbols in one query)
+def get_tickers(db: Session, tickers: list[str]) -> list[models.Ticker]:
+  return db.query(models.Ticker).filter(models.Ticker.ticker.in_(tickers)).all() if tickers else []
+
+# create or update (bulk: [{"ticker": ..., "closed_price": ..., "fetched_date": ...}, ...])
+def upsert_tickers(db: Session, rows: list[dict]) -> None:
+  if rows:
+    statement = sqlite_insert(models.Ticker).values(rows)
+    statement = statement.on_conflict_do_update(
+      index_elements=[models.Ticker.ticker],
+      set_={column: statement.excluded[column] for column in ("closed_price", "fetched_date")},
+    )
+    db.execute(statement)
+  db.commit()
+
 # create
 def create_ticker(db: Session, ticker: models.Ticker) -> models.Ticker:
   db.add(ticker)
@@ -23,14 +41,20 @@ def update_ticker(db: Session, ticker: models.Ticker) -> models.Ticker:
 def get_option_by_id(db: Session, option_id: str) -> models.Option | None:
   return db.query(models.Option).filter(models.Option.id == option_id).first()
 
-# read 
-def get_option(db: Session, option:models.Option) -> models.Option | None:
+# read (strike matched within `tolerance`: strikes are floats, 172.5 may be stored as 172.49999)
+def get_option(db: Session, option:models.Option, tolerance: float = 0.005) -> models.Option | None:
   return db.query(models.Option).filter(
     models.Option.ticker == option.ticker.upper(), 
-    models.Option.strike_price == option.strike_price, 
     models.Option.expire_date == option.expire_date,
-    models.Option.type == option.type
-  ).first()
+    models.Option.type == option.type,
+    models.Option.strike_price.between(option.strike_price - tolerance, option.strike_price + tolerance),
+  ).order_by(func.abs(models.Option.strike_price - option.strike_price)).first()
+
+# read (when the chain of an expiry was last stored, None if it never was)
+def get_option_chain_fetched_date(db: Session, ticker: str, expire_date: datetime) -> datetime | None:
+  return db.query(func.max(models.Option.fetched_date))\
+            .filter(models.Option.ticker == ticker, models.Option.expire_date == expire_date)\
+            .scalar()
 
 # create
 def create_option(db: Session, option: models.Option) -> models.Option:
@@ -44,4 +68,146 @@ def update_option(db: Session, option: models.Option) -> models.Option:
   db.merge(option) # merge is used to update an existing record
   db.commit()
   db.refresh(option)
-  return option
\ No newline at end of file
+  return option
+
+# read (keyset page of ticker symbols, ordered by primary key)
+def get_ticker_symbols_after(db: Session, after: str | None, limit: int = 100) -> list[str]:
+  query = db.query(models.Ticker.ticker)
+  if after is not None:
+    query = query.filter(models.Ticker.ticker > after)
+  return [row.ticker for row in query.order_by(models.Ticker.ticker).limit(limit).all()]
+
+# update (bulk, by primary key: [{"ticker": ..., "closed_price": ..., "fetched_date": ...}, ...])
+def bulk_update_tickers(db: Session, rows: list[dict]) -> None:
+  if rows:
+    db.execute(update(models.Ticker), rows)
+  db.commit()
+
+# read (keyset page of distinct (ticker, expire_date) chains)
+def get_option_chain_keys_after(db: Session, after: tuple | None, limit: int = 100) -> list[tuple]:
+  query = db.query(models.Option.ticker, models.Option.expire_date).distinct()
+  if after is not None:
+    query = query.filter(tuple_(models.Option.ticker, models.Option.expire_date) > tuple_(*after))
+  rows = query.order_by(models.Option.ticker, models.Option.expire_date).limit(limit).all()
+  return [(row.ticker, row.expire_date) for row in rows]
+
+# read (stored contract ids grouped by (ticker, expire_date))
+def get_option_ids_by_chain(db: Session, chain_keys: list[tuple]) -> dict[tuple, set[str]]:
+  option_ids = {}
+  if not chain_keys:
+    return option_ids
+  # OR of (ticker, expire_date) pairs: SQLite searches ix_options_chain_strike per pair, a row-value IN scans the table
+  rows = db.query(models.Option.id, models.Option.ticker, models.Option.expire_date)\
+            .filter(or_(*[and_(models.Option.ticker == ticker, models.Option.expire_date == expire_date) for ticker, expire_date in chain_keys]))\
+            .all()
+  for row in rows:
+    option_ids.setdefault((row.ticker, row.expire_date), set()).add(row.id)
+  return option_ids
+
+# read (stored (type, strike_price) pairs grouped by (ticker, expire_date))
+def get_option_strikes_by_chain(db: Session, chain_keys: list[tuple]) -> dict[tuple, set[tuple]]:
+  strikes = {}
+  if not chain_keys:
+    return strikes
+  rows = db.query(models.Option.ticker, models.Option.expire_date, models.Option.type, models.Option.strike_price)\
+            .filter(or_(*[and_(models.Option.ticker == ticker, models.Option.expire_date == expire_date) for ticker, expire_date in chain_keys]))\
+            .all()
+  for row in rows:
+    strikes.setdefault((row.ticker, row.expire_date), set()).add((row.type, row.strike_price))
+  return strikes
+
+# read (quotes of every stored contract of the given (ticker, expire_date) chains, as plain rows)
+def get_options_by_chain(db: Session, chain_keys: list[tuple]) -> list[tuple]:
+  if not chain_keys:
+    return []
+  return db.query(models.Option.id, models.Option.ticker, models.Option.expire_date, models.Option.type, models.Option.strike_price, models.Option.bid, models.Option.ask, models.Option.iv)\
+            .filter(or_(*[and_(models.Option.ticker == ticker, models.Option.expire_date == expire_date) for ticker, expire_date in chain_keys]))\
+            .order_by(models.Option.ticker, models.Option.expire_date, models.Option.type, models.Option.strike_price)\
+            .all()
+
+# create or update (bulk, a whole chain snapshot keyed by contract symbol)
+def upsert_options(db: Session, rows: list[dict], chunk_size: int = 500) -> None:
+  for i in range(0, len(rows), chunk_size): # stay under SQLite's bound-parameter limit
+    statement = sqlite_insert(models.Option).values(rows[i:i + chunk_size])
+    statement = statement.on_conflict_do_update(
+      index_elements=[models.Option.id],
+      set_={column: statement.excluded[column] for column in rows[0] if column != "id"},
+    )
+    db.execute(statement)
+  db.commit()
+
+# update (bulk, by primary key: [{"id": ..., "bid": ..., ...}, ...])
+def bulk_update_options(db: Session, rows: list[dict]) -> None:
+  if rows:
+    db.execute(update(models.Option), rows)
+  db.commit()
+
+# read (daily bars as plain rows, ordered by date)
+def get_price_bars(db: Session, ticker: str, start_date: date, end_date: date) -> list[tuple]:
+  return db.execute(
+    select(models.PriceBar.date, models.PriceBar.open, models.PriceBar.high, models.PriceBar.low, models.PriceBar.close, models.PriceBar.volume)
+      .where(models.PriceBar.ticker == ticker, models.PriceBar.date >= start_date, models.PriceBar.date < end_date)
+      .order_by(models.PriceBar.date)
+  ).all()
+
+# create or update (bulk)
+def upsert_price_bars(db: Session, rows: list[dict], chunk_size: int = 1000) -> None:
+  for i in range(0, len(rows), chunk_size): # stay under SQLite's bound-parameter limit
+    statement = sqlite_insert(models.PriceBar).values(rows[i:i + chunk_size])
+    statement = statement.on_conflict_do_update(
+      index_elements=[models.PriceBar.ticker, models.PriceBar.date],
+      set_={column: statement.excluded[column] for column in ("open", "high", "low", "close", "volume")},
+    )
+    db.execute(statement)
+  db.commit()
+
+# read
+def get_price_bar_ranges(db: Session, ticker: str) -> list[models.PriceBarRange]:
+  return db.query(models.PriceBarRange).filter(models.PriceBarRange.ticker == ticker).all()
+
+# replace all fetched ranges of a ticker
+def replace_price_bar_ranges(db: Session, ticker: str, ranges: list[models.PriceBarRange]) -> None:
+  db.query(models.PriceBarRange).filter(models.PriceBarRange.ticker == ticker).delete()
+  db.add_all(ranges)
+  db.commit()
+
+# create or renew a job lease: succeeds only if the lease is free, expired or already ours (atomic in SQLite)
+def acquire_job_lease(db: Session, job: str, owner: str, now: datetime, expires_at: datetime) -> bool:
+  statement = sqlite_insert(models.JobLease).values(job=job, owner=owner, expires_at=expires_at)
+  statement = statement.on_conflict_do_update(
+    index_elements=[models.JobLease.job],
+    set_={"owner": owner, "expires_at": expires_at},
+    where=(models.JobLease.expires_at < now) | (models.JobLease.owner == owner),
+  )
+  acquired = db.execute(statement).rowcount == 1
+  db.commit()
+  return acquired
+
+# delete
+def release_job_lease(db: Session, job: str, owner: str) -> None:
+  db.query(models.JobLease).filter(models.JobLease.job == job, models.JobLease.owner == owner).delete()
+  db.commit()
+
+# create
+def create_refresh_run(db: Session, run: models.RefreshRun) -> models.RefreshRun:
+  db.add(run)
+  db.commit()
+  db.refresh(run)
+  return run
+
+# update
+def update_refresh_run(db: Session, run: models.RefreshRun) -> models.RefreshRun:
+  db.merge(run)
+  db.commit()
+  return run
+
+# read
+def get_unfinished_refresh_run(db: Session, job: str) -> models.RefreshRun | None:
+  return db.query(models.RefreshRun)\
+            .filter(models.RefreshRun.job == job, models.RefreshRun.status == "running")\
+            .order_by(models.RefreshRun.id.desc())\
+            .first()
+
+# read
+def get_refresh_runs(db: Session, limit: int = 10) -> list[models.RefreshRun]:
+  return db.query(models.RefreshRun).order_by(models.RefreshRun.id.desc()).limit(limit).all()
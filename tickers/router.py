@@ -5,13 +5,39 @@ from datetime import datetime, date, timedelta
 from typing import Optional
 import redis
 from redis_client import get_redis_client 
-from . import schemas, service, exceptions
+import executors
+from cache import cache
+from auth.router import get_admin_user
+from . import schemas, service, repository, exceptions
+from .scheduler import scheduler, NIGHTLY_REFRESH
 router = APIRouter() 
 
+@router.get("/stats/singleflight", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def get_singleflight_stats() -> dict[str, dict[str, int]]:
+  # leads: fetched upstream, waits: shared an in-process fetch, remote_waits: waited on another worker, hits: served from its result
+  return service.flights.stats()
+
+@router.get("/stats/cache", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def get_cache_stats() -> dict:
+  # hits/misses and hit ratios of the in-process and redis tiers, per key family (closed_price, metrics, price_history, price_stats, ...)
+  return cache.stats()
+
+@router.get("/refresh/status", response_model=schemas.RefreshStatus, tags=["tickers"])
+async def get_refresh_status(limit: int = Query(10, ge=1, le=100), db: Session=Depends(get_db)) -> schemas.RefreshStatus:
+  # next scheduled nightly refresh, and the latest runs with their duration, symbols processed and failures
+  runs = await executors.run_io(repository.get_refresh_runs, db, limit)
+  return schemas.RefreshStatus(next_run=scheduler.next_runs.get(NIGHTLY_REFRESH), runs=runs)
+
+@router.post("/refresh/run", status_code=202, include_in_schema=False, dependencies=[Depends(get_admin_user)])
+async def run_refresh():
+  # admins only: start the nightly refresh now in the scheduler thread (skipped if another worker holds its lease)
+  scheduler.trigger(NIGHTLY_REFRESH)
+  return {"job": NIGHTLY_REFRESH, "status": "triggered"}
+
 @router.get("/{ticker}", response_model=schemas.Ticker, tags=["tickers"])
-async def get_closed_price(ticker: str, db: Session=Depends(get_db)) -> schemas.Ticker:
+async def get_closed_price(ticker: str, db: Session=Depends(get_db), redis_client: redis.Redis = Depends(get_redis_client)) -> schemas.Ticker:
   try: 
-    existing_ticker = service.get_closed_price(db, ticker)
+    existing_ticker = await executors.run_io(service.get_closed_price, db, ticker, redis_client)
     if not existing_ticker:
       raise exceptions.TickerNotFoundException(ticker)
   except Exception as error:
@@ -19,15 +45,22 @@ async def get_closed_price(ticker: str, db: Session=Depends(get_db)) -> schemas.
   return existing_ticker
 
 @router.post("/options/", response_model=schemas.Option_Details, tags=["tickers"])
-async def get_option(option: schemas.Option, db: Session=Depends(get_db)) -> schemas.Option_Details:
+async def get_option(option: schemas.Option, db: Session=Depends(get_db), redis_client: redis.Redis = Depends(get_redis_client)) -> schemas.Option_Details:
   try: 
-    existing_option = service.get_option_price(db, option)
+    existing_option = await executors.run_io(service.get_option_price, db, option, redis_client)
     if not existing_option:
       raise HTTPException(status_code=404, detail="No data found, strike price may not be correct.")
   except Exception as error:
     raise HTTPException(status_code=404, detail=str(error))
   return existing_option
 
+@router.get("/options/{ticker}/greeks", response_model=schemas.Chain_Greeks, tags=["tickers"])
+async def get_chain_greeks(ticker: str, expire_date: date = Query(..., description="Expiry of the chain (YYYY-MM-DD)"), db: Session=Depends(get_db), redis_client: redis.Redis = Depends(get_redis_client)) -> schemas.Chain_Greeks:
+  chain = await executors.run_io(service.get_chain_greeks, db, ticker.upper(), expire_date, redis_client)
+  if chain is None:
+    raise HTTPException(status_code=404, detail="No data found, symbol may be delisted.")
+  return chain
+
 @router.get("/historical_prices/{ticker_id}", tags=["tickers"])
 async def get_price_history(
   ticker_id: str, 
@@ -46,23 +79,17 @@ async def get_price_history(
   if from_date and to_date and from_date > to_date: 
     raise HTTPException(status_code=400, detail="from_date cannot be after to_date.")
 
-  existing_ticker = service.get_closed_price(db, ticker_id) # validation check: ticker_id
+  existing_ticker = await executors.run_io(service.get_closed_price, db, ticker_id, redis_client) # validation check: ticker_id
   if not existing_ticker:
     raise HTTPException(status_code=404, detail="No data found, symbol may be delisted.")
   
-  return service.get_historical_price(ticker_id, from_date, to_date, frequency.upper(),redis_client)
+  return await executors.run_io(service.get_historical_price, db, ticker_id, from_date, to_date, frequency.upper(), redis_client)
 
 @router.get("/metrics/{ticker_id}", tags=["tickers"])
 async def get_metrics(ticker_id: str, db: Session=Depends(get_db), redis_client: redis.Redis = Depends(get_redis_client)):
-  existing_ticker = service.get_closed_price(db, ticker_id) # validation check: ticker_id
+  existing_ticker = await executors.run_io(service.get_closed_price, db, ticker_id, redis_client) # validation check: ticker_id
   if not existing_ticker:
     raise HTTPException(status_code=404, detail="No data found, symbol may be delisted.")
   
   # retrieve data 
-  return service.get_metrics(ticker_id, redis_client)
-
-@router.get("/updates", include_in_schema=False) 
-async def update_tickers(db: Session=Depends(get_db)):
-  service.update_all_tickers(db)
-  service.update_all_options(db)
-  pass #12 factor logging....
\ No newline at end of file
+  return await executors.run_io(service.get_metrics, ticker_id, redis_client)
\ No newline at end of file
@@ -0,0 +1,194 @@
+from datetime import date, datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+from pandas.tseries.holiday import (
+  AbstractHolidayCalendar, Holiday, GoodFriday, USLaborDay, USMartinLutherKingJr, USMemorialDay, USPresidentsDay,
+  USThanksgivingDay, nearest_workday, sunday_to_monday,
+)
+import json
+import logging
+import threading
+import time
+import uuid
+from database import SessionLocal
+import redis_client
+import settings
+from . import models, repository, service
+
+logger = logging.getLogger(__name__)
+
+NIGHTLY_REFRESH = "nightly_refresh"
+
+class LeaseLostError(RuntimeError):
+  """ Raised by a job's heartbeat when another worker took over its lease (the job must stop writing). """
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+  rules = [
+    Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+    USMartinLutherKingJr,
+    USPresidentsDay,
+    GoodFriday,
+    USMemorialDay,
+    Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+    Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+    USLaborDay,
+    USThanksgivingDay,
+    Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+  ]
+
+class TradingDaySchedule:
+  """ Fires once per NYSE trading day (weekdays that are not market holidays) at a fixed exchange-local time. """
+  def __init__(self, at: dt_time, tz: str = "America/New_York"):
+    self.at = at
+    self.tz = ZoneInfo(tz)
+    self._holidays: dict[int, set[date]] = {}
+
+  def is_trading_day(self, day: date) -> bool:
+    if day.weekday() >= 5:
+      return False
+    if day.year not in self._holidays:
+      holidays = NYSEHolidayCalendar().holidays(start=f"{day.year}-01-01", end=f"{day.year}-12-31")
+      self._holidays[day.year] = set(holidays.date)
+    return day not in self._holidays[day.year]
+
+  def next_run(self, after: datetime) -> datetime:
+    """ First scheduled time strictly after `after` (timezone-aware), returned in UTC. """
+    local = after.astimezone(self.tz)
+    day = local.date()
+    while True:
+      candidate = datetime.combine(day, self.at, tzinfo=self.tz)
+      if candidate > local and self.is_trading_day(day):
+        return candidate.astimezone(ZoneInfo("UTC"))
+      day += timedelta(days=1)
+
+class Scheduler:
+  """
+  In-process job scheduler. Every worker runs one; a database lease (job_leases) makes sure a job runs in at most
+  one of them at a time. Jobs receive a `heartbeat()` callback that renews the lease and should be called at
+  least every JOB_LEASE_SECONDS; a job whose worker died is picked up again once its lease expired.
+  """
+  def __init__(self, lease_seconds: int = 600):
+    self.lease_seconds = lease_seconds
+    self.owner = uuid.uuid4().hex
+    self.jobs = {}
+    self.next_runs: dict[str, datetime] = {}
+    self._wake = threading.Event()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def add(self, name: str, fn, schedule: TradingDaySchedule):
+    self.jobs[name] = (fn, schedule)
+    self.next_runs[name] = schedule.next_run(datetime.now(ZoneInfo("UTC")))
+
+  def trigger(self, name: str):
+    """ Run `name` as soon as possible (the scheduled time is kept for the following run). """
+    self.next_runs[name] = datetime.now(ZoneInfo("UTC"))
+    self._wake.set()
+
+  def start(self):
+    self._stop.clear()
+    with SessionLocal() as db: # resume runs interrupted by a crash or a restart
+      for name in self.jobs:
+        if repository.get_unfinished_refresh_run(db, name) is not None:
+          self.next_runs[name] = datetime.now(ZoneInfo("UTC"))
+    self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._wake.set()
+
+  def _loop(self):
+    while not self._stop.is_set():
+      now = datetime.now(ZoneInfo("UTC"))
+      for name, next_run in list(self.next_runs.items()):
+        if next_run <= now and not self._stop.is_set():
+          self.run(name)
+          self.next_runs[name] = self.jobs[name][1].next_run(max(now, datetime.now(ZoneInfo("UTC"))))
+      timeout = min(self.next_runs.values(), default=now + timedelta(hours=1)) - datetime.now(ZoneInfo("UTC"))
+      self._wake.wait(max(timeout.total_seconds(), 0))
+      self._wake.clear()
+
+  def _lease(self, name: str) -> bool:
+    now = datetime.now(ZoneInfo("UTC"))
+    with SessionLocal() as db:
+      return repository.acquire_job_lease(db, name, self.owner, now, now + timedelta(seconds=self.lease_seconds))
+
+  def run(self, name: str):
+    if not self._lease(name):
+      logger.info("scheduler: %s is running in another worker, skipping", name)
+      return
+    fn, _ = self.jobs[name]
+    def heartbeat():
+      if not self._lease(name):
+        raise LeaseLostError(f"lease on {name} was lost")
+    try:
+      fn(heartbeat)
+    except LeaseLostError as e:
+      logger.warning("scheduler: %s stopped: %s", name, e)
+      return # the lease belongs to another worker now, do not release it
+    except Exception as e:
+      logger.exception("scheduler: %s failed: %s", name, e)
+    finally:
+      with SessionLocal() as db:
+        repository.release_job_lease(db, name, self.owner)
+
+def run_nightly_refresh(heartbeat) -> None:
+  """
+  Refresh every ticker close, then every stored option contract, checkpointing after each committed page so an
+  interrupted run resumes where it stopped (progress and duration are summed over the attempts).
+  """
+  with SessionLocal() as db:
+    run = repository.get_unfinished_refresh_run(db, NIGHTLY_REFRESH)
+    if run is None:
+      run = repository.create_refresh_run(db, models.RefreshRun(
+        job=NIGHTLY_REFRESH, status="running", checkpoint=json.dumps({"stage": "tickers", "after": None}),
+      ))
+    else:
+      logger.info("scheduler: resuming %s run %s from %s", NIGHTLY_REFRESH, run.id, run.checkpoint)
+    started = time.perf_counter()
+    base_duration = run.duration or 0
+    totals = {"processed": run.processed or 0, "updated": run.updated or 0, "failed": run.failed or 0}
+
+    def progress(stage: str, encode):
+      def on_page(last_key, report):
+        run.checkpoint = json.dumps({"stage": stage, "after": encode(last_key)})
+        run.processed = totals["processed"] + report.processed
+        run.updated = totals["updated"] + report.updated
+        run.failed = totals["failed"] + report.failed
+        run.duration = round(base_duration + time.perf_counter() - started, 3)
+        repository.update_refresh_run(db, run)
+        heartbeat()
+      return on_page
+
+    def end_stage():
+      totals.update(processed=run.processed, updated=run.updated, failed=run.failed)
+
+    try:
+      checkpoint = json.loads(run.checkpoint)
+      if checkpoint["stage"] == "tickers":
+        service.update_all_tickers(db, redis_client=redis_client.get_client(), after=checkpoint["after"], on_page=progress("tickers", lambda key: key))
+        end_stage()
+        checkpoint = {"stage": "options", "after": None}
+        run.checkpoint = json.dumps(checkpoint)
+        repository.update_refresh_run(db, run)
+      after = checkpoint["after"]
+      service.update_all_options(db,
+        after=(after[0], datetime.fromisoformat(after[1])) if after else None,
+        on_page=progress("options", lambda key: [key[0], key[1].isoformat()]),
+      )
+      run.status = "succeeded"
+    except LeaseLostError:
+      raise # the worker holding the lease now resumes this run from its last checkpoint
+    except Exception as e:
+      run.status = "failed"
+      run.error = str(e)
+      raise
+    finally:
+      if run.status != "running":
+        run.finished_at = datetime.now(ZoneInfo("UTC"))
+        run.duration = round(base_duration + time.perf_counter() - started, 3)
+        repository.update_refresh_run(db, run)
+        logger.info("scheduler: %s run %s %s in %ss, %s processed, %s failed", NIGHTLY_REFRESH, run.id, run.status, run.duration, run.processed, run.failed)
+
+scheduler = Scheduler(lease_seconds=settings.JOB_LEASE_SECONDS)
+scheduler.add(NIGHTLY_REFRESH, run_nightly_refresh, TradingDaySchedule(dt_time.fromisoformat(settings.REFRESH_SCHEDULE_TIME)))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel 
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 class Ticker_Id(BaseModel):
@@ -31,14 +31,63 @@ class Option(Ticker_Id):
 
 class Option_Details(Option):
   id: str 
-  ask: float 
-  bid: float 
+  ask: float | None = None # None when the contract has no quote in the snapshot
+  bid: float | None = None
   volume: float 
-  iv: float 
+  iv: float | None = None
   itm: bool
   fetched_date: datetime
+  snapshot_age: float | None = None # seconds since the chain snapshot holding this contract was downloaded
 
   model_config = {
     "from_attributes": True
   }  # Enable ORM mode to work with SQLAlchemy models
 
+class Option_Greeks(BaseModel):
+  id: str
+  type: OptionType
+  strike_price: float
+  bid: float | None = None
+  ask: float | None = None
+  iv: float | None = None # solved from the bid/ask midpoint (the provider's iv for one-sided quotes)
+  price: float | None = None # Black-Scholes value per share
+  delta: float | None = None
+  gamma: float | None = None
+  theta: float | None = None # per calendar day
+  vega: float | None = None # per volatility point (0.01)
+
+class Chain_Greeks(BaseModel):
+  ticker: str
+  expire_date: date
+  spot: float
+  years_to_expiry: float | None = None
+  contracts: list[Option_Greeks] = []
+
+class RefreshReport(BaseModel):
+  job: str
+  processed: int = 0 # rows/symbols looked at
+  updated: int = 0
+  failed: int = 0
+  duration: float = 0 # seconds
+  throughput: float = 0 # symbols (or contracts) per second
+
+class RefreshRun(BaseModel):
+  id: int
+  job: str
+  status: str # running, succeeded or failed
+  started_at: datetime
+  finished_at: datetime | None = None
+  duration: float = 0 # seconds, summed over resumed attempts
+  processed: int = 0
+  updated: int = 0
+  failed: int = 0
+  checkpoint: str | None = None
+  error: str | None = None
+
+  model_config = {
+    "from_attributes": True
+  }
+
+class RefreshStatus(BaseModel):
+  next_run: datetime | None = None
+  runs: list[RefreshRun] = []
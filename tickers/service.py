@@ -1,14 +1,24 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from sqlalchemy.orm import Session 
-from . import schemas, models, repository 
-from datetime import datetime, timedelta
+from . import schemas, models, repository, greeks, indicators
+from .providers import get_provider
+from positions import service as positions_service
+import executors
+from singleflight import SingleFlight
+from cache import cache
+from database import SessionLocal
+from datetime import date, datetime, time as dt_time, timedelta
 from zoneinfo import ZoneInfo
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import redis 
-import json
+import logging
+import time
 import settings
 
+logger = logging.getLogger(__name__)
+flights = SingleFlight() # coalesces concurrent cache misses per key (closed_price:, metrics:, price_history:)
+
 def update_ticker(db: Session, ticker: schemas.TickerCreate) -> schemas.Ticker:
   """
   Update or insert a ticker into the database.
@@ -20,36 +30,85 @@ def update_ticker(db: Session, ticker: schemas.TickerCreate) -> schemas.Ticker:
   if not existing_ticker:
     db_ticker = models.Ticker(ticker=ticker.ticker, closed_price=ticker.closed_price, fetched_date=datetime.now(ZoneInfo("UTC")))
     db_ticker = repository.create_ticker(db, db_ticker)
-    return schemas.Ticker.model_validate(db_ticker)
   else: # update if existing
     existing_ticker.closed_price = ticker.closed_price
     existing_ticker.fetched_date = datetime.now(ZoneInfo("UTC"))
     db_ticker = repository.update_ticker(db, existing_ticker)
-    return schemas.Ticker.model_validate(db_ticker)
+  positions_service.defer_revalue([db_ticker.ticker]) # open positions on this ticker are valued at its close, off the request
+  return schemas.Ticker.model_validate(db_ticker)
 
-def get_closed_price(db: Session, ticker: str) -> schemas.Ticker | None:
+def get_closed_price(db: Session, ticker: str, redis_client: redis.Redis | None = None) -> schemas.Ticker | None:
   """
-  Retrieve the latest closing price for a given ticker symbol. If the ticker data is not up to date, fetches the latest price using yfinance
+  Retrieve the latest closing price for a given ticker symbol. If the ticker data is not up to date, fetches the latest price from the market data provider
+  Reads go through the in-process/Redis cache before the database; concurrent misses for the same symbol share
+  one provider call and one database write (single-flight).
   Args: 
     db (session): SQLAlchemy database session used for querying and updating the ticker.
     ticker (str): The stock ticker symbol (e.g. "AAPL", "TSLA", etc.).
+    redis_client: optional Redis client for the shared cache tier and for coalescing misses across workers.
   """
+  cache_key = f"closed_price:{ticker}"
+  cached_data = cache.get(cache_key, redis_client)
+  if cached_data is not None:
+    cached_ticker = schemas.Ticker.model_validate(cached_data)
+    if is_fetched_today(cached_ticker):
+      return cached_ticker
+
   # check if existing in database 
   existing_ticker = repository.get_ticker(db, ticker)
-  today_utc= datetime.now(ZoneInfo("UTC")).date()
-  if not existing_ticker or existing_ticker.fetched_date.date() != today_utc: 
-    data = yf.Ticker(ticker)
-    closed_price = data.history(period='1d')['Close'] # returns the data in UTC
-    if closed_price.shape[0] == 0:
+  if not existing_ticker or not is_fetched_today(existing_ticker): 
+    existing_ticker = flights.do(
+      cache_key,
+      lambda: fetch_closed_price(db, ticker),
+      recheck=lambda: get_fresh_ticker(db, ticker),
+      redis_client=redis_client,
+    )
+    if existing_ticker is None:
       return None
-    else:
-      existing_ticker = update_ticker(db, schemas.TickerCreate(ticker=ticker, closed_price=closed_price.iloc[-1]))   
-  return schemas.Ticker.model_validate(existing_ticker)
+  existing_ticker = schemas.Ticker.model_validate(existing_ticker)
+  cache.set(cache_key, existing_ticker.model_dump(mode="json"), redis_client)
+  return existing_ticker
+
+def get_closed_prices(db: Session, tickers: list[str], redis_client: redis.Redis | None = None, batch_size: int = 100) -> dict[str, float]:
+  """
+  Bulk counterpart of get_closed_price: closes fetched today are read from the database in one query, the others
+  are fetched with one multi-symbol provider call per `batch_size` symbols and upserted together.
+  Symbols without data (unknown or delisted) are left out of the result; provider errors are raised.
+  """
+  prices = {ticker.ticker: ticker.closed_price for ticker in repository.get_tickers(db, tickers) if is_fetched_today(ticker)}
+  missing = [ticker for ticker in tickers if ticker not in prices]
+  provider = get_provider()
+  for i in range(0, len(missing), batch_size):
+    quotes = provider.get_quotes(missing[i:i + batch_size])
+    fetched_date = datetime.now(ZoneInfo("UTC"))
+    repository.upsert_tickers(db, [{"ticker": symbol, "closed_price": price, "fetched_date": fetched_date} for symbol, price in quotes.items()])
+    positions_service.defer_revalue(list(quotes))
+    cache.invalidate([f"closed_price:{symbol}" for symbol in quotes], redis_client)
+    prices.update(quotes)
+  return prices
 
-def get_historical_price(ticker: str, start_date: datetime, end_date: datetime, frequency: str, redis_client: redis.Redis) -> list[dict]:
+def is_fetched_today(ticker: models.Ticker | schemas.Ticker) -> bool:
+  return ticker.fetched_date.date() == datetime.now(ZoneInfo("UTC")).date()
+
+def get_fresh_ticker(db: Session, ticker: str) -> schemas.Ticker | None:
+  db.expire_all() # another worker may have just written the row, don't trust the identity map
+  existing_ticker = repository.get_ticker(db, ticker)
+  if existing_ticker and is_fetched_today(existing_ticker):
+    return schemas.Ticker.model_validate(existing_ticker)
+  return None
+
+def fetch_closed_price(db: Session, ticker: str) -> schemas.Ticker | None:
+  closed_price = get_provider().get_quotes([ticker]).get(ticker)
+  if closed_price is None:
+    return None
+  return update_ticker(db, schemas.TickerCreate(ticker=ticker, closed_price=closed_price))
+
+def get_historical_price(db: Session, ticker: str, start_date: datetime, end_date: datetime, frequency: str, redis_client: redis.Redis) -> list[dict]:
   """
   Get historical price data for a given ticker symbol between start_date and end_date.
+  Bars come from the local daily store, which only asks the provider for date ranges it has not seen yet.
   Args:
+    db: SQLAlchemy database session holding the bar store.
     ticker: Stock ticker symbol (e.g., 'AAPL')
     start_date: Start date for historical data (YYYY-MM-DD) in UTC
     end_date: End date for historical data (YYYY-MM-DD) in UTC
@@ -58,19 +117,34 @@ def get_historical_price(ticker: str, start_date: datetime, end_date: datetime,
     A list of dictionaries containing historical price data with keys: Date, close, prev, diff, percentage
   """
   end_date_plus_one = end_date + timedelta(days=1)
-  # redis cache check
-  try:
-    if (redis_client.ping()):
-      redis_cache_key = f"price_history:{ticker}:{start_date}:{end_date_plus_one}:{frequency}"
-      cached_data = redis_client.get(redis_cache_key)
-      if cached_data is not None: 
-        return json.loads(cached_data)
-  except redis.exceptions.ConnectionError as e: # this needs to be logged. 
-    print("error: Could not connect to Redis: ", e)
-
-  # download historical price data 
-  data = yf.download(ticker, start_date, end_date_plus_one)["Close"].round(2)
-  data = data.rename(columns={ticker.upper(): "close"})
+  # cache check (in-process, then redis)
+  cache_key = f"price_history:{ticker}:{start_date}:{end_date_plus_one}:{frequency}"
+  # the router's defaults are dates, user supplied values are datetimes
+  first_day = start_date.date() if isinstance(start_date, datetime) else start_date
+  last_day = end_date_plus_one.date() if isinstance(end_date_plus_one, datetime) else end_date_plus_one
+
+  def fetch(session: Session) -> list[dict]:
+    records = compute_historical_price(session, ticker, first_day, last_day, frequency)
+    cache.set(cache_key, records, redis_client)
+    return records
+
+  def load(session: Session) -> list[dict]:
+    return flights.do(cache_key, lambda: fetch(session), recheck=lambda: cache.get(cache_key, redis_client), redis_client=redis_client)
+
+  def refresh() -> list[dict]: # background refresh of a stale entry, outside of the request's session
+    with SessionLocal() as session:
+      return load(session)
+
+  cached_data = cache.get(cache_key, redis_client, refresh=refresh)
+  if cached_data is not None: 
+    return cached_data
+  return load(db)
+
+def compute_historical_price(db: Session, ticker: str, start_date: date, end_date: date, frequency: str) -> list[dict]:
+  bars = get_daily_bars(db, ticker, start_date, end_date)
+  if bars.shape[0] == 0:
+    return []
+  data = bars[["Close"]].round(2).rename(columns={"Close": "close"})
   # resample data to the specified frequency
   weekstarts = data.resample(frequency).last()
   weekends = weekstarts.shift(-1)
@@ -86,64 +160,204 @@ def get_historical_price(ticker: str, start_date: datetime, end_date: datetime,
   df["Date"] = df["Date"].dt.strftime("%Y-%m-%d")
   df = df.sort_values(by='Date', ascending=False) 
   df.dropna(inplace=True)
+  return df.to_dict(orient='records') # return in dict/json form 
 
-  try:
-    if (redis_client.ping()):
-      # convert dataframe to json
-      json_data = json.dumps(df.to_dict(orient='records'), indent=4)
-      # cache the data in Redis
-      redis_client.set(redis_cache_key, json_data, ex=settings.REDIS_EX, nx=True) # nx to avoid overwriting existing cache
-  except redis.exceptions.ConnectionError as e: 
-    print("error: Could not connect to Redis: ", e)
+def subtract_ranges(start: date, end: date, covered: list[tuple[date, date]]) -> list[tuple[date, date]]:
+  """ Parts of [start, end) not covered by any of the (sorted or unsorted) [from, to) ranges. """
+  missing = []
+  cursor = start
+  for range_start, range_end in sorted(covered):
+    if range_end <= cursor:
+      continue
+    if range_start >= end:
+      break
+    if range_start > cursor:
+      missing.append((cursor, range_start))
+    cursor = max(cursor, range_end)
+  if cursor < end:
+    missing.append((cursor, end))
+  return missing
 
-  return df.to_dict(orient='records') # return in dict/json form 
+def merge_ranges(ranges: list[tuple[date, date]]) -> list[tuple[date, date]]:
+  """ Union of [from, to) ranges, merging overlapping and adjacent ones. """
+  merged = []
+  for range_start, range_end in sorted(ranges):
+    if merged and range_start <= merged[-1][1]:
+      merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+    else:
+      merged.append((range_start, range_end))
+  return merged
 
-def get_chain(data, exp) -> yf.Ticker.option_chain:
-  return data.option_chain(exp)
+def get_daily_bars(db: Session, ticker: str, start_date: date, end_date: date) -> pd.DataFrame:
+  """
+  Daily OHLCV bars for [start_date, end_date) from the local store, fetching only the missing date ranges.
+  Ranges before today are settled and kept for good; the part reaching into the current session is refetched
+  once it is older than PRICE_BAR_TTL.
+  Args:
+    db: SQLAlchemy database session.
+    ticker: Stock ticker symbol (e.g., 'AAPL')
+    start_date: first day (inclusive)
+    end_date: last day (exclusive)
+  Returns:
+    DataFrame indexed by 'Date' with the columns Open, High, Low, Close, Volume.
+  """
+  now = datetime.now(ZoneInfo("UTC"))
+  today = now.date()
+  fresh_after = now - timedelta(seconds=settings.PRICE_BAR_TTL)
+  stored_ranges = repository.get_price_bar_ranges(db, ticker)
+  settled = [(r.start_date, r.end_date) for r in stored_ranges if r.settled]
+  live = [(r.start_date, r.end_date) for r in stored_ranges if not r.settled and r.start_date >= today and r.fetched_date.replace(tzinfo=ZoneInfo("UTC")) >= fresh_after]
+
+  missing = subtract_ranges(start_date, end_date, settled + live)
+  if missing:
+    provider = get_provider()
+    for gap_start, gap_end in missing:
+      history = provider.get_history([ticker], gap_start, gap_end).get(ticker)
+      if history is not None:
+        repository.upsert_price_bars(db, bars_to_rows(ticker, history))
+    settled = merge_ranges(settled + [(s, min(e, today)) for s, e in missing if s < today])
+    live = merge_ranges(live + [(max(s, today), e) for s, e in missing if e > today])
+    repository.replace_price_bar_ranges(db, ticker, 
+      [models.PriceBarRange(ticker=ticker, start_date=s, end_date=e, settled=True, fetched_date=now) for s, e in settled] +
+      [models.PriceBarRange(ticker=ticker, start_date=s, end_date=e, settled=False, fetched_date=now) for s, e in live]
+    )
+
+  rows = repository.get_price_bars(db, ticker, start_date, end_date)
+  bars = pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close", "Volume"])
+  bars["Date"] = pd.to_datetime(bars["Date"])
+  return bars.set_index("Date")
+
+def bars_to_rows(ticker: str, history: pd.DataFrame) -> list[dict]:
+  index = pd.DatetimeIndex(history.index)
+  if index.tz is not None:
+    index = index.tz_localize(None)
+  frame = history.astype(object).where(pd.notna(history), None)
+  return [
+    {"ticker": ticker, "date": day, "open": o, "high": h, "low": l, "close": c, "volume": v}
+    for day, o, h, l, c, v in zip(index.date, frame["Open"], frame["High"], frame["Low"], frame["Close"], frame["Volume"])
+  ]
+
+def chain_volume_ttl(expiry: date) -> int:
+  """ Seconds the volume totals of an expiry stay cached: near expiries trade actively and go stale first. """
+  days_left = max((expiry - date.today()).days, 0)
+  scale = min(days_left / settings.CHAIN_CACHE_HORIZON_DAYS, 1) if settings.CHAIN_CACHE_HORIZON_DAYS > 0 else 1
+  return int(settings.CHAIN_CACHE_MIN_TTL + (settings.CHAIN_CACHE_MAX_TTL - settings.CHAIN_CACHE_MIN_TTL) * scale)
 
-def get_put_call_vol_ratio(ticker: str) -> float: 
+def get_option_expirations(ticker: str, redis_client: redis.Redis | None = None) -> list[str]:
+  """ Listed expiries of a ticker ('YYYY-MM-DD'), cached for CHAIN_CACHE_MAX_TTL (put/call ratio, ATM IV). """
+  expirations_key = f"chain_volumes:{ticker}:expirations"
+  expirations = cache.get(expirations_key, redis_client)
+  if expirations is None:
+    expirations = get_provider().get_option_expirations(ticker)
+    cache.set(expirations_key, expirations, redis_client, ttl=settings.CHAIN_CACHE_MAX_TTL)
+  return expirations
+
+def get_chain_volumes(ticker: str, expiries: list[str], redis_client: redis.Redis | None = None) -> dict[str, dict]:
+  """
+  Put and call volume totals per expiry, {expiry: {"puts": float, "calls": float}}.
+  Totals are cached per (ticker, expiry) with a TTL depending on the time to expiry, so only the stale expiries
+  are downloaded again (fanned out on the shared fetch pool); the chains themselves are not kept.
+  """
+  keys = {expiry: f"chain_volumes:{ticker}:{expiry}" for expiry in expiries}
+  cached = cache.get_many(list(keys.values()), redis_client)
+  volumes = {expiry: cached[key] for expiry, key in keys.items() if key in cached}
+  stale = [expiry for expiry in expiries if expiry not in volumes]
+  if stale:
+    chains = get_provider().get_option_chains(ticker, stale)
+    for expiry, chain in chains.items():
+      volumes[expiry] = {"puts": float(chain.puts["volume"].sum()), "calls": float(chain.calls["volume"].sum())} # NaN volumes are skipped
+      cache.set(keys[expiry], volumes[expiry], redis_client, ttl=chain_volume_ttl(date.fromisoformat(expiry)))
+  return volumes
+
+def get_intraday_bars(ticker: str, redis_client: redis.Redis | None = None) -> dict[str, list]:
+  """
+  High/Low/Close/Volume columns of the latest regular session at INTRADAY_BAR_INTERVAL, cached in both tiers for
+  INTRADAY_BAR_TTL (intraday bars are not kept in the daily bar store). Empty columns when the provider has none.
+  """
+  cache_key = f"intraday_bars:{ticker}:{settings.INTRADAY_BAR_INTERVAL}"
+  cached_data = cache.get(cache_key, redis_client)
+  if cached_data is not None:
+    return cached_data
+  today = date.today()
+  history = get_provider().get_history([ticker], today - timedelta(days=6), today + timedelta(days=1), interval=settings.INTRADAY_BAR_INTERVAL).get(ticker)
+  bars = {"session": None, "High": [], "Low": [], "Close": [], "Volume": []}
+  if history is not None and not history.empty:
+    session = history[history.index.date == history.index[-1].date()] # a weekend or pre-market request gets the last session
+    bars = {"session": str(session.index[-1].date()), **{column: session[column].round(4).tolist() for column in ("High", "Low", "Close", "Volume")}}
+  cache.set(cache_key, bars, redis_client, ttl=settings.INTRADAY_BAR_TTL)
+  return bars
+
+def get_price_stats(ticker: str, redis_client: redis.Redis | None = None) -> dict:
+  """ HV and VWAP metrics of a ticker, cached under price_stats: for PRICE_STATS_TTL (see compute_price_stats). """
+  cache_key = f"price_stats:{ticker}"
+  cached_data = cache.get(cache_key, redis_client)
+  if cached_data is not None:
+    return cached_data
+
+  def fetch() -> dict:
+    stats = compute_price_stats(ticker, redis_client)
+    cache.set(cache_key, stats, redis_client, ttl=settings.PRICE_STATS_TTL)
+    return stats
+
+  return flights.do(cache_key, fetch, recheck=lambda: cache.get(cache_key, redis_client), redis_client=redis_client)
+
+def compute_price_stats(ticker: str, redis_client: redis.Redis | None = None) -> dict:
+  """
+  Historical volatility per HV_WINDOWS window from the daily bar store (only missing days are downloaded) and the
+  VWAP of the latest session from the cached intraday bars, both with vectorized kernels (tickers.indicators).
+  """
+  end_date = date.today() + timedelta(days=1)
+  start_date = end_date - timedelta(days=max(settings.HV_WINDOWS) * 7 // 5 + 15) # max(window) + 1 sessions, with room for holidays
+  with SessionLocal() as db:
+    bars = get_daily_bars(db, ticker, start_date, end_date)
+  volatility = indicators.historical_volatility(bars["Close"].to_numpy(), settings.HV_WINDOWS)
+  intraday = get_intraday_bars(ticker, redis_client)
+  session_vwap = indicators.vwap(intraday["High"], intraday["Low"], intraday["Close"], intraday["Volume"])
+  last_vwap = session_vwap[-1] if session_vwap.shape[0] else np.nan
+  return {
+    "HV": {str(window): value for window, value in volatility.items()},
+    "VWAP": None if np.isnan(last_vwap) else round(float(last_vwap), 2),
+    "VWAPSession": intraday["session"],
+  }
+
+def get_put_call_vol_ratio(ticker: str, redis_client: redis.Redis | None = None) -> float: 
   """
   Calculate the put/call volume ratio for a given ticker symbol.
   Args:
     ticker: Stock ticker symbol (e.g., 'AAPL')
+    redis_client: optional Redis client sharing the expiry list and per-expiry volume totals between workers.
   """
-  data = yf.Ticker(ticker)  # download ticker information
-  options = data.options # list of expiration dates expected in 'YYYY-MM-DD' format, ex: ['2023-10-20', '2023-10-27', ...]
-
-  with ThreadPoolExecutor() as executor: # use ThreadPoolExecutor for concurrent fetching
-    futures = [executor.submit(get_chain, data, exp) for exp in options]
-    chains = [f.result() for f in futures]
-    # chains = list(executor.map(get_chain, options)) # fetch all option chains concurrently
-  
-  total_put_volume = sum(chain.puts["volume"].sum() for chain in chains)
-  total_call_volume = sum(chain.calls["volume"].sum() for chain in chains)
-  # Initialize total put and call volumes
-  # total_put_volume = 0
-  # total_call_volume = 0
-
-  # for expiration in options:
-  #   option_chain = data.option_chain(expiration)
-  #   # Sum up the volumes for this expiration
-  #   total_put_volume += option_chain.puts['volume'].sum()
-  #   total_call_volume += option_chain.calls['volume'].sum()
+  options = get_option_expirations(ticker, redis_client) # list of expiration dates expected in 'YYYY-MM-DD' format, ex: ['2023-10-20', '2023-10-27', ...]
+  volumes = get_chain_volumes(ticker, options, redis_client).values()
+
+  total_put_volume = sum(volume["puts"] for volume in volumes)
+  total_call_volume = sum(volume["calls"] for volume in volumes)
 
   put_call_ratio = total_put_volume / total_call_volume if total_call_volume > 0 else 0 # compute put/call ratio
 
   return round(put_call_ratio, 2) # round to 2 decimal places
 
 def get_metrics(ticker: str, redis_client: redis.Redis) -> dict: 
-  # redis cache check - instead of querying from yfinance every time, check if data is cached in redis
-  try:
-    if (redis_client.ping()):
-      redis_cache_key = f"metrics:{ticker}"
-      cached_data = redis_client.get(redis_cache_key)
-      if cached_data is not None: 
-        return json.loads(cached_data)
-  except redis.exceptions.ConnectionError as e: # this needs to be logged.
-    print("error: Could not connect to Redis: ", e)
-
-  # otherwise, download ticker information # todo: what is the difference between yf.Ticker(ticker) and yf.download(ticker) ## 
-  data = yf.Ticker(ticker).info
+  # cache check - instead of querying the provider every time, check the in-process cache, then redis
+  cache_key = f"metrics:{ticker}"
+
+  def fetch() -> dict:
+    metrics = compute_metrics(ticker, redis_client)
+    cache.set(cache_key, metrics, redis_client)
+    return metrics
+
+  def load() -> dict: # concurrent misses share one download
+    return flights.do(cache_key, fetch, recheck=lambda: cache.get(cache_key, redis_client), redis_client=redis_client)
+
+  cached_data = cache.get(cache_key, redis_client, refresh=load) # stale entries are served while load() runs in the background
+  if cached_data is not None: 
+    return cached_data
+  return load()
+
+def compute_metrics(ticker: str, redis_client: redis.Redis | None = None) -> dict:
+  # download ticker information
+  provider = get_provider()
+  data = provider.get_info([ticker]).get(ticker, {})
   market_cap = format_market_cap(data.get('marketCap')) # 1. Market Cap
   ex_dividend_date = data.get('exDividendDate') # Ex-Dividend Date (in UNIX timestamp) # 2. Ex-Dividend Date
   if ex_dividend_date:
@@ -154,7 +368,7 @@ def get_metrics(ticker: str, redis_client: redis.Redis) -> dict:
   else: 
     ex_dividend_date = ''
   earnings_hist = {} # dictionary placeholder for earnings history
-  earnings_dates = yf.Ticker(ticker).get_earnings_dates() # this returns a dataframe
+  earnings_dates = provider.get_earnings_dates(ticker) # this returns a dataframe
   upcoming_earnings_date = '' # 3. Upcoming Earnings Date
   if not earnings_dates.empty or earnings_dates.shape[0] != 0:
     last_earnings = earnings_dates.iloc[0] # this returns in UNIX timestamp
@@ -179,33 +393,33 @@ def get_metrics(ticker: str, redis_client: redis.Redis) -> dict:
   dividend_yield_formatted = '' if divided_yield is None else round(divided_yield * 100, 2) # some tickers don't pay dividend
   beta = data.get('beta') # 7. Beta
   beta_formatted = '' if beta is None else round(data.get('beta'), 2)
+  price_stats = get_price_stats(ticker, redis_client) # 8. HV and VWAP, cached on their own
+  put_call_ratio = get_put_call_vol_ratio(ticker, redis_client) # 9. PCR, before the IV: it caches the expiry list
+  try:
+    atm_iv = get_atm_iv(ticker, redis_client) # 10. IV, from the stored chain snapshot
+  except Exception as e: # an optional figure: never fail the whole response for it
+    logger.warning("ATM IV of %s unavailable: %s", ticker, e)
+    atm_iv = None
   metrics = {
     'symbol': data.get('symbol'),
     'volume': data.get('volume'),
     'beta': beta_formatted,
-    'IV': '',
+    'IV': atm_iv or '', # at-the-money implied volatility (%), nearest expiry a week or more out
     'annualDividend': data.get('dividendRate'),
-    'VWAP': '',
+    'VWAP': price_stats['VWAP'] or '', # latest session
     'averageVolume': data.get('averageVolume'),
     'PE': pe_formatted, 
-    'HV': '',
+    'HV': price_stats['HV'].get('30', next(iter(price_stats['HV'].values()), None)) or '', # annualized %, 30 trading days
+    'HVWindows': price_stats['HV'], # window (trading days) -> annualized %
     'dividendYield': dividend_yield_formatted,
     'marketMakerMove': '',
     'marketCap': market_cap,
     'EPS': data.get('trailingEps'),
-    'PCR': get_put_call_vol_ratio(ticker),
+    'PCR': put_call_ratio,
     'exDividendDate':  ex_dividend_date,
     'upcomingEarningsDate': upcoming_earnings_date,
     'earningsHistory': earnings_hist,
   }
-  try:
-    if (redis_client.ping()):
-      json_data = json.dumps(metrics)
-      # cache the data in Redis with key: f"metrics:{ticker}", 600 seconds expiration, nx = True to avoid overwriting existing cache
-      redis_client.set(redis_cache_key, json_data, ex=settings.REDIS_EX, nx=True)
-  except redis.exceptions.ConnectionError as e:
-    print("error: Could not connect to Redis: ", e)
-
   return metrics
 
 def format_market_cap(value):
@@ -239,99 +453,283 @@ def update_option(db:Session, option: schemas.Option_Details) -> schemas.Option_
     db_option = repository.update_option(db, existing_option)
     return schemas.Option_Details.model_validate(db_option)
 
-def get_option_price(db: Session, option: schemas.Option) -> schemas.Option_Details | None:
+def get_option_price(db: Session, option: schemas.Option, redis_client: redis.Redis | None = None) -> schemas.Option_Details | None:
   """
-  Retrieve the latest option price for a given option. If the option data is not in the database, fetches the latest price using yfinance
+  Retrieve the latest option price for a given option. If the option data is not in the database (or its chain snapshot is older than
+  OPTION_SNAPSHOT_TTL), downloads the whole chain for that expiry once and stores every contract, so the other strikes are served from the database
   Args:
     db (session): SQLAlchemy database session used for querying and updating the option.
     option (schemas.Option): The option details including ticker, type, expire_date, and strike_price.
+    redis_client: optional Redis client for coalescing concurrent chain downloads across workers.
   """
+  expire_date = datetime.combine(option.expire_date.date(), dt_time()) # one expire_date per chain, whatever time the client sent
   db_option = models.Option(
     ticker=option.ticker.upper(),
     type=option.type.value,
-    expire_date=option.expire_date,
+    expire_date=expire_date,
     strike_price=option.strike_price
   ) # 
   existing_option = repository.get_option(db, db_option) 
-  if not existing_option: # doesn't exist in the database, fetch from yfinance
-    data = yf.Ticker(option.ticker) 
-    try: 
-      option_chain_data = data.option_chain(str(option.expire_date.date()))
-      if option.type == "Call":
-        options_chain = option_chain_data.calls 
-      else:
-        options_chain = option_chain_data.puts 
-      option_data = options_chain[options_chain['strike'] == option.strike_price] # get the exact one 
-      if option_data.shape[0] != 0:
-        db_option = models.Option(
-                id=option_data['contractSymbol'].values[0],
-                type=option.type.value, 
-                ticker=option.ticker.upper(),
-                expire_date=option.expire_date,
-                strike_price=option_data['strike'].values[0],
-                ask=option_data['ask'].values[0],
-                bid=option_data['bid'].values[0],
-                volume=option_data['volume'].values[0],
-                iv=option_data['impliedVolatility'].values[0],
-                itm=option_data['inTheMoney'].values[0]
-            )
-        db_option = repository.create_option(db, db_option)
-        return schemas.Option_Details.model_validate(db_option)
-      else:
-        return None # no data found for the given strike price
-    except Exception as error:
-      raise error 
-  return schemas.Option_Details.model_validate(existing_option)
-
-# todo
-# run cron jobs to update all tickers + options every weekday at 10 pm (expired options should be removed from database)
-# check if ticker has connections to postion, otherwise remove them 
-def update_all_tickers(db: Session, batch_size: int = 100):
-  offset = 0 
-  
+  # an unknown strike on a fresh snapshot is not listed: only a missing or stale chain is (re)downloaded
+  snapshot_date = existing_option.fetched_date if existing_option else None
+  if ensure_chain_snapshot(db, db_option.ticker, expire_date, redis_client, snapshot_date):
+    existing_option = repository.get_option(db, db_option)
+  if existing_option is None:
+    return None # no data found for the given strike price
+  return option_details(existing_option)
+
+def get_listed_strikes(db: Session, chain_keys: list[tuple], batch_size: int = 100) -> dict[tuple, set[tuple]]:
+  """
+  Listed (type, strike_price) pairs per (ticker, expire_date) chain. Chains with a stored snapshot are read from the
+  database; the others are downloaded on the shared fetch pool and stored as snapshots. Chains the provider could
+  not return (expired, no listed options, upstream error) are left out of the result.
+  """
+  strikes = {}
+  for i in range(0, len(chain_keys), batch_size): # bounded OR per query
+    strikes.update(repository.get_option_strikes_by_chain(db, chain_keys[i:i + batch_size]))
+  provider = get_provider()
+  futures = {
+    executors.submit_fetch(provider.name, provider.get_option_chain, ticker, str(expire_date.date())): (ticker, expire_date)
+    for ticker, expire_date in chain_keys if (ticker, expire_date) not in strikes
+  }
+  fetched_date = datetime.now(ZoneInfo("UTC"))
+  rows = []
+  for future in as_completed(futures):
+    ticker, expire_date = futures[future]
+    try:
+      chain_rows = chain_snapshot_rows(future.result(), ticker, expire_date, fetched_date)
+    except Exception as e:
+      logger.warning("option chain %s %s unavailable: %s", ticker, expire_date.date(), e)
+      continue
+    rows.extend(chain_rows)
+    strikes[(ticker, expire_date)] = {(row["type"], row["strike_price"]) for row in chain_rows}
+  if rows:
+    repository.upsert_options(db, rows)
+  return strikes
+
+def ensure_chain_snapshot(db: Session, ticker: str, expire_date: datetime, redis_client: redis.Redis | None = None, snapshot_date: datetime | None = None) -> bool:
+  """
+  Download and store the chain of one expiry when its stored snapshot is missing or older than OPTION_SNAPSHOT_TTL
+  (concurrent downloads of a chain are coalesced). Returns True when the stored chain may have changed.
+  """
+  ticker = ticker.upper() # option rows are stored under the listed symbol, like the greeks route's lookups
+  snapshot_date = snapshot_date or repository.get_option_chain_fetched_date(db, ticker, expire_date)
+  if snapshot_date is not None and is_snapshot_fresh(snapshot_date):
+    return False
+  chain_key = f"option_chain:{ticker}:{expire_date.date()}"
+  def recheck():
+    db.expire_all() # another worker may have just stored the snapshot
+    stored = repository.get_option_chain_fetched_date(db, ticker, expire_date)
+    return stored if stored is not None and is_snapshot_fresh(stored) else None
+  flights.do(chain_key, lambda: store_chain_snapshot(db, ticker, expire_date), recheck=recheck, redis_client=redis_client)
+  db.expire_all()
+  return True
+
+def get_chain_greeks(db: Session, ticker: str, expire_date: date, redis_client: redis.Redis | None = None) -> schemas.Chain_Greeks | None:
+  """
+  Implied volatility, model price and Greeks of every contract of one expiry, evaluated in one vectorized call
+  (see tickers.greeks.evaluate_contracts) on the stored chain snapshot, refreshed first when stale.
+  Returns None when the ticker has no closing price.
+  """
+  spot = get_closed_price(db, ticker, redis_client)
+  if spot is None:
+    return None
+  expire_date = datetime.combine(expire_date, dt_time())
+  ensure_chain_snapshot(db, ticker, expire_date, redis_client)
+  contracts = repository.get_options_by_chain(db, [(ticker, expire_date)])
+  chain = schemas.Chain_Greeks(ticker=ticker, expire_date=expire_date.date(), spot=spot.closed_price)
+  if not contracts:
+    return chain
+  ids, _, _, types, strikes, bids, asks, ivs = zip(*contracts)
+  result = greeks.evaluate_contracts(
+    spot.closed_price, strikes, [expire_date] * len(contracts), [kind == "Call" for kind in types], bids, asks,
+    [iv if iv is not None else np.nan for iv in ivs], settings.RISK_FREE_RATE,
+  )
+  chain.years_to_expiry = round(float(result["years"][0]), 6)
+  values = {name: [None if np.isnan(value) else round(float(value), 6) for value in result[name]] for name in ("iv", "price", "delta", "gamma", "theta", "vega")}
+  chain.contracts = [
+    schemas.Option_Greeks(id=ids[i], type=types[i], strike_price=strikes[i], bid=bids[i], ask=asks[i], **{name: column[i] for name, column in values.items()})
+    for i in range(len(contracts))
+  ]
+  return chain
+
+def get_atm_iv(ticker: str, redis_client: redis.Redis | None = None, min_days: int = 7) -> float | None:
+  """
+  At-the-money implied volatility (%) of the nearest expiry at least `min_days` out: the call and put struck closest
+  to the stored close, solved from their bid/ask midpoints and averaged. Reads the cached expiry list and the stored
+  chain snapshot, which is only downloaded (once for concurrent requests) when older than OPTION_SNAPSHOT_TTL.
+  """
+  ticker = ticker.upper() # `/metrics/aapl` reads and refreshes the same snapshot as `/metrics/AAPL`
+  expiries = get_option_expirations(ticker, redis_client)
+  if not expiries:
+    return None
+  expiry = next((e for e in expiries if (date.fromisoformat(e) - date.today()).days >= min_days), expiries[-1])
+  expire_date = datetime.combine(date.fromisoformat(expiry), dt_time())
+  with SessionLocal() as db:
+    spot = get_closed_price(db, ticker, redis_client)
+    if spot is None:
+      return None
+    ensure_chain_snapshot(db, ticker, expire_date, redis_client)
+    contracts = repository.get_options_by_chain(db, [(ticker, expire_date)])
+  nearest = {} # type -> (distance to spot, contract) of the strike closest to the close
+  for contract in contracts:
+    distance = abs(contract.strike_price - spot.closed_price)
+    if contract.type not in nearest or distance < nearest[contract.type][0]:
+      nearest[contract.type] = (distance, contract)
+  sides = [contract for _, contract in nearest.values()]
+  if not sides:
+    return None
+  result = greeks.evaluate_contracts(
+    spot.closed_price, [row.strike_price for row in sides], [expire_date] * len(sides), [row.type == "Call" for row in sides],
+    [row.bid for row in sides], [row.ask for row in sides], [row.iv if row.iv is not None else np.nan for row in sides], settings.RISK_FREE_RATE,
+  )
+  iv = np.nanmean(result["iv"]) if not np.isnan(result["iv"]).all() else np.nan
+  return None if np.isnan(iv) else round(float(iv) * 100, 2)
+
+def snapshot_age(fetched_date: datetime) -> float:
+  if fetched_date.tzinfo is None: # SQLite drops the tz, values are stored in UTC
+    fetched_date = fetched_date.replace(tzinfo=ZoneInfo("UTC"))
+  return (datetime.now(ZoneInfo("UTC")) - fetched_date).total_seconds()
+
+def is_snapshot_fresh(fetched_date: datetime) -> bool:
+  return snapshot_age(fetched_date) < settings.OPTION_SNAPSHOT_TTL
+
+def option_details(option: models.Option) -> schemas.Option_Details:
+  details = schemas.Option_Details.model_validate(option)
+  details.snapshot_age = round(snapshot_age(option.fetched_date), 1)
+  return details
+
+def store_chain_snapshot(db: Session, ticker: str, expire_date: datetime) -> int:
+  """
+  Download the chain of one expiry and upsert every call and put into the options table in one statement.
+  Returns the number of contracts stored.
+  """
+  chain = get_provider().get_option_chain(ticker, str(expire_date.date()))
+  rows = chain_snapshot_rows(chain, ticker, expire_date, datetime.now(ZoneInfo("UTC")))
+  repository.upsert_options(db, rows)
+  return len(rows)
+
+def chain_snapshot_rows(chain, ticker: str, expire_date: datetime, fetched_date: datetime) -> list[dict]:
+  """ Rows for `repository.upsert_options` from a provider chain (calls and puts, yfinance column layout). """
+  contracts = pd.concat([chain.calls.assign(type="Call"), chain.puts.assign(type="Put")], ignore_index=True)
+  contracts = contracts.rename(columns={"contractSymbol": "id", "strike": "strike_price", "impliedVolatility": "iv", "inTheMoney": "itm"})
+  contracts["volume"] = contracts["volume"].fillna(0) # no trades yet today
+  contracts = contracts[["id", "type", "strike_price", "bid", "ask", "volume", "iv", "itm"]].astype(object)
+  contracts = contracts.where(pd.notna(contracts), None)
+  contracts["ticker"] = ticker
+  contracts["expire_date"] = expire_date
+  contracts["fetched_date"] = fetched_date
+  return contracts.to_dict(orient="records")
+
+def update_all_tickers(db: Session, batch_size: int = 100, redis_client: redis.Redis | None = None, after: str | None = None, on_page=None) -> schemas.RefreshReport:
+  """
+  Refresh the closing price of every ticker in the database.
+  Pages through the tickers table by keyset on the primary key, fetches the closes of a whole page with one
+  multi-symbol provider call and writes them back with a single bulk UPDATE.
+  Args:
+    db: SQLAlchemy database session.
+    batch_size: number of symbols per page (and per provider call).
+    redis_client: optional Redis client, used to invalidate cached closing prices in every worker.
+    after: resume after this symbol (checkpoint of an interrupted run).
+    on_page: optional callback(last_symbol, report) called after every committed page.
+  """
+  report = schemas.RefreshReport(job="tickers")
+  provider = get_provider()
+  started = time.perf_counter()
+  last_symbol = after
+
   while True:
-    tickers = db.query(models.Ticker).offset(offset).limit(batch_size).all()
-    if not tickers:
+    symbols = repository.get_ticker_symbols_after(db, last_symbol, batch_size)
+    if not symbols:
       break 
-    for ticker in tickers: 
-      try: 
-          data = yf.Ticker(ticker.ticker)
-          closed_price = data.history(period='1d')['Close'] 
-          if closed_price.shape[0] == 0:
-              pass # need to log
-          else:
-              ticker.closed_price = closed_price.iloc[-1]
-              ticker.fetched_date = datetime.today().date()
-      except Exception as e:
-          pass # logging 
-    db.commit()
-    offset += batch_size 
+    last_symbol = symbols[-1]
+    report.processed += len(symbols)
+    try: 
+      quotes = provider.get_quotes(symbols)
+    except Exception as e:
+      logger.warning("ticker refresh: page after %s failed: %s", symbols[0], e)
+      report.failed += len(symbols)
+      if on_page is not None:
+        on_page(last_symbol, report)
+      continue
+    fetched_date = datetime.now(ZoneInfo("UTC"))
+    rows = [{"ticker": symbol, "closed_price": price, "fetched_date": fetched_date} for symbol, price in quotes.items()]
+    repository.bulk_update_tickers(db, rows)
+    positions_service.revalue_summaries(db, list(quotes))
+    cache.invalidate([f"closed_price:{symbol}" for symbol in quotes], redis_client)
+    report.updated += len(rows)
+    report.failed += len(symbols) - len(rows) # no data returned, symbol may be delisted
+    if on_page is not None:
+      on_page(last_symbol, report)
+
+  report.duration = round(time.perf_counter() - started, 3)
+  report.throughput = round(report.processed / report.duration, 2) if report.duration > 0 else 0
+  logger.info("ticker refresh: %s symbols in %ss (%s symbols/sec), %s updated, %s failed", report.processed, report.duration, report.throughput, report.updated, report.failed)
+  return report
 
-  return None # 402 
+def refresh_chain_rows(chain, option_ids: set[str], fetched_date: datetime) -> list[dict]:
+  """
+  Build bulk-update rows for every stored contract found in a fetched chain, matched on contractSymbol.
+  Args:
+    chain: OptionChain (calls and puts) returned by the provider.
+    option_ids: contract symbols stored in the database for this chain.
+    fetched_date: timestamp written to every updated row.
+  """
+  contracts = pd.concat([chain.calls, chain.puts], ignore_index=True)
+  contracts = contracts[contracts["contractSymbol"].isin(option_ids)]
+  contracts = contracts.rename(columns={"contractSymbol": "id", "impliedVolatility": "iv", "inTheMoney": "itm"})
+  contracts = contracts[["id", "bid", "ask", "volume", "iv", "itm"]].astype(object)
+  contracts = contracts.where(pd.notna(contracts), None) # NaN volume on illiquid strikes -> NULL
+  contracts["fetched_date"] = fetched_date
+  return contracts.to_dict(orient="records")
+
+def update_all_options(db: Session, batch_size: int = 100, after: tuple | None = None, on_page=None) -> schemas.RefreshReport:
+  """
+  Refresh bid/ask/volume/iv/itm of every stored option contract.
+  Contracts are grouped by (ticker, expire_date) so each chain is downloaded once, chains of a page are fetched
+  on the shared fetch pool (bounded per provider), and every stored contract of the page is written back with
+  one bulk UPDATE.
+  Args:
+    db: SQLAlchemy database session (only used from the calling thread).
+    batch_size: number of (ticker, expire_date) chains per page.
+    after: resume after this (ticker, expire_date) chain (checkpoint of an interrupted run).
+    on_page: optional callback(last_key, report) called after every committed page.
+  """
+  report = schemas.RefreshReport(job="options")
+  provider = get_provider()
+  started = time.perf_counter()
+  last_key = after
 
-def update_all_options(db: Session, batch_size: int = 100):
-  offset = 0 
   while True: 
-    options = db.query(models.Option).offset(offset).limit(batch_size).all()
-    if not options:
+    chain_keys = repository.get_option_chain_keys_after(db, last_key, batch_size)
+    if not chain_keys:
       break 
-    for option in options:
+    last_key = chain_keys[-1]
+    option_ids = repository.get_option_ids_by_chain(db, chain_keys)
+    futures = {
+      executors.submit_fetch(provider.name, provider.get_option_chain, ticker, str(expire_date.date())): (ticker, expire_date)
+      for ticker, expire_date in chain_keys
+    }
+    fetched_date = datetime.now(ZoneInfo("UTC"))
+    rows = []
+    for future in as_completed(futures):
+      key = futures[future]
+      ids = option_ids.get(key, set())
+      report.processed += len(ids)
       try: 
-        data = yf.Ticker(option.ticker)
-        option_chain_data = data.option_chain(str(option.expire_date))
-        if option.type == "Call":
-            options_chain = option_chain_data.calls 
-        else:
-            options_chain = option_chain_data.puts 
-        option_data = options_chain[options_chain['contractSymbol'] == option.id]
-        option.bid = option_data['bid'].values[0]
-        option.ask = option_data['ask'].values[0]
-        option.volume = option_data['volume'].values[0]
-        option.iv = option_data['impliedVolatility'].values[0]
-        option.itm = option_data['inTheMoney'].values[0]
+        chain_rows = refresh_chain_rows(future.result(), ids, fetched_date)
       except Exception as e:
-        print("error: ", e)
-        pass # logging 
-    db.commit()
-    offset += batch_size 
-  return None # 402 
\ No newline at end of file
+        logger.warning("option refresh: chain %s %s failed: %s", key[0], key[1].date(), e)
+        report.failed += len(ids)
+        continue
+      rows.extend(chain_rows)
+      report.failed += len(ids) - len(chain_rows) # contract no longer listed (expired or delisted)
+    repository.bulk_update_options(db, rows)
+    report.updated += len(rows)
+    if on_page is not None:
+      on_page(last_key, report)
+
+  report.duration = round(time.perf_counter() - started, 3)
+  report.throughput = round(report.processed / report.duration, 2) if report.duration > 0 else 0
+  logger.info("option refresh: %s contracts in %ss (%s contracts/sec), %s updated, %s failed", report.processed, report.duration, report.throughput, report.updated, report.failed)
+  return report